@@ -3,13 +3,11 @@ from flask import Flask
 from extensions import db
 from flask_login import LoginManager
 from routes.admin import admin_blueprint
-import logging
+from utils.logger import configure_logging
+from utils.invalidation_bus import invalidation_bus
 
 # Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
-    level=logging.DEBUG
-)
+configure_logging()
 
 app = Flask(__name__)
 
@@ -30,6 +28,9 @@ login_manager.login_view = 'main.login'
 # Register blueprints
 app.register_blueprint(admin_blueprint)
 
+# Receive cache invalidations from the other web and bot processes
+invalidation_bus.start()
+
 # Initialize login manager
 @login_manager.user_loader
 def load_user(user_id):
@@ -38,7 +39,11 @@ def load_user(user_id):
 
 with app.app_context():
     # Import all models
-    from models import User, Role, Category, Product, Order, SupportTicket, TicketResponse
+    from models import User, Role, Category, Product, Order, SupportTicket, TicketResponse, DeliveryAsset, PlatformCounter, SalesDaily, RevokedToken
     # Create all tables
     db.create_all()
-    print("Database tables created successfully")
\ No newline at end of file
+    print("Database tables created successfully")
+
+    # A new database starts with counted platform totals
+    from utils.platform_counters import seed_counters
+    seed_counters()
\ No newline at end of file
@@ -0,0 +1,15 @@
+import argparse
+from app import app
+from services.sales_rollup import backfill
+
+def backfill_sales(days: int = None):
+    with app.app_context():
+        rows = backfill(days)
+    scope = f"the last {days} days" if days is not None else "all orders"
+    print(f"Rebuilt {rows} daily sales rows from {scope}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the daily sales rollup from the orders table")
+    parser.add_argument('--days', type=int, help="only rebuild this many recent days")
+    args = parser.parse_args()
+    backfill_sales(args.days)
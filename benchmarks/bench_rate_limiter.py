@@ -0,0 +1,62 @@
+"""Benchmark RateLimiter.check across a large user population.
+
+Usage: python benchmarks/bench_rate_limiter.py [--users 1000000] [--checks 3]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.rate_limiter import RateLimiter  # noqa: E402
+
+
+def run(users: int, checks: int) -> None:
+    # Exceeded-limit warnings would dominate the timing
+    logging.getLogger('utils.rate_limiter').setLevel(logging.ERROR)
+    rate_limiter = RateLimiter()
+    user_ids = range(1, users + 1)
+
+    start = time.perf_counter()
+    for user_id in user_ids:
+        rate_limiter.check(user_id, 'message')
+    elapsed = time.perf_counter() - start
+    print(f"first check for {users:,} users: {elapsed:.2f}s "
+          f"({users / elapsed:,.0f} checks/s, {elapsed / users * 1e6:.2f} us/check)")
+
+    # Measured on a separate limiter, tracemalloc slows allocation down a lot
+    tracemalloc.start()
+    measured = RateLimiter()
+    for user_id in user_ids:
+        measured.check(user_id, 'message')
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del measured
+    print(f"limiter state: {memory / 2**20:.1f} MiB ({memory / users:.0f} bytes/user)")
+
+    start = time.perf_counter()
+    for _ in range(checks):
+        for user_id in user_ids:
+            rate_limiter.check(user_id, 'message')
+    elapsed = time.perf_counter() - start
+    total = users * checks
+    print(f"{checks} more checks per user: {elapsed:.2f}s "
+          f"({total / elapsed:,.0f} checks/s, {elapsed / total * 1e6:.2f} us/check)")
+
+    # A single hot user hitting the limit over and over
+    start = time.perf_counter()
+    for _ in range(100_000):
+        rate_limiter.check(1, 'message')
+    elapsed = time.perf_counter() - start
+    print(f"100,000 checks for one limited user: {elapsed / 100_000 * 1e6:.2f} us/check")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--checks', type=int, default=3)
+    args = parser.parse_args()
+    run(args.users, args.checks)
@@ -9,10 +9,14 @@ from services.product_service import ProductService
 from services.user_service import UserService
 from services.order_service import OrderService
 from services.admin_service import AdminService
-from utils.rate_limiter import RateLimiter
-from utils.validators import validate_input
+from services.delivery_service import DeliveryService
+from services.delivery_queue import DeliveryQueue
+from services.notification_queue import NotificationQueue
+from services.support_service import SupportService
+from utils.rate_limiter import get_rate_limiter
+from utils.validators import SUPPORT_MESSAGE, validate_input
 from utils.security import check_user_access
-from utils.logger import BotLogger
+from utils.logger import BotLogger, sampled
 from utils.error_handler import handle_errors, db_session_decorator
 from app import app, db
 from datetime import datetime, timedelta
@@ -45,9 +49,13 @@ class TelegramBot:
                 logger.info("Initializing services...")
                 self.product_service = ProductService()
                 self.user_service = UserService()
-                self.order_service = OrderService()
-                self.admin_service = AdminService()
-                self.rate_limiter = RateLimiter()
+                self.delivery_service = DeliveryService()
+                self.delivery_queue = DeliveryQueue(self.delivery_service)
+                self.order_service = OrderService(delivery_queue=self.delivery_queue)
+                self.notification_queue = NotificationQueue()
+                self.support_service = SupportService(self.notification_queue)
+                self.admin_service = AdminService(support_service=self.support_service)
+                self.rate_limiter = get_rate_limiter('bot')
                 self.user_states = {}
 
                 # Validate required configuration
@@ -108,11 +116,11 @@ class TelegramBot:
                 BotLogger.log_request(update, context)
 
                 # Check rate limit with detailed feedback
-                if not self.rate_limiter.check_limit(user.id):
-                    remaining, wait_time = self.rate_limiter.get_remaining_attempts(user.id)
+                limit = self.rate_limiter.check(user.id)
+                if not limit.allowed:
                     await self.handle_error(
                         update,
-                        f"⚠️ Слишком много запросов. Осталось попыток: {remaining}"
+                        f"⚠️ Слишком много запросов. Осталось попыток: {limit.remaining}"
                     )
                     return
 
@@ -305,7 +313,7 @@ class TelegramBot:
                     f"🏷 *{product.name}*\n\n"
                     f"📝 *Описание:*\n{product.description}\n\n"
                     f"💵 *Цена:* ${product.price:.2f}\n"
-                    f"📦 *Категория:* {product.category.name}\n"
+                    f"📦 *Категория:* {product.category_name}\n"
                 )
 
                 user_state.update('product', product_id=product_id)
@@ -330,10 +338,10 @@ class TelegramBot:
 
             try:
                 # Rate limit check with detailed feedback
-                if not self.rate_limiter.check_limit(user.id):
-                    remaining, wait_time = self.rate_limiter.get_remaining_attempts(user.id)
+                limit = self.rate_limiter.check(user.id)
+                if not limit.allowed:
                     await query.answer(
-                        f"⚠️ Слишком много запросов. Подождите {wait_time} секунд.",
+                        f"⚠️ Слишком много запросов. Подождите {limit.retry_after} секунд.",
                         show_alert=True
                     )
                     return
@@ -401,6 +409,14 @@ class TelegramBot:
                 elif data == 'support':
                     user_state.update('support')
                     await self.show_support(update, context)
+                elif data == 'create_ticket':
+                    user_state.update('support_ticket')
+                    await query.edit_message_text(
+                        "📝 Опишите вашу проблему одним сообщением:",
+                        reply_markup=InlineKeyboardMarkup([[
+                            InlineKeyboardButton("🔙 Назад", callback_data='support')
+                        ]])
+                    )
                 elif data == 'admin' and await self.admin_service.is_admin(user.id):
                     user_state.update('admin')
                     await self.show_admin_panel(update, context)
@@ -420,9 +436,12 @@ class TelegramBot:
                     return
 
                 # Log navigation for analytics
-                logger.info(
-                    f"User {user.id} navigated from {prev_state} to {user_state.state}"
-                )
+                if logger.isEnabledFor(logging.INFO) and sampled('navigation'):
+                    logger.info(
+                        "User %s navigated from %s to %s", user.id, prev_state, user_state.state,
+                        extra={'event': 'navigation',
+                               'fields': {'user_id': user.id, 'from': prev_state, 'to': user_state.state}}
+                    )
 
             except Exception as e:
                 logger.error(f"Error handling callback: {str(e)}")
@@ -462,11 +481,11 @@ class TelegramBot:
                 user_state = self.get_user_state(user.id)
 
                 # Check rate limit first, before any other processing
-                if not self.rate_limiter.check_limit(user.id):
-                    remaining, wait_time = self.rate_limiter.get_remaining_attempts(user.id)
+                limit = self.rate_limiter.check(user.id)
+                if not limit.allowed:
                     keyboard = [[InlineKeyboardButton("🔄 Главное меню", callback_data='start')]]
                     await update.message.reply_text(
-                        f"⚠️ Слишком много сообщений. Пожалуйста, подождите {wait_time} секунд.",
+                        f"⚠️ Слишком много сообщений. Пожалуйста, подождите {limit.retry_after} секунд.",
                         reply_markup=InlineKeyboardMarkup(keyboard)
                     )
                     return
@@ -491,24 +510,30 @@ class TelegramBot:
 
     async def handle_support_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_state: UserState):
         """Handle support ticket messages"""
-        message = update.message.text
-
-        if len(message) < 10:
-            await update.message.reply_text(
-                "❌ Сообщение слишком короткое. Пожалуйста, опишите вашу проблему подробнее."
-            )
+        cleaned, errors = SUPPORT_MESSAGE.validate(
+            {'text': getattr(context, 'clean_text', None) or update.message.text}
+        )
+        if errors:
+            if errors[0].code == 'min_length':
+                text = "❌ Сообщение слишком короткое. Пожалуйста, опишите вашу проблему подробнее."
+            else:
+                text = f"❌ {errors[0].message}"
+            await update.message.reply_text(text)
             return
+        message = cleaned['text']
 
         try:
-            # Assuming support_service is defined elsewhere
-            ticket = await self.support_service.create_ticket(
+            ticket_id = await self.support_service.create_ticket(
                 user_id=update.effective_user.id,
                 message=message
             )
+            if not ticket_id:
+                await self.handle_error(update, "Не удалось создать обращение")
+                return
 
             user_state.update('main_menu')
             await update.message.reply_text(
-                "✅ Ваше обращение принято! Мы ответим вам в ближайшее время.",
+                f"✅ Ваше обращение #{ticket_id} принято! Мы ответим вам в ближайшее время.",
                 reply_markup=self.get_main_menu_keyboard(update.effective_user.id)
             )
 
@@ -565,12 +590,15 @@ class TelegramBot:
                     await query.answer("Профиль не найден.")
                     return
 
+                last_order = profile['last_order_at'].strftime('%d.%m.%Y') if profile['last_order_at'] else '—'
                 text = f"""
 👤 Профиль
 
 Username: @{profile['username']}
 Дата регистрации: {profile['created_at'].strftime('%d.%m.%Y')}
 Количество заказов: {profile['orders_count']}
+Потрачено: ${profile['total_spent']:.2f}
+Последний заказ: {last_order}
                 """
 
                 keyboard = [[InlineKeyboardButton("🔙 Главное меню", callback_data='start')]]
@@ -660,12 +688,29 @@ Username: @{profile['username']}
             logger.error(f"Error showing help: {str(e)}")
             await self.handle_error(update, "Не удалось загрузить справку")
 
+    async def on_startup(self, telegram_app: Application):
+        """Start background workers once the event loop is running"""
+        await self.delivery_queue.start(telegram_app.bot)
+        await self.notification_queue.start(telegram_app.bot)
+        await self.support_service.start()
+
+    async def on_shutdown(self, telegram_app: Application):
+        await self.support_service.stop()
+        await self.notification_queue.stop()
+        await self.delivery_queue.stop()
+
     def run(self):
         """Run the bot with enhanced error handling"""
         try:
             # Create and configure the application
             logger.info(f"Creating application with token: {Config.BOT_TOKEN[:5]}...")
-            telegram_app = Application.builder().token(Config.BOT_TOKEN).build()
+            telegram_app = (
+                Application.builder()
+                .token(Config.BOT_TOKEN)
+                .post_init(self.on_startup)
+                .post_shutdown(self.on_shutdown)
+                .build()
+            )
             logger.info("Application created successfully")
 
             # Add handlers
@@ -0,0 +1,14 @@
+from app import app
+from config import Config
+from utils.catalog_cache import catalog_cache
+
+def compile_catalog():
+    if not Config.CATALOG_SNAPSHOT_PATH:
+        print("CATALOG_SNAPSHOT_PATH is not set")
+        return
+    with app.app_context():
+        snapshot = catalog_cache.compile()
+    print(f"Catalog snapshot {snapshot.version} written to {Config.CATALOG_SNAPSHOT_PATH}")
+
+if __name__ == "__main__":
+    compile_catalog()
@@ -1,4 +1,5 @@
 import os
+import json
 from datetime import timedelta
 import logging
 
@@ -19,18 +20,75 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-key-change-in-prod')
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'jwt-secret-change-in-prod')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
+    # Key rotation: every key in JWT_SECRET_KEYS ('{"kid": "secret", ...}') is
+    # accepted, new tokens are signed with JWT_ACTIVE_KEY_ID
+    JWT_SECRET_KEYS = json.loads(os.getenv('JWT_SECRET_KEYS', '{}')) or {'default': JWT_SECRET_KEY}
+    JWT_ACTIVE_KEY_ID = os.getenv('JWT_ACTIVE_KEY_ID', next(iter(JWT_SECRET_KEYS)))
+    JWT_CACHE_SIZE = int(os.getenv('JWT_CACHE_SIZE', 10000))  # verified tokens kept
+    JWT_REVOCATION_MAX_KEYS = 100000
+    JWT_REVOCATION_RELOAD_INTERVAL = int(os.getenv('JWT_REVOCATION_RELOAD_INTERVAL', 60))  # seconds between reads of the revoked_token table
 
     # Rate limiting
     RATE_LIMIT_MESSAGES = 30  # messages per minute
     RATE_LIMIT_COMMANDS = 10  # commands per minute
+    # Per-action policies: algorithm is 'exact' (request log), 'sliding_window'
+    # (two-counter approximation, O(1) memory) or 'token_bucket'
+    RATE_LIMIT_POLICIES = {
+        'message': {'algorithm': 'sliding_window', 'limit': RATE_LIMIT_MESSAGES, 'window': 60},
+        'command': {'algorithm': 'sliding_window', 'limit': RATE_LIMIT_COMMANDS, 'window': 60},
+        'auth': {'algorithm': 'token_bucket', 'limit': 5, 'window': 300, 'backoff_factor': 4},
+        'payment': {'algorithm': 'exact', 'limit': 3, 'window': 600, 'backoff_factor': 5},
+        # Web admin, per logged-in user and per client IP
+        'admin_user': {'algorithm': 'token_bucket', 'limit': 120, 'window': 60, 'backoff_base': 1},
+        'admin_ip': {'algorithm': 'token_bucket', 'limit': 300, 'window': 60, 'backoff_base': 1},
+    }
+    # Requests an admin endpoint counts as; everything else costs 1
+    ADMIN_RATE_LIMIT_COSTS = {
+        'admin.dashboard': 5,
+        'admin.analytics': 10,
+        'admin.export_products': 20,
+        'admin.export_analytics': 20,
+        'admin.import_products': 20,
+    }
+    RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 1000000))  # users tracked per limit type
+    FRAUD_TRACKER_MAX_KEYS = int(os.getenv('FRAUD_TRACKER_MAX_KEYS', 100000))
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')  # 'memory' or 'sqlite' (shared by all processes)
+    RATE_LIMIT_SQLITE_PATH = os.getenv('RATE_LIMIT_SQLITE_PATH', 'rate_limits.sqlite3')
 
     # Admin settings
+    PERMISSION_CACHE_TTL = int(os.getenv('PERMISSION_CACHE_TTL', 300))  # full permission reload interval, seconds
+    PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', 300))  # seconds a bot profile is served from memory
+    PROFILE_CACHE_MAX_KEYS = int(os.getenv('PROFILE_CACHE_MAX_KEYS', 100000))
+    CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', 300))  # catalog reload interval, seconds
+    # Binary catalog file shared by all workers on the host; unset keeps the catalog per process
+    CATALOG_SNAPSHOT_PATH = os.getenv('CATALOG_SNAPSHOT_PATH')
+    CATALOG_SNAPSHOT_CHECK_INTERVAL = float(os.getenv('CATALOG_SNAPSHOT_CHECK_INTERVAL', 1.0))  # seconds between file checks
+    # Cache invalidation between processes: 'auto', 'postgres', 'sqlite' or 'none'
+    INVALIDATION_BUS = os.getenv('INVALIDATION_BUS', 'auto')
+    INVALIDATION_SQLITE_PATH = os.getenv('INVALIDATION_SQLITE_PATH', 'cache_invalidation.sqlite3')
+    INVALIDATION_POLL_INTERVAL = float(os.getenv('INVALIDATION_POLL_INTERVAL', 0.5))  # seconds, SQLite bus only
+    IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 1000))  # rows validated and committed together
+    IMPORT_MAX_ERRORS = 100  # row errors kept in an import report
+    STATISTICS_CACHE_TTL = int(os.getenv('STATISTICS_CACHE_TTL', 30))  # seconds the admin statistics are reused
+    LEADERBOARD_TTL = int(os.getenv('LEADERBOARD_TTL', 300))  # full sales leaderboard reload interval, seconds
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))  # rows fetched per round trip when exporting
     ADMIN_USERNAMES = os.getenv('ADMIN_USERNAMES', '').split(',')
 
     # Payment
     STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
     STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
 
+    # Delivery
+    DELIVERY_CONCURRENCY = int(os.getenv('DELIVERY_CONCURRENCY', 4))  # parallel sends to Telegram
+    DELIVERY_MAX_ATTEMPTS = int(os.getenv('DELIVERY_MAX_ATTEMPTS', 5))
+    DELIVERY_RETRY_BASE_DELAY = 2  # seconds, doubled on every failed attempt
+    DELIVERY_RETRY_MAX_DELAY = 300
+
+    # Support
+    SUPPORT_WRITE_BATCH_SIZE = 10  # tickets committed per transaction
+    SUPPORT_WRITE_FLUSH_INTERVAL = 0.5  # seconds a ticket may wait for its batch
+    NOTIFY_RATE_PER_SECOND = 20  # stays under Telegram's ~30 messages/second limit
+
     # App config
     APP_NAME = "Digital Products Bot"
     VERSION = "1.0.0"
@@ -59,4 +117,10 @@ class Config:
         logger.info("All required environment variables are present")
 
     # Logging
-    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
\ No newline at end of file
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # records buffered for the log writer thread
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # bot.log format: 'json' or 'text'
+    # Share of events logged, e.g. LOG_SAMPLE_RATES='{"request": 0.5}'
+    LOG_SAMPLE_RATES = {'request': 0.1, 'navigation': 0.1, **json.loads(os.getenv('LOG_SAMPLE_RATES', '{}'))}
+    LOG_REPEAT_LIMIT = 5  # identical warnings let through per interval
+    LOG_REPEAT_INTERVAL = 60  # seconds
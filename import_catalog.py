@@ -0,0 +1,35 @@
+import argparse
+import asyncio
+import os
+from app import app
+from services.import_service import IMPORT_FORMATS, ImportService
+
+def import_catalog(path: str, kind: str, create_categories: bool):
+    fmt = os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in IMPORT_FORMATS:
+        raise SystemExit(f"Unsupported file type: {path} (expected .csv or .jsonl)")
+
+    def progress(report):
+        print(f"{report.rows} rows read, {report.imported} imported, {report.failed} failed", flush=True)
+
+    service = ImportService()
+    with app.app_context(), open(path, encoding='utf-8-sig', newline='') as stream:
+        if kind == 'categories':
+            report = asyncio.run(service.import_categories(stream, fmt, progress=progress))
+        else:
+            report = asyncio.run(service.import_products(stream, fmt, create_categories, progress=progress))
+
+    for error in report.errors:
+        print(f"line {error.line}: {error.message}")
+    summary = report.to_dict()
+    print(f"Imported {summary['imported']} {kind}, skipped {summary['skipped']}, failed {summary['failed']} "
+          f"({summary['rows_per_minute']} rows/minute)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import products or categories from CSV or JSON lines")
+    parser.add_argument('path')
+    parser.add_argument('--kind', choices=('products', 'categories'), default='products')
+    parser.add_argument('--create-categories', action='store_true',
+                        help="create categories that products refer to but that don't exist yet")
+    args = parser.parse_args()
+    import_catalog(args.path, args.kind, args.create_categories)
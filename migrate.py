@@ -0,0 +1,90 @@
+from sqlalchemy import inspect, literal, text
+from app import app, db
+import models  # noqa: F401 - registers every table on db.metadata
+from services.sales_rollup import backfill
+from utils.platform_counters import reconcile
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Fills columns added to existing tables, run once after they are created
+DATA_MIGRATIONS = {
+    ('product', 'updated_at'): 'UPDATE product SET updated_at = created_at WHERE updated_at IS NULL',
+    # Older orders didn't keep what they were charged, the current price is the best guess
+    ('order', 'amount'): (
+        'UPDATE "order" SET amount = (SELECT price FROM product WHERE product.id = "order".product_id) '
+        'WHERE amount IS NULL'
+    ),
+}
+
+def _column_ddl(column, dialect) -> str:
+    ddl = f"{dialect.identifier_preparer.quote(column.name)} {column.type.compile(dialect)}"
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if default is not None:
+        value = literal(default, column.type).compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+        ddl += f" DEFAULT {value}"
+    if not column.nullable and default is not None:
+        ddl += " NOT NULL"
+    return ddl
+
+def upgrade_schema():
+    """Bring an existing database up to models.py.
+
+    create_all() only creates missing tables, so this also adds missing
+    columns and indexes to existing ones. Every step checks first and can be
+    rerun. On Postgres, indexes are built CONCURRENTLY so that live tables
+    stay writable.
+    """
+    with app.app_context():
+        engine = db.engine
+        dialect = engine.dialect
+        inspector = inspect(engine)
+        existing_tables = set(inspector.get_table_names())
+        db.create_all()
+        added_columns = set()
+
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue  # just created with all its columns and indexes
+
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                if not column.nullable and (column.default is None or not column.default.is_scalar):
+                    logger.error(f"Cannot add NOT NULL column {table.name}.{column.name} without a default")
+                    continue
+                with engine.begin() as conn:
+                    conn.execute(text(
+                        f"ALTER TABLE {dialect.identifier_preparer.quote(table.name)} ADD COLUMN {_column_ddl(column, dialect)}"
+                    ))
+                    migration = DATA_MIGRATIONS.get((table.name, column.name))
+                    if migration:
+                        conn.execute(text(migration))
+                added_columns.add((table.name, column.name))
+                print(f"Added column {table.name}.{column.name}")
+
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in indexes:
+                    continue
+                if dialect.name == 'postgresql':
+                    index.dialect_options['postgresql']['concurrently'] = True
+                # CREATE INDEX CONCURRENTLY can't run inside a transaction
+                with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                    index.create(conn)
+                print(f"Created index {index.name}")
+
+        # Seeds a new platform_counter table, or repairs an existing one
+        drift = reconcile()
+        if drift:
+            print(f"Repaired platform counters: {', '.join(sorted(drift))}")
+
+        # A new rollup, or one that predates storing revenue
+        if 'sales_daily' not in existing_tables or ('sales_daily', 'revenue') in added_columns:
+            print(f"Filled {backfill()} daily sales rows")
+
+        print("Schema is up to date")
+
+if __name__ == "__main__":
+    upgrade_schema()
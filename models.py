@@ -4,7 +4,8 @@ from flask_security import UserMixin, RoleMixin
 
 roles_users = db.Table('roles_users',
     db.Column('user_id', db.Integer(), db.ForeignKey('user.id')),
-    db.Column('role_id', db.Integer(), db.ForeignKey('role.id'))
+    db.Column('role_id', db.Integer(), db.ForeignKey('role.id')),
+    db.Index('ix_roles_users_user_id', 'user_id')
 )
 
 class Role(db.Model, RoleMixin):
@@ -23,6 +24,10 @@ class User(db.Model, UserMixin):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     orders = db.relationship('Order', backref='user', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_user_created_at', created_at),
+    )
+
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -38,16 +43,47 @@ class Product(db.Model):
     digital_content = db.Column(db.Text, nullable=False)  # URL or content identifier
     active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_product_category_active', category_id, active),
+        db.Index('ix_product_updated_at', updated_at),
+    )
+
+def _current_price(context):
+    """Order.amount when the creator didn't set it: the product's price at insert time"""
+    return context.connection.scalar(
+        db.select(Product.price).where(Product.id == context.get_current_parameters()['product_id'])
+    )
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     status = db.Column(db.String(20), nullable=False, default='pending')
+    amount = db.Column(db.Float, default=_current_price)  # price charged, fixed when the order is created
     payment_id = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    delivery_status = db.Column(db.String(20))  # queued, delivered or failed once the order is completed
+    delivery_attempts = db.Column(db.Integer, nullable=False, default=0)
+    delivery_error = db.Column(db.Text)
+    delivered_at = db.Column(db.DateTime)
     product = db.relationship('Product')
 
+    __table_args__ = (
+        db.Index('ix_order_user_created', user_id, created_at),
+        db.Index('ix_order_status_created', status, created_at),
+        db.Index('ix_order_created_at', created_at),
+        db.Index('ix_order_product_status', product_id, status),
+        db.Index('ix_order_payment_id', payment_id),
+        # Only the few completed orders still waiting for delivery
+        db.Index(
+            'ix_order_delivery_queued', id,
+            postgresql_where=db.and_(status == 'completed', delivery_status == 'queued'),
+            sqlite_where=db.and_(status == 'completed', delivery_status == 'queued')
+        ),
+    )
+
 class SupportTicket(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -55,11 +91,60 @@ class SupportTicket(db.Model):
     message = db.Column(db.Text, nullable=False)
     status = db.Column(db.String(20), default='open')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_response_at = db.Column(db.DateTime)
     responses = db.relationship('TicketResponse', backref='ticket', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_support_ticket_status_created', status, created_at),
+        db.Index('ix_support_ticket_user_created', user_id, created_at),
+        db.Index('ix_support_ticket_created_at', created_at),
+    )
+
 class TicketResponse(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     ticket_id = db.Column(db.Integer, db.ForeignKey('support_ticket.id'), nullable=False)
     admin_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     message = db.Column(db.Text, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    delivered_at = db.Column(db.DateTime)  # when the reply was pushed to the user's chat
+
+    __table_args__ = (
+        db.Index('ix_ticket_response_ticket_id', ticket_id),
+        db.Index('ix_ticket_response_created_at', created_at),
+        # Replies not yet pushed to the user, scanned by SupportService.push_replies
+        db.Index(
+            'ix_ticket_response_undelivered', created_at,
+            postgresql_where=delivered_at.is_(None),
+            sqlite_where=delivered_at.is_(None)
+        ),
+    )
+
+class RevokedToken(db.Model):
+    """JWT ids rejected until the token would have expired anyway"""
+    jti = db.Column(db.String(64), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_revoked_token_expires_at', expires_at),
+    )
+
+class SalesDaily(db.Model):
+    """Completed orders per product and order day, see services/sales_rollup.py"""
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    sales = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)  # sum of Order.amount
+
+class DeliveryAsset(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.Text, nullable=False, unique=True)  # Product.digital_content the file came from
+    file_id = db.Column(db.String(255), nullable=False)  # Telegram file_id, reusable for any chat
+    file_unique_id = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class PlatformCounter(db.Model):
+    """Running platform totals kept by utils/platform_counters.py"""
+    name = db.Column(db.String(50), primary_key=True)  # e.g. 'users', 'orders.completed', 'revenue'
+    value = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,14 @@
+from app import app
+from utils.platform_counters import reconcile
+
+# Recounts the admin statistics counters and repairs any drift; meant to run
+# periodically, e.g. nightly from cron
+def reconcile_counters():
+    with app.app_context():
+        drift = reconcile()
+    for name, (stored, actual) in sorted(drift.items()):
+        print(f"{name}: {stored:g} -> {actual:g}")
+    print(f"{len(drift)} platform counters repaired")
+
+if __name__ == "__main__":
+    reconcile_counters()
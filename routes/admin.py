@@ -1,15 +1,53 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file
+from flask import (
+    Blueprint, Response, render_template, redirect, url_for, flash, request, jsonify, send_file, stream_with_context
+)
 from flask_login import login_required, current_user
 from functools import wraps
 from services.admin_service import AdminService
-from datetime import datetime, timedelta
+from services.import_service import IMPORT_FORMATS, ImportService
+from utils.rate_limiter import get_rate_limiter
+from utils.validators import (
+    CATEGORY_FORM, ORDER_FILTERS, PRODUCT_FORM, PRODUCT_IDS_FORM, TICKET_RESPONSE_FORM, format_errors
+)
+from config import Config
+from datetime import datetime
 import logging
-from io import StringIO
+from io import StringIO, TextIOWrapper
 import csv
+import os
 
 logger = logging.getLogger(__name__)
 admin_blueprint = Blueprint('admin', __name__, url_prefix='/admin')
 admin_service = AdminService()
+import_service = ImportService()
+rate_limiter = get_rate_limiter('admin')
+
+@admin_blueprint.before_request
+def limit_admin_requests():
+    """Throttle the admin per client IP and per logged-in user.
+
+    Expensive endpoints weigh more (Config.ADMIN_RATE_LIMIT_COSTS); refused
+    requests get 429 with a Retry-After header.
+    """
+    cost = Config.ADMIN_RATE_LIMIT_COSTS.get(request.endpoint, 1)
+    checks = [(request.remote_addr, 'admin_ip')]
+    if current_user.is_authenticated:
+        checks.append((current_user.id, 'admin_user'))
+
+    # Consult every budget before charging any, so that a request refused
+    # for the user doesn't use up the IP's budget and vice versa
+    for record in (False, True):
+        for key, limit_type in checks:
+            limit = rate_limiter.check(key, limit_type, cost=cost, record=record)
+            if not limit.allowed:
+                logger.warning(f"Admin rate limit exceeded on {request.endpoint} for {limit_type} {key}")
+                response = jsonify({
+                    'error': 'Слишком много запросов, попробуйте позже',
+                    'retry_after': limit.retry_after
+                })
+                response.status_code = 429
+                response.headers['Retry-After'] = str(limit.retry_after)
+                return response
 
 def admin_required(f):
     @wraps(f)
@@ -29,20 +67,10 @@ async def dashboard():
         stats = await admin_service.get_statistics()
         
         # Получаем данные по продажам за последние 30 дней
-        now = datetime.utcnow()
-        sales_data = await admin_service.get_all_orders({
-            'date_range': [now - timedelta(days=30), now],
-            'status': 'completed'
-        })
-        
-        # Форматируем данные для графика
-        sales_by_date = {}
-        for order in sales_data:
-            date = order.created_at.strftime('%Y-%m-%d')
-            sales_by_date[date] = sales_by_date.get(date, 0) + 1
+        sales_trends = await admin_service.get_sales_trends(30)
         
         # Получаем популярные товары
-        top_products = await admin_service.get_top_products(limit=5)
+        top_products = await admin_service.get_leaderboard(limit=5)
         
         # Получаем статистику тикетов
         support_stats = {
@@ -57,8 +85,8 @@ async def dashboard():
         return render_template('admin/dashboard.html',
             stats=stats,
             sales_data={
-                'labels': list(sales_by_date.keys()),
-                'values': list(sales_by_date.values())
+                'labels': sales_trends['dates'],
+                'values': sales_trends['sales']
             },
             top_products=top_products,
             support_data=[
@@ -96,11 +124,10 @@ async def users():
 @admin_required
 async def orders():
     try:
-        filters = {}
-        if request.args.get('status'):
-            filters['status'] = request.args.get('status')
-        if request.args.get('user_id'):
-            filters['user_id'] = int(request.args.get('user_id'))
+        args, errors = ORDER_FILTERS.validate(request.args)
+        if errors:
+            flash(f'Неверные фильтры: {format_errors(errors)}', 'danger')
+        filters = {key: value for key, value in args.items() if value is not None}
         
         orders = await admin_service.get_all_orders(filters)
         return render_template('admin/orders.html', orders=orders)
@@ -134,15 +161,15 @@ async def tickets():
 @admin_required
 async def respond_ticket(ticket_id):
     try:
-        message = request.form.get('message')
-        if not message:
-            flash('Сообщение не может быть пустым', 'danger')
+        form, errors = TICKET_RESPONSE_FORM.validate(request.form)
+        if errors:
+            flash(f'Сообщение не отправлено: {format_errors(errors)}', 'danger')
             return redirect(url_for('admin.tickets'))
         
         success = await admin_service.respond_to_ticket(
             ticket_id=ticket_id,
             admin_id=current_user.id,
-            message=message
+            message=form['message']
         )
         
         if success:
@@ -173,12 +200,10 @@ async def products():
 @admin_required
 async def update_product(product_id):
     try:
-        data = {
-            'name': request.form.get('name'),
-            'price': float(request.form.get('price')),
-            'description': request.form.get('description'),
-            'active': request.form.get('active') == 'true'
-        }
+        data, errors = PRODUCT_FORM.validate(request.form)
+        if errors:
+            flash(f'Проверьте данные товара: {format_errors(errors)}', 'danger')
+            return redirect(url_for('admin.products'))
         
         success = await admin_service.update_product(product_id, data)
         
@@ -227,10 +252,10 @@ async def get_category(category_id):
 @admin_required
 async def update_category(category_id):
     try:
-        data = {
-            'name': request.form.get('name'),
-            'description': request.form.get('description')
-        }
+        data, errors = CATEGORY_FORM.validate(request.form)
+        if errors:
+            flash(f'Проверьте данные категории: {format_errors(errors)}', 'danger')
+            return redirect(url_for('admin.categories'))
         
         success = await admin_service.update_category(category_id, data)
         
@@ -250,10 +275,10 @@ async def update_category(category_id):
 @admin_required
 async def create_category():
     try:
-        data = {
-            'name': request.form.get('name'),
-            'description': request.form.get('description')
-        }
+        data, errors = CATEGORY_FORM.validate(request.form)
+        if errors:
+            flash(f'Проверьте данные категории: {format_errors(errors)}', 'danger')
+            return redirect(url_for('admin.categories'))
         
         category = await admin_service.create_category(data)
         
@@ -268,42 +293,94 @@ async def create_category():
         flash('Произошла ошибка при создании категории', 'danger')
         return redirect(url_for('admin.categories'))
 
+class _CsvLine:
+    """File-like target for csv.writer that collects output until popped"""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, value: str) -> None:
+        self.parts.append(value)
+        self.size += len(value)
+
+    def pop(self) -> str:
+        text = ''.join(self.parts)
+        self.parts.clear()
+        self.size = 0
+        return text
+
 @admin_blueprint.route('/products/export')
 @login_required
 @admin_required
 async def export_products():
-    try:
-        products = await admin_service.get_all_products()
-
-        output = StringIO()
-        writer = csv.writer(output)
+    """CSV of all products, streamed as it is read from the database"""
+    rows = admin_service.iter_product_export()
 
-        # Write headers
+    def generate():
+        line = _CsvLine()
+        writer = csv.writer(line)
+        # The BOM lets Excel detect UTF-8; the import accepts it too
         writer.writerow(['ID', 'Название', 'Категория', 'Цена', 'Статус', 'Продажи', 'Дата создания', 'Последнее обновление'])
+        yield '\ufeff' + line.pop()
+
+        try:
+            for product_id, name, category, price, active, sales, created_at, updated_at in rows:
+                writer.writerow([
+                    product_id,
+                    name,
+                    category,
+                    price,
+                    'Активен' if active else 'Неактивен',
+                    sales,
+                    created_at.strftime('%Y-%m-%d %H:%M') if created_at else '',
+                    updated_at.strftime('%Y-%m-%d %H:%M') if updated_at else ''
+                ])
+                # Hand rows to the server in chunks, not one write per row
+                if line.size >= 64 * 1024:
+                    yield line.pop()
+            yield line.pop()
+        except Exception as e:
+            # Headers are already sent; all we can do is cut the file short
+            logger.error(f"Error exporting products: {str(e)}")
+            raise
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={
+            'Content-Disposition': f'attachment; filename=products_export_{datetime.utcnow().strftime("%Y%m%d_%H%M")}.csv'
+        }
+    )
 
-        # Write product data
-        for product in products:
-            writer.writerow([
-                product.id,
-                product.name,
-                product.category.name,
-                product.price,
-                'Активен' if product.active else 'Неактивен',
-                len(product.orders),
-                product.created_at.strftime('%Y-%m-%d %H:%M'),
-                product.updated_at.strftime('%Y-%m-%d %H:%M')
-            ])
-
-        output.seek(0)
-        return send_file(
-            output,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'products_export_{datetime.utcnow().strftime("%Y%m%d_%H%M")}.csv'
-        )
+@admin_blueprint.route('/products/import', methods=['POST'])
+@login_required
+@admin_required
+async def import_products():
+    try:
+        upload = request.files.get('file')
+        fmt = os.path.splitext(upload.filename)[1].lstrip('.').lower() if upload and upload.filename else ''
+        if fmt not in IMPORT_FORMATS:
+            flash('Загрузите файл CSV или JSONL', 'danger')
+            return redirect(url_for('admin.products'))
+
+        # utf-8-sig drops the BOM Excel puts in front of CSV exports
+        stream = TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        if request.form.get('kind') == 'categories':
+            report = await import_service.import_categories(stream, fmt)
+        else:
+            report = await import_service.import_products(
+                stream, fmt, create_categories=request.form.get('create_categories') == 'on'
+            )
+
+        flash(f'Импортировано: {report.imported}, пропущено: {report.skipped}, с ошибками: {report.failed}',
+              'success' if not report.failed else 'warning')
+        for error in report.errors[:5]:
+            flash(f'Строка {error.line}: {error.message}', 'danger')
+        return redirect(url_for('admin.products'))
     except Exception as e:
-        logger.error(f"Error exporting products: {str(e)}")
-        flash('Произошла ошибка при экспорте товаров', 'danger')
+        logger.error(f"Error importing products: {str(e)}")
+        flash('Произошла ошибка при импорте товаров', 'danger')
         return redirect(url_for('admin.products'))
 
 @admin_blueprint.route('/products/batch-update', methods=['POST'])
@@ -311,15 +388,15 @@ async def export_products():
 @admin_required
 async def batch_update_products():
     try:
-        product_ids = request.form.getlist('ids[]')
-        active = request.form.get('active') == 'true'
-
-        if not product_ids:
-            return jsonify({'error': 'No products selected'}), 400
+        form, errors = PRODUCT_IDS_FORM.validate(request.form)
+        if errors:
+            return jsonify({'error': 'Invalid input', 'errors': [error._asdict() for error in errors]}), 400
+        product_ids = form['ids[]']
+        active = form['active']
 
         # Security check: verify all products exist and admin has access
         for product_id in product_ids:
-            product = await admin_service.get_product(int(product_id))
+            product = await admin_service.get_product(product_id)
             if not product:
                 return jsonify({'error': f'Product {product_id} not found'}), 404
 
@@ -340,14 +417,14 @@ async def batch_update_products():
 @admin_required
 async def batch_delete_products():
     try:
-        product_ids = request.form.getlist('ids[]')
-
-        if not product_ids:
-            return jsonify({'error': 'No products selected'}), 400
+        form, errors = PRODUCT_IDS_FORM.validate(request.form)
+        if errors:
+            return jsonify({'error': 'Invalid input', 'errors': [error._asdict() for error in errors]}), 400
+        product_ids = form['ids[]']
 
         # Security check: verify all products exist and admin has access
         for product_id in product_ids:
-            product = await admin_service.get_product(int(product_id))
+            product = await admin_service.get_product(product_id)
             if not product:
                 return jsonify({'error': f'Product {product_id} not found'}), 404
 
@@ -1,19 +1,72 @@
-from typing import List, Dict, Any, Optional
+import threading
+from time import monotonic
+from typing import List, Dict, Any, Callable, Iterator, Optional, Tuple
 from sqlalchemy.exc import SQLAlchemyError
 from models import User, Product, Order, SupportTicket, TicketResponse, Category # Added Category import
 from app import db
 from config import Config
 import logging
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, true
+from services.sales_rollup import daily_sales
+from utils.permission_cache import permission_cache
+from utils.sales_leaderboard import LEADERBOARD_ORDERS, sales_leaderboard
+from utils.platform_counters import (
+    ACTIVE_PRODUCTS, ACTIVE_USERS, OPEN_TICKETS, ORDERS, REVENUE, USERS, order_counter, read_counters
+)
 
 logger = logging.getLogger(__name__)
 
+class StatisticsSnapshot:
+    """Last result of a statistics query, reused for Config.STATISTICS_CACHE_TTL seconds.
+
+    Refreshes are single-flight: callers that find the snapshot stale queue
+    on a lock, the first one runs the query and the rest get its result.
+    """
+
+    def __init__(self, ttl: float = None, clock: Callable[[], float] = monotonic):
+        self._ttl = ttl or Config.STATISTICS_CACHE_TTL
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entry: Optional[Tuple[Any, float]] = None  # (value, expires at)
+        self.refreshes = 0
+
+    def get(self, load: Callable[[], Any]) -> Any:
+        entry = self._entry
+        if entry is not None and self._clock() < entry[1]:
+            return entry[0]
+        with self._lock:
+            # Someone may have refreshed it while we waited
+            entry = self._entry
+            if entry is not None and self._clock() < entry[1]:
+                return entry[0]
+            value = load()
+            self._entry = (value, self._clock() + self._ttl)
+            self.refreshes += 1
+            return value
+
+    def invalidate(self) -> None:
+        self._entry = None
+
+# Shared by the bot's admin panel and the web dashboard and analytics pages
+statistics_snapshot = StatisticsSnapshot()
+
+def _seconds_between(later, earlier):
+    """SQL expression for the seconds between two timestamps"""
+    if db.engine.dialect.name == 'postgresql':
+        return func.extract('epoch', later - earlier)
+    return (func.julianday(later) - func.julianday(earlier)) * 86400
+
 class AdminService:
+    def __init__(self, support_service=None):
+        # Optional SupportService used to push replies to users right away;
+        # otherwise the bot's SupportService picks them up on its next sweep
+        self.support_service = support_service
+
     async def is_admin(self, telegram_id: int) -> bool:
         try:
-            user = User.query.filter_by(telegram_id=telegram_id).first()
-            return user and user.username in Config.ADMIN_USERNAMES
+            permissions = permission_cache.get(telegram_id)
+            return bool(permissions) and permissions.username in Config.ADMIN_USERNAMES
         except SQLAlchemyError as e:
             logger.error(f"Database error when checking admin status: {str(e)}")
             raise
@@ -100,6 +153,9 @@ class AdminService:
             db.session.commit()
 
             logger.info(f"Admin {admin_id} responded to ticket {ticket_id}")
+
+            if self.support_service:
+                self.support_service.push_replies()
             return True
         except SQLAlchemyError as e:
             db.session.rollback()
@@ -107,58 +163,90 @@ class AdminService:
             raise
 
     async def get_statistics(self) -> Dict[str, Any]:
-        """Get enhanced platform statistics with detailed metrics"""
-        try:
-            now = datetime.utcnow()
-            day_ago = now - timedelta(days=1)
-            week_ago = now - timedelta(days=7)
-            month_ago = now - timedelta(days=30)
+        """Get enhanced platform statistics with detailed metrics.
 
-            # Basic statistics
+        Totals come from the platform counters and are always current; the
+        windowed metrics are served from statistics_snapshot.
+        """
+        try:
+            # Basic statistics, kept up to date on every write
+            counters = read_counters()
             basic_stats = {
-                'total_users': User.query.count(),
-                'active_users': User.query.filter_by(active=True).count(),
-                'total_orders': Order.query.count(),
-                'completed_orders': Order.query.filter_by(status='completed').count(),
-                'pending_tickets': SupportTicket.query.filter_by(status='open').count(),
-                'active_products': Product.query.filter_by(active=True).count()
-            }
-
-            # Revenue statistics
-            revenue_stats = db.session.query(
-                func.sum(Product.price).label('total_revenue')
-            ).join(Order).filter(Order.status == 'completed').first()
-
-            # Time-based metrics
-            time_stats = {
-                'new_users_24h': User.query.filter(User.created_at >= day_ago).count(),
-                'new_users_7d': User.query.filter(User.created_at >= week_ago).count(),
-                'new_users_30d': User.query.filter(User.created_at >= month_ago).count(),
-                'orders_24h': Order.query.filter(Order.created_at >= day_ago).count(),
-                'orders_7d': Order.query.filter(Order.created_at >= week_ago).count(),
-                'orders_30d': Order.query.filter(Order.created_at >= month_ago).count(),
-            }
-
-            # Support metrics
-            support_stats = {
-                'open_tickets': SupportTicket.query.filter_by(status='open').count(),
-                'average_response_time': self._calculate_average_response_time(),
-                'tickets_24h': SupportTicket.query.filter(
-                    SupportTicket.created_at >= day_ago
-                ).count(),
+                'total_users': int(counters[USERS]),
+                'active_users': int(counters[ACTIVE_USERS]),
+                'total_orders': int(counters[ORDERS]),
+                'completed_orders': int(counters[order_counter('completed')]),
+                'pending_tickets': int(counters[OPEN_TICKETS]),
+                'active_products': int(counters[ACTIVE_PRODUCTS])
             }
+            window_stats = statistics_snapshot.get(self._window_statistics)
 
             # Combine all statistics
             return {
                 **basic_stats,
-                'total_revenue': float(revenue_stats[0] or 0),
-                'time_stats': time_stats,
-                'support_stats': support_stats
+                'total_revenue': round(counters[REVENUE], 2),
+                'time_stats': dict(window_stats['time_stats']),
+                'support_stats': {
+                    'open_tickets': basic_stats['pending_tickets'],
+                    **window_stats['support_stats']
+                }
             }
         except SQLAlchemyError as e:
             logger.error(f"Database error when fetching statistics: {str(e)}")
             raise
 
+    @staticmethod
+    def _window_statistics() -> Dict[str, Dict[str, Any]]:
+        """Time-based and support metrics in one query.
+
+        Each table is aggregated once with COUNT(*) FILTER (WHERE ...), the
+        three one-row results are joined into one row.
+        """
+        now = datetime.utcnow()
+        day_ago = now - timedelta(days=1)
+        week_ago = now - timedelta(days=7)
+        month_ago = now - timedelta(days=30)
+
+        users = db.session.query(
+            func.count().filter(User.created_at >= day_ago).label('new_users_24h'),
+            func.count().filter(User.created_at >= week_ago).label('new_users_7d'),
+            func.count().label('new_users_30d'),
+        ).filter(User.created_at >= month_ago).subquery()
+        orders = db.session.query(
+            func.count().filter(Order.created_at >= day_ago).label('orders_24h'),
+            func.count().filter(Order.created_at >= week_ago).label('orders_7d'),
+            func.count().label('orders_30d'),
+        ).filter(Order.created_at >= month_ago).subquery()
+        answered = SupportTicket.status == 'answered'
+        tickets = db.session.query(
+            func.count().filter(SupportTicket.created_at >= day_ago).label('tickets_24h'),
+            func.count().filter(answered).label('answered'),
+            func.sum(_seconds_between(SupportTicket.last_response_at, SupportTicket.created_at))
+            .filter(answered).label('response_seconds'),
+        ).subquery()
+
+        row = db.session.query(users, orders, tickets).select_from(users).join(
+            orders, true()
+        ).join(tickets, true()).one()
+
+        return {
+            'time_stats': {
+                'new_users_24h': row.new_users_24h,
+                'new_users_7d': row.new_users_7d,
+                'new_users_30d': row.new_users_30d,
+                'orders_24h': row.orders_24h,
+                'orders_7d': row.orders_7d,
+                'orders_30d': row.orders_30d,
+            },
+            'support_stats': {
+                # Hours, over every answered ticket
+                'average_response_time': (
+                    float(row.response_seconds or 0) / row.answered / 3600 if row.answered else 0.0
+                ),
+                'tickets_24h': row.tickets_24h,
+            },
+        }
+
     async def update_product(self, product_id: int, data: Dict[str, Any]) -> bool:
         """Update product with enhanced validation and logging"""
         try:
@@ -184,26 +272,6 @@ class AdminService:
             logger.error(f"Database error when updating product: {str(e)}")
             raise
 
-    def _calculate_average_response_time(self) -> float:
-        """Calculate average response time for support tickets"""
-        try:
-            tickets = SupportTicket.query.filter(
-                SupportTicket.status == 'answered'
-            ).all()
-
-            if not tickets:
-                return 0.0
-
-            total_response_time = sum(
-                (ticket.last_response_at - ticket.created_at).total_seconds()
-                for ticket in tickets
-                if ticket.last_response_at
-            )
-            return total_response_time / len(tickets) / 3600  # Convert to hours
-        except Exception as e:
-            logger.error(f"Error calculating average response time: {str(e)}")
-            return 0.0
-
     async def get_all_categories(self) -> List[Category]:
         """Get all categories with product counts"""
         try:
@@ -376,69 +444,80 @@ class AdminService:
             logger.error(f"Unexpected error in batch delete products: {str(e)}")
             return False
 
-    async def get_top_products(self, limit: int = 5) -> List[Dict[str, Any]]:
-        """Get top-selling products with revenue stats"""
+    def iter_product_export(self, batch_size: int = None) -> Iterator[Tuple]:
+        """Rows of the product export, read in one query through a server-side cursor.
+
+        Yields (id, name, category, price, active, sales, created_at,
+        updated_at) in id order, `batch_size` rows fetched at a time, so memory
+        doesn't grow with the catalog. Sales are completed orders, counted in
+        a subquery grouped by product rather than per row.
+        """
+        sales = db.session.query(
+            Order.product_id, func.count(Order.id).label('sales')
+        ).filter(Order.status == 'completed').group_by(Order.product_id).subquery()
+
+        query = db.session.query(
+            Product.id, Product.name, Category.name, Product.price, Product.active,
+            func.coalesce(sales.c.sales, 0), Product.created_at, Product.updated_at
+        ).join(Category, Category.id == Product.category_id).outerjoin(
+            sales, sales.c.product_id == Product.id
+        ).order_by(Product.id)
+
         try:
-            products = Product.query.join(Order).filter(
-                Order.status == 'completed'
-            ).group_by(Product.id).all()
+            yield from query.yield_per(batch_size or Config.EXPORT_BATCH_SIZE)
+        except SQLAlchemyError as e:
+            logger.error(f"Database error when exporting products: {str(e)}")
+            raise
 
-            # Calculate sales and revenue
-            product_stats = []
-            for product in products:
-                completed_orders = [order for order in product.orders if order.status == 'completed']
-                revenue = sum(order.product.price for order in completed_orders)
-                product_stats.append({
-                    'id': product.id,
-                    'name': product.name,
-                    'sales': len(completed_orders),
-                    'revenue': revenue
-                })
+    async def get_top_products(self, limit: int = 5, by: str = 'revenue') -> List[Dict[str, Any]]:
+        """Get top-selling products with revenue stats, ranked by 'revenue' or 'sales'.
+
+        Aggregated, ranked and cut to `limit` in one query; revenue is the
+        sum of what the completed orders were charged.
+        """
+        if by not in LEADERBOARD_ORDERS:
+            raise ValueError(f"Unknown top products order: {by}")
+        try:
+            sales = func.count(Order.id)
+            revenue = func.coalesce(func.sum(Order.amount), 0)
+            rows = db.session.query(
+                Product.id, Product.name, sales, revenue
+            ).join(Order, Order.product_id == Product.id).filter(
+                Order.status == 'completed'
+            ).group_by(Product.id, Product.name).order_by(
+                (sales if by == 'sales' else revenue).desc(), Product.id
+            ).limit(limit).all()
 
-            # Sort by revenue and get top products
-            product_stats.sort(key=lambda x: x['revenue'], reverse=True)
-            return product_stats[:limit]
+            return [
+                {'id': product_id, 'name': name, 'sales': product_sales, 'revenue': float(product_revenue)}
+                for product_id, name, product_sales, product_revenue in rows
+            ]
 
         except SQLAlchemyError as e:
             logger.error(f"Database error when fetching top products: {str(e)}")
             raise
 
+    async def get_leaderboard(self, limit: int = 5, by: str = 'revenue') -> List[Dict[str, Any]]:
+        """Same as get_top_products, served from the in-memory sales leaderboard"""
+        try:
+            return sales_leaderboard.top(limit, by)
+        except SQLAlchemyError as e:
+            logger.error(f"Database error when loading the sales leaderboard: {str(e)}")
+            raise
+
     async def get_sales_trends(self, days: int = 30) -> Dict[str, List]:
-        """Get daily sales trends for specified period"""
+        """Get daily sales trends for specified period, read from the daily sales rollup"""
         try:
-            end_date = datetime.utcnow()
+            end_date = datetime.utcnow().date()
             start_date = end_date - timedelta(days=days)
-
-            # Get orders within date range
-            orders = Order.query.filter(
-                Order.created_at >= start_date,
-                Order.created_at <= end_date,
-                Order.status == 'completed'
-            ).order_by(Order.created_at).all()
-
-            # Group by date
-            daily_sales = {}
-            daily_revenue = {}
-            for order in orders:
-                date = order.created_at.strftime('%Y-%m-%d')
-                daily_sales[date] = daily_sales.get(date, 0) + 1
-                daily_revenue[date] = daily_revenue.get(date, 0) + order.product.price
+            daily = daily_sales(start_date, end_date)
 
             # Fill in missing dates with zeros
-            date_range = []
-            current_date = start_date
-            while current_date <= end_date:
-                date_str = current_date.strftime('%Y-%m-%d')
-                date_range.append(date_str)
-                if date_str not in daily_sales:
-                    daily_sales[date_str] = 0
-                    daily_revenue[date_str] = 0
-                current_date += timedelta(days=1)
-
+            date_range = [start_date + timedelta(days=i) for i in range(days + 1)]
             return {
-                'dates': date_range,
-                'sales': [daily_sales[date] for date in date_range],
-                'revenue': [daily_revenue[date] for date in date_range]
+                'dates': [date.strftime('%Y-%m-%d') for date in date_range],
+                'sales': [daily.get(date, (0, 0))[0] for date in date_range],
+                'revenue': [daily.get(date, (0, 0))[1] for date in date_range]
             }
 
         except SQLAlchemyError as e:
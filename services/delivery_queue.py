@@ -0,0 +1,182 @@
+import asyncio
+import random
+from datetime import datetime
+from typing import List, Optional, Set
+import httpx
+from sqlalchemy.exc import SQLAlchemyError
+from telegram import Bot
+from telegram.error import Forbidden, RetryAfter, TelegramError
+from models import Order
+from app import db, app
+from config import Config
+from services.delivery_service import DeliveryService
+import logging
+
+logger = logging.getLogger(__name__)
+
+class DeliveryQueue:
+    """Asynchronous delivery of completed orders.
+
+    Completed orders are marked delivery_status='queued' in the same commit that
+    completes them, so the queue survives restarts and picks up orders completed
+    by other processes (e.g. the web worker handling Stripe webhooks) through a
+    periodic sweep. enqueue() never blocks the caller.
+    """
+
+    def __init__(self, delivery_service: DeliveryService,
+                 concurrency: int = None, max_attempts: int = None,
+                 sweep_interval: float = 30.0):
+        self.delivery_service = delivery_service
+        self._concurrency = concurrency or Config.DELIVERY_CONCURRENCY
+        self._max_attempts = max_attempts or Config.DELIVERY_MAX_ATTEMPTS
+        self._sweep_interval = sweep_interval
+        self._bot: Optional[Bot] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._scheduled: Set[int] = set()  # order ids queued, waiting for retry or in flight
+
+    @property
+    def running(self) -> bool:
+        return self._bot is not None
+
+    async def start(self, bot: Bot) -> None:
+        """Start workers and the sweeper on the running event loop"""
+        if self.running:
+            return
+        self._bot = bot
+        self._queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self._concurrency)
+        ]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+        logger.info(f"Delivery queue started with {self._concurrency} workers")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._scheduled.clear()
+        self._bot = None
+        logger.info("Delivery queue stopped")
+
+    def enqueue(self, order_id: int, delay: float = 0) -> bool:
+        """Schedule delivery of an order. Returns False if the queue isn't running;
+        the order stays 'queued' in the database and will be swept up later."""
+        if not self.running or order_id in self._scheduled:
+            return False
+        self._scheduled.add(order_id)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, order_id)
+        else:
+            self._queue.put_nowait(order_id)
+        return True
+
+    def _retry_delay(self, attempts: int) -> float:
+        delay = min(
+            Config.DELIVERY_RETRY_BASE_DELAY * (2 ** (attempts - 1)),
+            Config.DELIVERY_RETRY_MAX_DELAY
+        )
+        # Jitter keeps a burst of failures from retrying in lockstep
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _worker(self, number: int) -> None:
+        while True:
+            order_id = await self._queue.get()
+            try:
+                await self._deliver(order_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._scheduled.discard(order_id)
+                logger.error(f"Delivery worker {number} failed on order {order_id}: {str(e)}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, order_id: int) -> None:
+        with app.app_context():
+            order = Order.query.get(order_id)
+            if not order or order.status != 'completed' or order.delivery_status != 'queued':
+                self._scheduled.discard(order_id)
+                return
+
+            retry_delay = None
+            try:
+                await self.delivery_service.deliver(
+                    self._bot,
+                    order.user.telegram_id,
+                    order.product,
+                    caption=f"✅ Оплата заказа #{order.id} получена!\n📦 {order.product.name}"
+                )
+                order.delivery_status = 'delivered'
+                order.delivered_at = datetime.utcnow()
+                order.delivery_error = None
+                logger.info(f"Delivered order {order.id} to user {order.user_id}")
+            except Forbidden as e:
+                # The user blocked the bot, retrying won't help
+                order.delivery_status = 'failed'
+                order.delivery_error = str(e)
+                logger.warning(f"Delivery of order {order.id} forbidden: {str(e)}")
+            except Exception as e:
+                # Network errors are expected; anything else is a bug or bad
+                # data, but it gets the same backoff and the same limit so the
+                # order can't come back on every sweep
+                if not isinstance(e, (TelegramError, httpx.HTTPError, OSError)):
+                    logger.error(f"Unexpected error delivering order {order.id}: {str(e)}", exc_info=True)
+                retry_delay = self._count_failed_attempt(order, e)
+
+            try:
+                db.session.commit()
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                logger.error(f"Database error when saving delivery state: {str(e)}")
+                # Count the attempt on its own, or leave the order to the sweeper
+                retry_delay = self._count_failed_attempt(order, e)
+                try:
+                    db.session.commit()
+                except SQLAlchemyError as e:
+                    db.session.rollback()
+                    logger.error(f"Database error when saving delivery state: {str(e)}")
+                    retry_delay = None
+
+            self._scheduled.discard(order_id)
+            if retry_delay is not None:
+                self.enqueue(order_id, delay=retry_delay)
+
+    def _count_failed_attempt(self, order: Order, error: Exception) -> Optional[float]:
+        """Record a failed attempt on the order. Returns the delay before the
+        next one, or None once the order is marked failed."""
+        order.delivery_attempts = (order.delivery_attempts or 0) + 1
+        order.delivery_error = str(error)
+        if order.delivery_attempts >= self._max_attempts:
+            order.delivery_status = 'failed'
+            logger.error(f"Giving up on order {order.id} after {order.delivery_attempts} attempts: {str(error)}")
+            return None
+
+        retry_delay = (
+            error.retry_after if isinstance(error, RetryAfter)
+            else self._retry_delay(order.delivery_attempts)
+        )
+        logger.warning(
+            f"Delivery of order {order.id} failed (attempt {order.delivery_attempts}), "
+            f"retrying in {retry_delay:.1f}s: {str(error)}"
+        )
+        return retry_delay
+
+    async def _sweeper(self) -> None:
+        """Pick up queued orders this process hasn't scheduled yet"""
+        while True:
+            try:
+                with app.app_context():
+                    order_ids = [
+                        row.id for row in Order.query.with_entities(Order.id).filter_by(
+                            status='completed', delivery_status='queued'
+                        ).limit(500)
+                    ]
+                for order_id in order_ids:
+                    self.enqueue(order_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error sweeping queued deliveries: {str(e)}")
+            await asyncio.sleep(self._sweep_interval)
@@ -0,0 +1,145 @@
+import asyncio
+import os
+from typing import Dict, Optional
+from urllib.parse import urlparse
+from weakref import WeakValueDictionary
+import httpx
+from sqlalchemy.exc import SQLAlchemyError
+from telegram import Bot, Message, Document
+from telegram.error import BadRequest, TelegramError
+from models import DeliveryAsset, Product
+from app import db, app
+import logging
+
+logger = logging.getLogger(__name__)
+
+class DeliveryService:
+    """Delivers Product.digital_content to a chat.
+
+    Every file is uploaded to Telegram once; the returned file_id is kept in
+    memory and in DeliveryAsset so later orders are sent by file_id only.
+    """
+
+    def __init__(self, upload_timeout: float = 300.0):
+        self._upload_timeout = upload_timeout
+        self._file_ids: Dict[str, str] = {}
+        # An entry lives only while some delivery holds or waits on its lock
+        self._upload_locks: 'WeakValueDictionary[str, asyncio.Lock]' = WeakValueDictionary()
+
+    @staticmethod
+    def classify_content(content: str) -> str:
+        """Return 'url', 'file' or 'text' for a digital_content value"""
+        if content.startswith(('http://', 'https://')):
+            return 'url'
+        if content.startswith('file://') or os.path.isfile(content):
+            return 'file'
+        return 'text'
+
+    async def deliver(self, bot: Bot, chat_id: int, product: Product, caption: str = None) -> Message:
+        """Send the product's digital content to the chat"""
+        content = product.digital_content
+        caption = caption or f"📦 {product.name}"
+
+        if self.classify_content(content) == 'text':
+            return await bot.send_message(
+                chat_id=chat_id,
+                text=f"{caption}\n\n{content}"
+            )
+
+        file_id = await self.get_file_id(content)
+        if file_id:
+            try:
+                return await bot.send_document(chat_id=chat_id, document=file_id, caption=caption)
+            except BadRequest as e:
+                # file_id is no longer accepted by Telegram, upload again
+                logger.warning(f"Cached file_id rejected for {content}: {str(e)}")
+                await self.forget(content)
+
+        lock = self._upload_locks.setdefault(content, asyncio.Lock())
+        async with lock:
+            # Another order may have uploaded the same asset while we waited
+            file_id = self._file_ids.get(content)
+            if file_id:
+                return await bot.send_document(chat_id=chat_id, document=file_id, caption=caption)
+
+            message = await self._upload(bot, chat_id, content, caption)
+            if message.document:
+                await self._remember(content, message.document)
+            return message
+
+    async def get_file_id(self, source: str) -> Optional[str]:
+        """Look up a cached file_id, falling back to DeliveryAsset"""
+        file_id = self._file_ids.get(source)
+        if file_id:
+            return file_id
+
+        try:
+            with app.app_context():
+                asset = DeliveryAsset.query.filter_by(source=source).first()
+                if asset:
+                    self._file_ids[source] = asset.file_id
+                    return asset.file_id
+                return None
+        except SQLAlchemyError as e:
+            logger.error(f"Database error when fetching delivery asset: {str(e)}")
+            return None
+
+    async def forget(self, source: str) -> None:
+        """Drop a stale file_id so the next delivery uploads again"""
+        self._file_ids.pop(source, None)
+        try:
+            with app.app_context():
+                DeliveryAsset.query.filter_by(source=source).delete()
+                db.session.commit()
+        except SQLAlchemyError as e:
+            with app.app_context():
+                db.session.rollback()
+            logger.error(f"Database error when removing delivery asset: {str(e)}")
+
+    async def _remember(self, source: str, document: Document) -> None:
+        self._file_ids[source] = document.file_id
+        try:
+            with app.app_context():
+                asset = DeliveryAsset.query.filter_by(source=source).first()
+                if not asset:
+                    asset = DeliveryAsset(source=source)
+                    db.session.add(asset)
+                asset.file_id = document.file_id
+                asset.file_unique_id = document.file_unique_id
+                db.session.commit()
+                logger.info(f"Stored file_id for {source}")
+        except SQLAlchemyError as e:
+            with app.app_context():
+                db.session.rollback()
+            # The in-memory entry still saves re-uploads for this process
+            logger.error(f"Database error when storing delivery asset: {str(e)}")
+
+    async def _upload(self, bot: Bot, chat_id: int, source: str, caption: str) -> Message:
+        if self.classify_content(source) == 'url':
+            # Telegram fetches the URL itself, nothing passes through us
+            logger.info(f"Uploading {source} by URL")
+            return await bot.send_document(chat_id=chat_id, document=source, caption=caption)
+
+        path = urlparse(source).path if source.startswith('file://') else source
+        return await self._stream_upload(bot, chat_id, path, caption)
+
+    async def _stream_upload(self, bot: Bot, chat_id: int, path: str, caption: str) -> Message:
+        """Upload a local file as a chunked multipart stream.
+
+        telegram.InputFile reads the whole file into memory, so large files go
+        straight to the Bot API through httpx, which reads the handle in chunks.
+        """
+        logger.info(f"Streaming upload of {path} ({os.path.getsize(path)} bytes)")
+        timeout = httpx.Timeout(30.0, write=self._upload_timeout, read=self._upload_timeout)
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            with open(path, 'rb') as file_obj:
+                response = await client.post(
+                    f"{bot.base_url}/sendDocument",
+                    data={'chat_id': str(chat_id), 'caption': caption},
+                    files={'document': (os.path.basename(path), file_obj)}
+                )
+
+        payload = response.json()
+        if not payload.get('ok'):
+            raise TelegramError(payload.get('description', f"Upload failed with HTTP {response.status_code}"))
+        return Message.de_json(payload['result'], bot)
@@ -0,0 +1,202 @@
+import csv
+import json
+import time
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from models import Product, Category
+from app import db
+from config import Config
+from utils.catalog_cache import catalog_cache
+from utils.platform_counters import ACTIVE_PRODUCTS, adjust_counters
+from utils.validators import CATEGORY_FORM, PRODUCT_IMPORT_ROW, Schema, format_errors
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+
+class RowError(NamedTuple):
+    line: int
+    message: str
+
+
+class ImportReport:
+    """Running totals of an import, passed to the progress callback after each chunk"""
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.skipped = 0  # duplicates of existing rows
+        self.failed = 0
+        self.errors: List[RowError] = []  # the first Config.IMPORT_MAX_ERRORS only
+        self._started = time.monotonic()
+
+    def add_error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < Config.IMPORT_MAX_ERRORS:
+            self.errors.append(RowError(line, message))
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'errors': [error._asdict() for error in self.errors],
+            'rows_per_minute': int(self.rows / self.elapsed * 60) if self.elapsed else 0,
+        }
+
+
+def read_rows(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+    """(line number, row) pairs from a CSV file with a header row or from JSON
+    lines; an unreadable line yields None as its row"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def _chunks(rows: Iterable, size: int) -> Iterator[list]:
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ImportService:
+    """Bulk import of categories and products from CSV or JSON lines.
+
+    Rows are read as a stream and handled Config.IMPORT_CHUNK_SIZE at a time:
+    validated against a schema, then written with one multi-row INSERT and
+    committed, so memory and transaction size stay bounded whatever the file
+    size. Invalid rows are reported by line and skipped; the rest still go in.
+    Like AdminService, it runs inside the caller's app context.
+    """
+
+    def __init__(self, chunk_size: int = None):
+        self.chunk_size = chunk_size or Config.IMPORT_CHUNK_SIZE
+
+    @staticmethod
+    def _validate(schema: Schema, report: ImportReport, line: int, row: Optional[dict]) -> Optional[dict]:
+        report.rows += 1
+        if row is None:
+            report.add_error(line, "Некорректная строка")
+            return None
+        data, errors = schema.validate(row)
+        if errors:
+            report.add_error(line, format_errors(errors))
+            return None
+        return data
+
+    def _commit_chunk(self, model, values: List[dict], report: ImportReport,
+                      progress: Callable[[ImportReport], None] = None) -> None:
+        if values:
+            db.session.execute(insert(model), values)
+        db.session.commit()
+        report.imported += len(values)
+        if progress:
+            progress(report)
+
+    async def import_categories(self, stream: TextIO, fmt: str,
+                                progress: Callable[[ImportReport], None] = None) -> ImportReport:
+        """Create categories whose name doesn't exist yet; existing ones are skipped"""
+        report = ImportReport()
+        try:
+            existing = set(db.session.scalars(select(Category.name)))
+            for chunk in _chunks(read_rows(stream, fmt), self.chunk_size):
+                values = []
+                for line, row in chunk:
+                    data = self._validate(CATEGORY_FORM, report, line, row)
+                    if data is None:
+                        continue
+                    if data['name'] in existing:
+                        report.skipped += 1
+                        continue
+                    existing.add(data['name'])
+                    values.append({'name': data['name'], 'description': data.get('description') or ''})
+                self._commit_chunk(Category, values, report, progress)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Database error when importing categories: {str(e)}")
+            raise
+        finally:
+            # Bulk inserts bypass the session hooks that normally do this
+            if report.imported:
+                catalog_cache.invalidate()
+
+        logger.info(f"Imported {report.imported} of {report.rows} categories in {report.elapsed:.1f}s, {report.failed} failed")
+        return report
+
+    async def import_products(self, stream: TextIO, fmt: str, create_categories: bool = False,
+                              progress: Callable[[ImportReport], None] = None) -> ImportReport:
+        """Create products, resolving the `category` column by name.
+
+        Unknown categories fail their rows, or are created first with
+        create_categories=True.
+        """
+        report = ImportReport()
+        try:
+            category_ids: Dict[str, int] = dict(db.session.execute(select(Category.name, Category.id)).all())
+            for chunk in _chunks(read_rows(stream, fmt), self.chunk_size):
+                rows = []
+                for line, row in chunk:
+                    data = self._validate(PRODUCT_IMPORT_ROW, report, line, row)
+                    if data is not None:
+                        rows.append((line, data))
+
+                missing = {data['category'] for _, data in rows if data['category'] not in category_ids}
+                if missing and create_categories:
+                    db.session.execute(insert(Category), [{'name': name, 'description': ''} for name in missing])
+                    category_ids.update(db.session.execute(
+                        select(Category.name, Category.id).where(Category.name.in_(missing))
+                    ).all())
+
+                values = []
+                for line, data in rows:
+                    category_id = category_ids.get(data['category'])
+                    if category_id is None:
+                        report.add_error(line, f"category: Категория не найдена: {data['category']}")
+                        continue
+                    values.append({
+                        'name': data['name'],
+                        'description': data.get('description'),
+                        'price': data['price'],
+                        'category_id': category_id,
+                        'digital_content': data['digital_content'],
+                        'active': data['active'],
+                    })
+                # The counters' session hook doesn't see bulk inserts
+                adjust_counters(db.session.connection(), {
+                    ACTIVE_PRODUCTS: sum(1 for value in values if value['active'])
+                })
+                self._commit_chunk(Product, values, report, progress)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logger.error(f"Database error when importing products: {str(e)}")
+            raise
+        finally:
+            if report.imported:
+                catalog_cache.invalidate()
+
+        logger.info(f"Imported {report.imported} of {report.rows} products in {report.elapsed:.1f}s, {report.failed} failed")
+        return report
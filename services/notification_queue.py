@@ -0,0 +1,90 @@
+import asyncio
+import time
+from typing import List, Optional
+from telegram import Bot
+from telegram.error import Forbidden, RetryAfter, TelegramError
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+class NotificationQueue:
+    """Throttled outbound message queue.
+
+    Messages are sent by a single worker no faster than
+    Config.NOTIFY_RATE_PER_SECOND so fan-outs stay under Telegram's
+    broadcast limits; send() only enqueues and never waits on the API.
+    """
+
+    def __init__(self, rate_per_second: float = None, max_size: int = 10000):
+        self._interval = 1.0 / (rate_per_second or Config.NOTIFY_RATE_PER_SECOND)
+        self._max_size = max_size
+        self._bot: Optional[Bot] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return self._bot is not None
+
+    async def start(self, bot: Bot) -> None:
+        if self.running:
+            return
+        self._bot = bot
+        self._queue = asyncio.Queue(maxsize=self._max_size)
+        self._tasks = [asyncio.create_task(self._worker())]
+        logger.info("Notification queue started")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._bot = None
+        logger.info("Notification queue stopped")
+
+    def send(self, chat_id: int, text: str) -> bool:
+        """Queue a message; returns False if it could not be queued"""
+        if not self.running:
+            logger.warning(f"Notification queue is not running, message to {chat_id} dropped")
+            return False
+        try:
+            self._queue.put_nowait((chat_id, text))
+            return True
+        except asyncio.QueueFull:
+            logger.error(f"Notification queue full, message to {chat_id} dropped")
+            return False
+
+    def send_many(self, chat_ids: List[int], text: str) -> int:
+        """Fan a message out to several chats, returns how many were queued"""
+        return sum(1 for chat_id in chat_ids if self.send(chat_id, text))
+
+    async def _worker(self) -> None:
+        next_send = 0.0
+        while True:
+            chat_id, text = await self._queue.get()
+            try:
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                for attempt in range(3):
+                    try:
+                        await self._bot.send_message(chat_id=chat_id, text=text)
+                        break
+                    except RetryAfter as e:
+                        logger.warning(f"Flood control hit, sleeping {e.retry_after}s")
+                        await asyncio.sleep(e.retry_after)
+                    except Forbidden:
+                        logger.info(f"Chat {chat_id} blocked the bot, notification skipped")
+                        break
+                    except TelegramError as e:
+                        logger.error(f"Failed to send notification to {chat_id}: {str(e)}")
+                        break
+                next_send = time.monotonic() + self._interval
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Unexpected error in notification worker: {str(e)}")
+            finally:
+                self._queue.task_done()
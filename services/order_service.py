@@ -2,18 +2,23 @@ from typing import List, Optional, Dict, Any
 from sqlalchemy.exc import SQLAlchemyError
 from models import Order, Product, User
 from app import db
-from services.payment_service import PaymentService
+from services.payment_service import PaymentService, WebhookEvent
+from services.sales_rollup import record_sale
 from datetime import datetime
 import logging
+from utils.sales_leaderboard import sales_leaderboard
 from utils.security import sanitize_payload
 from utils.validators import InputValidator
 
 logger = logging.getLogger(__name__)
 
 class OrderService:
-    def __init__(self):
+    def __init__(self, delivery_queue=None):
         self.payment_service = PaymentService()
         self.validator = InputValidator()
+        # Optional DeliveryQueue; without one (e.g. in the web process) completed
+        # orders stay queued in the database for the bot's queue to sweep up
+        self.delivery_queue = delivery_queue
 
     async def create_order(self, user_id: int, product_id: int) -> Optional[Order]:
         """Create new order with enhanced validation and security"""
@@ -40,6 +45,7 @@ class OrderService:
                 user_id=user_id,
                 product_id=product_id,
                 status='pending',
+                amount=product.price,
                 created_at=datetime.utcnow()
             )
             db.session.add(order)
@@ -132,10 +138,21 @@ class OrderService:
                 metadata = sanitize_payload(metadata)
                 order.metadata = metadata
 
+            if status == 'completed':
+                order.delivery_status = 'queued'
+                record_sale(order, 1)
+            elif status == 'refunded':
+                record_sale(order, -1)
+
             order.updated_at = datetime.utcnow()
             db.session.commit()
 
             logger.info(f"Updated order {order_id} status to {status}")
+
+            if status in ('completed', 'refunded'):
+                sales_leaderboard.record(order.product_id, 1 if status == 'completed' else -1, order.amount)
+            if status == 'completed' and self.delivery_queue:
+                self.delivery_queue.enqueue(order.id)
             return order
 
         except SQLAlchemyError as e:
@@ -143,18 +160,30 @@ class OrderService:
             logger.error(f"Database error when updating order status: {str(e)}")
             raise
 
+    async def process_webhook_event(self, event: WebhookEvent) -> bool:
+        """Apply a verified event from PaymentService.parse_webhook"""
+        if not event.status:
+            logger.debug(f"Ignoring webhook event {event.type}")
+            return True
+        return await self.process_payment_webhook(event.payment_id, event.status, event.fields)
+
     async def process_payment_webhook(self, payment_id: str, status: str, event_data: Dict[str, Any]) -> bool:
-        """Process payment webhook with enhanced security and validation"""
+        """Process payment webhook with enhanced security and validation.
+
+        event_data only needs the fields used below; they are sanitized once,
+        as part of the order metadata, instead of copying the whole event.
+        """
         try:
             # Validate input
             if not payment_id or not status:
                 logger.error("Invalid webhook data")
                 return False
 
-            # Sanitize webhook data
-            event_data = sanitize_payload(event_data)
-
             order = Order.query.filter_by(payment_id=payment_id).first()
+            order_id = str(event_data.get('order_id') or '')
+            if not order and order_id.isdigit():
+                # Payment intent events don't carry the Checkout Session id
+                order = Order.query.get(int(order_id))
             if not order:
                 logger.error(f"Order not found for payment_id: {payment_id}")
                 return False
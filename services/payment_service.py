@@ -1,21 +1,69 @@
+import json
 import stripe
 from config import Config
 from models import Order, User
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, NamedTuple
 from datetime import datetime, timedelta
+from time import monotonic
 from utils.security import sanitize_payload
 from utils.validators import InputValidator
+from utils.expiring_store import ExpiringStore
 
 logger = logging.getLogger(__name__)
 
 stripe.api_key = Config.STRIPE_SECRET_KEY
 
+# Event type -> payment status handled by OrderService.process_payment_webhook
+WEBHOOK_STATUSES = {
+    'payment_intent.succeeded': 'succeeded',
+    'checkout.session.completed': 'succeeded',
+    'payment_intent.payment_failed': 'failed',
+}
+
+
+class WebhookEvent(NamedTuple):
+    """The few fields of a Stripe event that orders use"""
+    id: str
+    type: str
+    payment_id: Optional[str]
+    status: Optional[str]  # 'succeeded', 'failed' or None for other events
+    fields: Dict[str, Any]  # whitelisted data, raw; sanitized where persisted
+
+
+def extract_webhook_event(event: Dict[str, Any]) -> WebhookEvent:
+    """Pick the whitelisted fields out of a decoded Stripe event without copying it"""
+    obj = (event.get('data') or {}).get('object') or {}
+    # Orders store the Checkout Session id; payment intent events carry their
+    # own id and are matched through the order_id metadata instead
+    if obj.get('object') in ('payment_intent', 'checkout.session'):
+        payment_id = obj.get('id')
+    else:
+        payment_id = obj.get('payment_intent')
+    error = obj.get('last_payment_error') or {}
+    fields = {
+        'type': event.get('type'),
+        'payment_method_types': obj.get('payment_method_types') or [],
+        'failure_reason': error.get('code'),
+        'failure_message': error.get('message'),
+        'order_id': (obj.get('metadata') or {}).get('order_id'),
+    }
+    return WebhookEvent(
+        id=event.get('id'),
+        type=event.get('type'),
+        payment_id=payment_id,
+        status=WEBHOOK_STATUSES.get(event.get('type')),
+        fields=fields,
+    )
+
 class PaymentService:
     def __init__(self):
         self.validator = InputValidator()
         self._fraud_check_threshold = 3  # Maximum failed attempts before additional verification
-        self._suspicious_activities = {}  # Track suspicious payment activities
+        self._fraud_check_window = timedelta(hours=24).total_seconds()
+        # Track suspicious payment activities: {user_id: (attempts, first_attempt)},
+        # forgotten once the window since the first attempt has passed
+        self._suspicious_activities = ExpiringStore(Config.FRAUD_TRACKER_MAX_KEYS, resolution=60)
 
     async def create_payment_session(self, order: Order) -> Optional[stripe.checkout.Session]:
         """Create a Stripe checkout session for an order with enhanced security"""
@@ -49,7 +97,8 @@ class PaymentService:
                                 'order_id': order.id
                             }
                         },
-                        'unit_amount': int(product.price * 100)  # Convert to cents
+                        # What the order records as charged, in cents
+                        'unit_amount': int((order.amount if order.amount is not None else product.price) * 100)
                     },
                     'quantity': 1,
                 }],
@@ -85,8 +134,46 @@ class PaymentService:
             logger.error(f"Unexpected error when creating payment session: {str(e)}")
             return None
 
+    async def parse_webhook(self, payload: bytes, signature: str) -> Optional[WebhookEvent]:
+        """Verify a Stripe webhook and decode it once.
+
+        The signature is checked against the raw bytes, which are then parsed
+        with json.loads a single time; no stripe.Event object tree is built
+        and only the whitelisted fields are kept. Returns None if the payload
+        is not a valid signed event.
+        """
+        try:
+            if not Config.STRIPE_WEBHOOK_SECRET:
+                logger.error("Stripe webhook secret is not configured")
+                return None
+
+            # Without a tolerance the timestamp isn't checked and a captured
+            # event could be replayed at any time
+            stripe.WebhookSignature.verify_header(
+                payload.decode('utf-8'), signature, Config.STRIPE_WEBHOOK_SECRET,
+                tolerance=stripe.Webhook.DEFAULT_TOLERANCE
+            )
+            event = extract_webhook_event(json.loads(payload))
+            if not event.id or not event.type:
+                logger.error("Invalid webhook event data")
+                return None
+
+            logger.info(f"Received valid webhook event: {event.type}")
+            return event
+
+        except stripe.error.SignatureVerificationError as e:
+            logger.error(f"Webhook signature verification failed: {str(e)}")
+            return None
+        except (ValueError, AttributeError) as e:
+            logger.error(f"Malformed webhook payload: {str(e)}")
+            return None
+
     async def verify_webhook_signature(self, payload: bytes, signature: str) -> bool:
-        """Verify Stripe webhook signature with enhanced security"""
+        """Verify Stripe webhook signature with enhanced security.
+
+        Only checks the event; use parse_webhook to verify and decode it in
+        one pass when the event is going to be processed.
+        """
         try:
             if not Config.STRIPE_WEBHOOK_SECRET:
                 logger.error("Stripe webhook secret is not configured")
@@ -152,23 +239,21 @@ class PaymentService:
 
     async def _check_suspicious_activity(self, user_id: int) -> bool:
         """Check for suspicious payment activity"""
-        current_time = datetime.utcnow()
-        user_activity = self._suspicious_activities.get(user_id, {
-            'attempts': 0,
-            'first_attempt': current_time
-        })
-
-        # Reset if more than 24 hours passed
-        if current_time - user_activity['first_attempt'] > timedelta(hours=24):
-            user_activity = {
-                'attempts': 1,
-                'first_attempt': current_time
-            }
-        else:
-            user_activity['attempts'] += 1
-
-        self._suspicious_activities[user_id] = user_activity
-        return user_activity['attempts'] > self._fraud_check_threshold
+        current_time = monotonic()
+        # An expired entry reads as a fresh one, which resets the count after 24 hours
+        attempts, first_attempt = self._suspicious_activities.get(
+            user_id, (0, current_time), current_time
+        )
+        attempts += 1
+
+        self._suspicious_activities.set(
+            user_id, (attempts, first_attempt), first_attempt + self._fraud_check_window, current_time
+        )
+        return attempts > self._fraud_check_threshold
+
+    def get_tracking_stats(self) -> Dict[str, int]:
+        """Gauges for the fraud tracker"""
+        return self._suspicious_activities.stats()
 
     async def _handle_stripe_error(self, error: stripe.error.StripeError, order: Order) -> None:
         """Handle Stripe errors with detailed logging"""
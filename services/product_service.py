@@ -1,7 +1,8 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from sqlalchemy.exc import SQLAlchemyError
-from models import Product, Category
+from models import Product
 from app import db, app
+from utils.catalog_cache import CatalogCategory, CatalogProduct, catalog_cache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,29 +13,23 @@ class ProductService:
         with app.app_context():
             logger.info("Initializing ProductService")
 
-    async def get_categories(self) -> List[Category]:
+    async def get_categories(self) -> Tuple[CatalogCategory, ...]:
         try:
-            with app.app_context():
-                return Category.query.all()
+            return catalog_cache.get_categories()
         except SQLAlchemyError as e:
             logger.error(f"Database error when fetching categories: {str(e)}")
             raise
 
-    async def get_products_by_category(self, category_id: int) -> List[Product]:
+    async def get_products_by_category(self, category_id: int) -> Tuple[CatalogProduct, ...]:
         try:
-            with app.app_context():
-                return Product.query.filter_by(
-                    category_id=category_id,
-                    active=True
-                ).all()
+            return catalog_cache.get_products_by_category(category_id)
         except SQLAlchemyError as e:
             logger.error(f"Database error when fetching products: {str(e)}")
             raise
 
-    async def get_product(self, product_id: int) -> Optional[Product]:
+    async def get_product(self, product_id: int) -> Optional[CatalogProduct]:
         try:
-            with app.app_context():
-                return Product.query.get(product_id)
+            return catalog_cache.get_product(product_id)
         except SQLAlchemyError as e:
             logger.error(f"Database error when fetching product: {str(e)}")
             raise
@@ -61,7 +56,7 @@ class ProductService:
     async def update_product(self, product_id: int, data: dict) -> Optional[Product]:
         try:
             with app.app_context():
-                product = await self.get_product(product_id)
+                product = Product.query.get(product_id)
                 if not product:
                     return None
 
@@ -79,7 +74,7 @@ class ProductService:
     async def delete_product(self, product_id: int) -> bool:
         try:
             with app.app_context():
-                product = await self.get_product(product_id)
+                product = Product.query.get(product_id)
                 if not product:
                     return False
 
@@ -0,0 +1,84 @@
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Optional, Tuple
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from models import Order, SalesDaily
+from app import db
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The sales_daily rollup: completed orders per (order day, product), kept
+# up to date by OrderService.update_order_status so that sales trends read
+# at most days x products rows instead of every order. Revenue is what
+# those orders were charged (Order.amount), so repricing a product doesn't
+# change past days.
+
+# INSERT ... ON CONFLICT DO UPDATE for each supported database
+_UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def record_sale(order: Order, sales: int) -> None:
+    """Add sales, and the order's amount for each, to its day and product,
+    in the caller's transaction.
+
+    1 when an order is completed, -1 when it is refunded. An upsert, so
+    concurrent completions never race to create the same row.
+    """
+    dialect = db.engine.dialect.name
+    if dialect not in _UPSERT_INSERTS:
+        raise ValueError(f"Daily sales rollup is not supported on {dialect}")
+    table = SalesDaily.__table__
+    statement = _UPSERT_INSERTS[dialect](table).values(
+        day=(order.created_at or datetime.utcnow()).date(),
+        product_id=order.product_id,
+        sales=sales,
+        revenue=sales * (order.amount or 0)
+    )
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.day, table.c.product_id],
+        set_={
+            'sales': table.c.sales + statement.excluded.sales,
+            'revenue': table.c.revenue + statement.excluded.revenue,
+        }
+    ))
+
+
+def daily_sales(start: date, end: date) -> Dict[date, Tuple[int, float]]:
+    """day -> (completed orders, revenue) for the days between start and end that had sales"""
+    rows = db.session.execute(
+        select(SalesDaily.day, func.sum(SalesDaily.sales), func.sum(SalesDaily.revenue))
+        .where(SalesDaily.day >= start, SalesDaily.day <= end)
+        .group_by(SalesDaily.day)
+    )
+    return {day: (int(sales), float(revenue or 0)) for day, sales, revenue in rows}
+
+
+def backfill(days: Optional[int] = None) -> int:
+    """Rebuild the rollup from the orders table, for the last `days` days or
+    entirely, in one transaction. Returns the number of rows written."""
+    table = SalesDaily.__table__
+    order_day = func.date(Order.created_at)
+    completed = select(
+        order_day, Order.product_id, func.count(Order.id), func.coalesce(func.sum(Order.amount), 0)
+    ).where(Order.status == 'completed')
+    clear = delete(table)
+    if days is not None:
+        start = (datetime.utcnow() - timedelta(days=days)).date()
+        completed = completed.where(Order.created_at >= datetime.combine(start, time.min))
+        clear = clear.where(table.c.day >= start)
+
+    try:
+        db.session.execute(clear)
+        result = db.session.execute(insert(table).from_select(
+            ['day', 'product_id', 'sales', 'revenue'], completed.group_by(order_day, Order.product_id)
+        ))
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Database error when rebuilding daily sales: {str(e)}")
+        raise
+
+    logger.info(f"Rebuilt {result.rowcount} daily sales rows")
+    return result.rowcount
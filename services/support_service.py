@@ -0,0 +1,183 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy.exc import SQLAlchemyError
+from models import User, SupportTicket, TicketResponse
+from app import db, app
+from config import Config
+from services.notification_queue import NotificationQueue
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SupportService:
+    """Support tickets for bot users.
+
+    New tickets are collected in a write buffer and committed in batches of
+    Config.SUPPORT_WRITE_BATCH_SIZE (or after SUPPORT_WRITE_FLUSH_INTERVAL
+    seconds), then announced to admins through the NotificationQueue. Admin
+    replies are pushed to the user's chat by push_replies(), which also runs
+    periodically to pick up replies written by the web admin.
+    """
+
+    def __init__(self, notifier: NotificationQueue = None,
+                 batch_size: int = None, flush_interval: float = None,
+                 reply_sweep_interval: float = 15.0):
+        self.notifier = notifier
+        self._batch_size = batch_size or Config.SUPPORT_WRITE_BATCH_SIZE
+        self._flush_interval = flush_interval or Config.SUPPORT_WRITE_FLUSH_INTERVAL
+        self._reply_sweep_interval = reply_sweep_interval
+        self._pending: List[Tuple[SupportTicket, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._admin_chat_ids: List[int] = []
+        self._admin_chat_ids_loaded_at = 0.0
+        self._sweep_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._sweep_task is None:
+            self._sweep_task = asyncio.create_task(self._reply_sweeper())
+
+    async def stop(self) -> None:
+        self.flush()
+        if self._sweep_task:
+            self._sweep_task.cancel()
+            await asyncio.gather(self._sweep_task, return_exceptions=True)
+            self._sweep_task = None
+
+    async def create_ticket(self, user_id: int, message: str, subject: str = None) -> Optional[int]:
+        """Create a ticket for the user with the given Telegram id.
+
+        Returns the new ticket id once its batch is committed, or None if the
+        user is unknown.
+        """
+        with app.app_context():
+            user = User.query.filter_by(telegram_id=user_id).first()
+            if not user:
+                logger.error(f"Cannot create ticket, user not found: {user_id}")
+                return None
+            db_user_id = user.id
+
+        ticket = SupportTicket(
+            user_id=db_user_id,
+            subject=subject or message[:100],
+            message=message,
+            status='open',
+            created_at=datetime.utcnow()
+        )
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((ticket, future))
+
+        if len(self._pending) >= self._batch_size:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._flush_interval, self.flush)
+
+        ticket_id = await future
+        logger.info(f"Created support ticket {ticket_id} for user {user_id}")
+
+        if self.notifier:
+            self.notifier.send_many(
+                self._get_admin_chat_ids(),
+                f"🎫 Новый тикет #{ticket_id}\n\n{message[:500]}"
+            )
+        return ticket_id
+
+    def flush(self) -> None:
+        """Commit all buffered tickets in one transaction"""
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        try:
+            with app.app_context():
+                db.session.add_all([ticket for ticket, _ in batch])
+                db.session.commit()
+                # Read ids before the context ends and the instances are detached
+                ticket_ids = [ticket.id for ticket, _ in batch]
+            for (_, future), ticket_id in zip(batch, ticket_ids):
+                if not future.done():
+                    future.set_result(ticket_id)
+            logger.debug(f"Flushed {len(batch)} support tickets")
+        except SQLAlchemyError as e:
+            with app.app_context():
+                db.session.rollback()
+            logger.error(f"Database error when saving support tickets: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def get_user_tickets(self, user_id: int) -> List[SupportTicket]:
+        """Tickets of the user with the given Telegram id, newest first"""
+        try:
+            with app.app_context():
+                return SupportTicket.query.join(User).filter(
+                    User.telegram_id == user_id
+                ).order_by(SupportTicket.created_at.desc()).all()
+        except SQLAlchemyError as e:
+            logger.error(f"Database error when fetching user tickets: {str(e)}")
+            raise
+
+    def push_replies(self) -> int:
+        """Queue undelivered admin replies to their users' chats"""
+        if not self.notifier or not self.notifier.running:
+            return 0
+
+        try:
+            with app.app_context():
+                # Replies older than a day are never pushed, so enabling this
+                # doesn't replay the whole history
+                rows = db.session.query(TicketResponse, User.telegram_id).join(
+                    SupportTicket, TicketResponse.ticket_id == SupportTicket.id
+                ).join(
+                    User, SupportTicket.user_id == User.id
+                ).filter(
+                    TicketResponse.delivered_at.is_(None),
+                    TicketResponse.created_at >= datetime.utcnow() - timedelta(days=1)
+                ).limit(200).all()
+
+                now = datetime.utcnow()
+                for response, telegram_id in rows:
+                    if telegram_id and self.notifier.send(
+                        telegram_id,
+                        f"💬 Ответ поддержки по тикету #{response.ticket_id}:\n\n{response.message}"
+                    ):
+                        response.delivered_at = now
+                db.session.commit()
+                return len(rows)
+        except SQLAlchemyError as e:
+            with app.app_context():
+                db.session.rollback()
+            logger.error(f"Database error when pushing ticket replies: {str(e)}")
+            return 0
+
+    def _get_admin_chat_ids(self) -> List[int]:
+        if time.monotonic() - self._admin_chat_ids_loaded_at > 300:
+            try:
+                with app.app_context():
+                    admins = [name for name in Config.ADMIN_USERNAMES if name]
+                    self._admin_chat_ids = [
+                        row.telegram_id for row in User.query.with_entities(User.telegram_id).filter(
+                            User.username.in_(admins),
+                            User.telegram_id.isnot(None)
+                        )
+                    ]
+                    self._admin_chat_ids_loaded_at = time.monotonic()
+            except SQLAlchemyError as e:
+                logger.error(f"Database error when fetching admin chats: {str(e)}")
+        return self._admin_chat_ids
+
+    async def _reply_sweeper(self) -> None:
+        while True:
+            try:
+                self.push_replies()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error pushing ticket replies: {str(e)}")
+            await asyncio.sleep(self._reply_sweep_interval)
@@ -1,11 +1,115 @@
-from typing import Optional
+import threading
+from itertools import chain
+from time import monotonic
+from typing import Any, Callable, Dict, Iterable, Optional
+from sqlalchemy import case, event, func, inspect
 from sqlalchemy.exc import SQLAlchemyError
-from models import User
+from sqlalchemy.orm import Session
+from models import Order, User
 from app import db, app
+from config import Config
+from utils.expiring_store import ExpiringStore
+from utils.invalidation_bus import invalidation_bus
 import logging
 
 logger = logging.getLogger(__name__)
 
+class ProfileCache:
+    """telegram_id -> profile dict for UserService.get_user_profile.
+
+    Entries live for Config.PROFILE_CACHE_TTL seconds. Commits that touch a
+    user or one of their orders drop that user's entry right away (see the
+    session hooks below) and other processes are told through the
+    invalidation bus. Orders only know the internal user id, hence the
+    second store mapping it back to the telegram id.
+    """
+
+    def __init__(self, ttl: float = None, clock: Callable[[], float] = monotonic):
+        self._ttl = ttl or Config.PROFILE_CACHE_TTL
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._profiles = ExpiringStore(Config.PROFILE_CACHE_MAX_KEYS, clock)
+        self._telegram_ids = ExpiringStore(Config.PROFILE_CACHE_MAX_KEYS, clock)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            profile = self._profiles.get(telegram_id)
+        if profile is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(profile)
+
+    def put(self, telegram_id: int, profile: Dict[str, Any]) -> None:
+        now = self._clock()
+        with self._lock:
+            self._profiles.set(telegram_id, dict(profile), now + self._ttl, now)
+            self._telegram_ids.set(profile['id'], telegram_id, now + self._ttl, now)
+
+    def invalidate(self, user_ids: Iterable[int] = None) -> None:
+        """Forget the given users by internal id, or everyone"""
+        with self._lock:
+            if user_ids is None:
+                self._profiles.clear()
+                self._telegram_ids.clear()
+                return
+            for user_id in user_ids:
+                telegram_id = self._telegram_ids.pop(user_id)
+                if telegram_id is not None:
+                    self._profiles.pop(telegram_id)
+
+    def invalidate_telegram_ids(self, telegram_ids: Iterable[int] = None) -> None:
+        """Forget the given users by telegram id, or everyone"""
+        if telegram_ids is None:
+            self.invalidate()
+            return
+        with self._lock:
+            for telegram_id in telegram_ids:
+                self._profiles.pop(telegram_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self._profiles), 'hits': self.hits, 'misses': self.misses}
+
+profile_cache = ProfileCache()
+invalidation_bus.subscribe('profile', profile_cache.invalidate)
+# Published for user changes by the permission cache's hooks
+invalidation_bus.subscribe('user', profile_cache.invalidate_telegram_ids)
+
+@event.listens_for(Session, 'after_flush')
+def _collect_profile_changes(session, flush_context):
+    pending = session.info.setdefault('profile_changes', set())
+    pending_telegram = session.info.setdefault('profile_telegram_changes', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Order):
+            # An order moved to another user changes both profiles
+            history = inspect(obj).attrs.user_id.history
+            pending.update(user_id for user_id in chain(
+                history.added, history.unchanged, history.deleted
+            ) if user_id is not None)
+        elif isinstance(obj, User):
+            # By telegram id: a recreated user has a new internal id
+            history = inspect(obj).attrs.telegram_id.history
+            pending_telegram.update(telegram_id for telegram_id in chain(
+                history.added, history.unchanged, history.deleted
+            ) if telegram_id is not None)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_profile_changes(session):
+    pending = session.info.pop('profile_changes', None)
+    pending_telegram = session.info.pop('profile_telegram_changes', None)
+    if pending_telegram:
+        profile_cache.invalidate_telegram_ids(pending_telegram)
+    if pending:
+        profile_cache.invalidate(pending)
+        invalidation_bus.publish('profile', sorted(pending))
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_profile_changes(session):
+    session.info.pop('profile_changes', None)
+    session.info.pop('profile_telegram_changes', None)
+
 class UserService:
     def __init__(self):
         # Initialize service within app context
@@ -76,21 +180,44 @@ class UserService:
             logger.error(f"Database error when deactivating user: {str(e)}")
             raise
 
-    async def get_user_profile(self, telegram_id: int) -> dict:
+    async def get_user_profile(self, telegram_id: int) -> Optional[dict]:
+        """User details with order count, total spent and last order date.
+
+        Built from one aggregate query over the user's orders rather than by
+        loading them, and cached per user until their orders change.
+        """
+        profile = profile_cache.get(telegram_id)
+        if profile is not None:
+            return profile
+
         try:
             with app.app_context():
-                user = await self.get_user(telegram_id)
-                if not user:
-                    return None
-
-                return {
-                    'id': user.id,
-                    'username': user.username,
-                    'email': user.email,
-                    'active': user.active,
-                    'created_at': user.created_at,
-                    'orders_count': len(user.orders)
-                }
+                row = db.session.query(
+                    User.id, User.username, User.email, User.active, User.created_at,
+                    func.count(Order.id),
+                    func.coalesce(func.sum(case((Order.status == 'completed', Order.amount), else_=0)), 0),
+                    func.max(Order.created_at)
+                ).outerjoin(
+                    Order, Order.user_id == User.id
+                ).filter(
+                    User.telegram_id == telegram_id
+                ).group_by(User.id).first()
         except SQLAlchemyError as e:
             logger.error(f"Database error when fetching user profile: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+        if row is None:
+            return None
+        user_id, username, email, active, created_at, orders_count, total_spent, last_order_at = row
+        profile = {
+            'id': user_id,
+            'username': username,
+            'email': email,
+            'active': active,
+            'created_at': created_at,
+            'orders_count': orders_count,
+            'total_spent': float(total_spent),
+            'last_order_at': last_order_at
+        }
+        profile_cache.put(telegram_id, profile)
+        return profile
@@ -6,6 +6,7 @@ from bot import TelegramBot
 from models import User, Category, Product, Order
 from config import Config
 from app import app, db
+from utils.rate_limiter import RateLimitResult
 import asyncio
 
 @pytest.fixture
@@ -133,7 +134,7 @@ async def test_handle_callback(test_app, bot, update, context, query_data):
         update.callback_query.from_user = update.effective_user
 
         # Mock rate limiter and relevant service methods
-        with patch.object(bot.rate_limiter, 'check_limit', return_value=True), \
+        with patch.object(bot.rate_limiter, 'check', return_value=RateLimitResult(True, 10, 0)), \
              patch.multiple(bot,
                 show_catalog=MagicMock(),
                 show_orders=MagicMock(),
@@ -163,8 +164,7 @@ async def test_rate_limiting(test_app, bot, update, context):
         user_state.update('main_menu')
 
         # Mock rate limiter to simulate rate limit exceeded
-        with patch.object(bot.rate_limiter, 'check_limit', return_value=False), \
-             patch.object(bot.rate_limiter, 'get_remaining_attempts', return_value=(0, 30)):
+        with patch.object(bot.rate_limiter, 'check', return_value=RateLimitResult(False, 0, 30)):
             await bot.handle_message(update, context)
 
             # Verify rate limit message
@@ -0,0 +1,64 @@
+import pytest
+from utils.catalog_snapshot import CatalogCategory, CatalogProduct, MappedCatalog, SnapshotFile, write_snapshot
+
+CATEGORIES = [
+    CatalogCategory(2, "Игры", None),
+    CatalogCategory(1, "Цифровые товары", "Электронные товары и услуги"),
+    CatalogCategory(3, "Empty", ""),
+]
+PRODUCTS = [
+    CatalogProduct(10, "Ключ", "Описание", 9.99, 1, "Цифровые товары", True),
+    CatalogProduct(5, "Hidden", None, 1.5, 1, "Цифровые товары", False),
+    CatalogProduct(7, "Game", "", 20.0, 2, "Игры", True),
+    CatalogProduct(3, "Second key", "x", 4.25, 1, "Цифровые товары", True),
+]
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    path = str(tmp_path / 'catalog.bin')
+    write_snapshot(path, 1, CATEGORIES, PRODUCTS)
+    return path
+
+
+def test_round_trip(snapshot_path):
+    catalog = MappedCatalog(snapshot_path)
+    assert catalog.version == 1
+    assert catalog.get_categories() == tuple(sorted(CATEGORIES))
+    for product in PRODUCTS:
+        assert catalog.get_product(product.id) == product
+    assert catalog.get_product(999) is None
+
+
+def test_products_by_category_are_active_in_id_order(snapshot_path):
+    catalog = MappedCatalog(snapshot_path)
+    assert [product.id for product in catalog.get_products_by_category(1)] == [3, 10]
+    assert catalog.get_products_by_category(3) == ()
+    assert catalog.get_products_by_category(999) == ()
+
+
+def test_swap_on_new_file(snapshot_path):
+    now = [0.0]
+    snapshot = SnapshotFile(snapshot_path, check_interval=1.0, clock=lambda: now[0])
+    old = snapshot.current()
+
+    write_snapshot(snapshot_path, 2, CATEGORIES, PRODUCTS[:1])
+    # Not rechecked before the interval is up
+    assert snapshot.current() is old
+    now[0] = 1.0
+    new = snapshot.current()
+    assert new.version == 2
+    assert new.get_product(7) is None
+    assert snapshot.swaps == 2
+
+    # Readers still holding the previous mapping are unaffected
+    assert old.get_product(7) == PRODUCTS[2]
+
+
+def test_missing_and_invalid_files(tmp_path):
+    assert SnapshotFile(str(tmp_path / 'missing.bin')).current() is None
+
+    path = tmp_path / 'invalid.bin'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        MappedCatalog(str(path))
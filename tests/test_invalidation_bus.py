@@ -0,0 +1,82 @@
+import json
+import threading
+from utils.invalidation_bus import MAX_KEYS, InvalidationBus, SQLiteTransport
+
+
+class RecordingTransport:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, payload):
+        self.sent.append(payload)
+
+
+def test_subscribers_get_keys_from_other_processes():
+    publisher = InvalidationBus(RecordingTransport())
+    subscriber = InvalidationBus(RecordingTransport())
+    received = []
+    subscriber.subscribe('user', received.append)
+    publisher.subscribe('user', received.append)
+
+    publisher.publish('user', [1, 2])
+    for payload in publisher.transport.sent:
+        subscriber.dispatch(payload)
+        # A process ignores its own messages
+        publisher.dispatch(payload)
+
+    assert received == [[1, 2]]
+    assert subscriber.versions == {'user': 1}
+    assert publisher.versions == {}
+
+
+def test_large_key_sets_invalidate_the_entity():
+    bus = InvalidationBus(RecordingTransport())
+    bus.publish('user', list(range(MAX_KEYS + 1)))
+    assert json.loads(bus.transport.sent[0])['keys'] is None
+
+
+def test_failures_do_not_reach_callers():
+    class BrokenTransport:
+        def send(self, payload):
+            raise OSError("down")
+
+    bus = InvalidationBus(BrokenTransport())
+    bus.subscribe('catalog', lambda keys: 1 / 0)
+    bus.publish('catalog')
+    bus.dispatch('not json')
+    bus.dispatch(json.dumps({'origin': 'other', 'entity': 'catalog', 'keys': None}))
+    assert bus.versions == {'catalog': 1}
+
+
+def test_sqlite_transport_between_processes(tmp_path):
+    path = str(tmp_path / 'bus.sqlite3')
+    publisher = InvalidationBus(SQLiteTransport(path, poll_interval=0.01))
+    publisher.publish('catalog')  # sent before the subscriber started, not replayed
+
+    subscriber = InvalidationBus(SQLiteTransport(path, poll_interval=0.01))
+    received = threading.Event()
+    keys = []
+    subscriber.subscribe('user', lambda value: (keys.append(value), received.set()))
+    subscriber.start()
+    try:
+        # Let the listener record where the table ends before publishing
+        threading.Event().wait(0.1)
+        publisher.publish('user', [42])
+        assert received.wait(2)
+    finally:
+        subscriber.stop()
+
+    assert keys == [[42]]
+    assert subscriber.versions == {'user': 1}
+
+
+def test_listener_start_triggers_resync(tmp_path):
+    bus = InvalidationBus(SQLiteTransport(str(tmp_path / 'bus.sqlite3'), poll_interval=0.01))
+    resynced = threading.Event()
+    bus.on_resync(resynced.set)
+    bus.on_resync(lambda: 1 / 0)  # one failing callback doesn't stop the listener
+    bus.start()
+    try:
+        assert resynced.wait(2)
+    finally:
+        bus.stop()
@@ -0,0 +1,98 @@
+import json
+import logging
+import queue
+import random
+from unittest.mock import patch
+from config import Config
+from utils.logger import DroppingQueueHandler, JsonFormatter, RepeatFilter, _LogListener, sampled
+
+
+class Collector(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def make_record(msg, level=logging.WARNING, **extra):
+    return logging.makeLogRecord({
+        'name': 'telegram_bot', 'levelno': level, 'levelname': logging.getLevelName(level),
+        'msg': msg, **extra,
+    })
+
+
+def test_json_formatter_merges_fields():
+    record = make_record("Incoming request: %s", logging.INFO, args=('x',), event='request',
+                         fields={'user_id': 42, 'text': 'Привет'})
+    data = json.loads(JsonFormatter().format(record))
+    assert data['message'] == "Incoming request: x"
+    assert data['event'] == 'request'
+    assert (data['level'], data['logger']) == ('INFO', 'telegram_bot')
+    # Fields become top-level keys, not part of the message
+    assert (data['user_id'], data['text']) == (42, 'Привет')
+
+
+def test_json_formatter_without_extra():
+    data = json.loads(JsonFormatter().format(make_record("plain")))
+    assert 'event' not in data
+    assert data['message'] == "plain"
+
+
+def test_repeat_filter_suppresses_and_reports():
+    now = [0.0]
+    repeat_filter = RepeatFilter(limit=2, interval=60)
+    with patch('utils.logger.time.monotonic', lambda: now[0]):
+        passed = [repeat_filter.filter(make_record("Rate limit exceeded")) for _ in range(5)]
+        assert passed == [True, True, False, False, False]
+        # Lower levels and other messages are not affected
+        assert repeat_filter.filter(make_record("Rate limit exceeded", logging.INFO))
+        assert repeat_filter.filter(make_record("Other warning"))
+
+        now[0] = 60
+        record = make_record("Rate limit exceeded")
+        assert repeat_filter.filter(record)
+        assert record.msg == "Rate limit exceeded (suppressed 3 similar)"
+        record = make_record("Rate limit exceeded")
+        assert repeat_filter.filter(record)
+        assert record.msg == "Rate limit exceeded"
+
+
+def test_sampled_rate():
+    random.seed(1)
+    with patch.dict(Config.LOG_SAMPLE_RATES, {'request': 0.25, 'never': 0.0}):
+        logged = sum(sampled('request') for _ in range(10000))
+        assert 2300 < logged < 2700
+        assert not any(sampled('never') for _ in range(100))
+        # Events without a rate are always logged
+        assert all(sampled('unconfigured') for _ in range(100))
+
+
+def test_dropping_queue_handler_counts_drops():
+    log_queue = queue.Queue(maxsize=2)
+    handler = DroppingQueueHandler(log_queue)
+    for i in range(4):
+        handler.handle(make_record(f"record {i}"))
+    assert handler.dropped == 2
+    assert [log_queue.get_nowait().msg for _ in range(2)] == ["record 0", "record 1"]
+
+    # The next record that fits is preceded by the drop count
+    handler.handle(make_record("record 4"))
+    assert [log_queue.get_nowait().msg for _ in range(2)] == [
+        "Log queue full, dropped 2 records", "record 4"
+    ]
+    assert handler.dropped == 2
+
+
+def test_listener_flushes_queue_on_stop():
+    log_queue = queue.Queue(maxsize=3)
+    collector = Collector()
+    for i in range(3):
+        log_queue.put_nowait(make_record(f"record {i}"))
+
+    # The queue is full, stop() waits for room instead of failing
+    listener = _LogListener(log_queue, collector)
+    listener.start()
+    listener.stop()
+    assert [record.msg for record in collector.records] == ["record 0", "record 1", "record 2"]
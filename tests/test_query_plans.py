@@ -0,0 +1,189 @@
+"""Query plan regression tests.
+
+Each case runs a service call against a small seeded database, captures the
+SELECTs it sends, and EXPLAINs them: SQLite's EXPLAIN QUERY PLAN, or
+Postgres's EXPLAIN with enable_seqscan off so a sequential scan only shows
+up when no index can serve the query. A full scan of a table the case
+doesn't explicitly allow fails the test, so a dropped index or a new filter
+without one is caught before it reaches production.
+"""
+import re
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from app import app, db
+from models import Category, Order, Product, Role, SupportTicket, TicketResponse, User
+from services.admin_service import AdminService
+from services.order_service import OrderService
+from services.sales_rollup import backfill, daily_sales
+from services.support_service import SupportService
+from services.user_service import UserService, profile_cache
+from utils.catalog_cache import CatalogCache
+from utils.permission_cache import PermissionCache
+from utils.sales_leaderboard import SalesLeaderboard
+
+TELEGRAM_ID = 700001
+
+
+@pytest.fixture
+def seeded():
+    with app.app_context():
+        db.create_all()
+        now = datetime.utcnow()
+        category = Category(name="Plans")
+        users = [User(telegram_id=TELEGRAM_ID + i, username=f"plan_user_{i}", active=True) for i in range(5)]
+        users[0].roles.append(Role(name='plans_admin'))
+        db.session.add_all([category, *users])
+        db.session.commit()
+
+        products = [
+            Product(name=f"Product {i}", category_id=category.id, price=1.0 + i,
+                    digital_content=f"content-{i}", active=i % 2 == 0)
+            for i in range(5)
+        ]
+        db.session.add_all(products)
+        db.session.commit()
+
+        orders = [
+            Order(user_id=users[i % 5].id, product_id=products[i % 5].id,
+                  status=('completed', 'pending', 'failed')[i % 3], payment_id=f"pi_{i}",
+                  created_at=now - timedelta(days=i))
+            for i in range(20)
+        ]
+        tickets = [
+            SupportTicket(user_id=users[i % 5].id, subject="Plan", message="Query plan ticket",
+                          status=('open', 'answered')[i % 2], created_at=now - timedelta(hours=i))
+            for i in range(10)
+        ]
+        db.session.add_all([*orders, *tickets])
+        db.session.commit()
+        backfill()
+        db.session.add_all([
+            TicketResponse(ticket_id=ticket.id, message="Reply", delivered_at=now) for ticket in tickets
+        ])
+        db.session.commit()
+
+        yield users[0]
+
+        db.session.remove()
+        db.drop_all()
+
+
+@contextmanager
+def captured_selects():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def _postgres_scans(plan: dict) -> set:
+    scans = {plan['Relation Name']} if plan.get('Node Type') == 'Seq Scan' else set()
+    for child in plan.get('Plans', ()):
+        scans |= _postgres_scans(child)
+    return scans
+
+
+def full_scans(statement: str, parameters) -> set:
+    """Tables the statement's plan reads in full"""
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            conn.exec_driver_sql('SET enable_seqscan = off')
+            try:
+                plan = conn.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {statement}', parameters).scalar()
+            finally:
+                # The connection goes back to the pool
+                conn.exec_driver_sql('RESET enable_seqscan')
+            return _postgres_scans(plan[0]['Plan'])
+
+        scans = set()
+        for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters):
+            match = re.match(r'SCAN (?:TABLE )?"?(\w+)"?', row[-1])
+            if match and 'USING' not in row[-1]:
+                # Aliased tables show up as order_1, product_2, ...
+                table = re.sub(r'_\d+$', '', match.group(1))
+                if table in db.metadata.tables:
+                    scans.add(table)
+        return scans
+
+
+async def _load_catalog(user):
+    # A fresh cache, the shared one may already hold the catalog
+    CatalogCache(ttl=60).reload()
+
+
+async def _load_profile(user):
+    # Past the shared cache, which may already hold the profile
+    profile_cache.invalidate()
+    await UserService().get_user_profile(TELEGRAM_ID)
+
+
+async def _window_statistics(user):
+    AdminService._window_statistics()
+
+
+async def _daily_sales(user):
+    today = datetime.utcnow().date()
+    daily_sales(today - timedelta(days=30), today)
+
+
+async def _load_leaderboard(user):
+    SalesLeaderboard._query()
+
+
+async def _refresh_leaderboard(user):
+    SalesLeaderboard._query([1, 2])
+
+
+CASES = {
+    # name: (service call, tables it may read in full)
+    'user by telegram id': (lambda user: UserService().get_user(TELEGRAM_ID), set()),
+    'orders of a user': (lambda user: OrderService().get_user_orders(user.id), set()),
+    'order by payment id': (lambda user: OrderService().process_payment_webhook('pi_missing', 'completed', {}), set()),
+    'orders by status': (lambda user: AdminService().get_all_orders({'status': 'completed'}), set()),
+    'tickets by status': (lambda user: AdminService().get_support_tickets('open'), set()),
+    'tickets of a user': (lambda user: SupportService().get_user_tickets(TELEGRAM_ID), set()),
+    'sales trends': (lambda user: AdminService().get_sales_trends(7), set()),
+    'daily sales': (_daily_sales, set()),
+    'user profile': (_load_profile, set()),
+    # Ranking looks at every product that has completed orders
+    'top products': (lambda user: AdminService().get_top_products(5), {'product'}),
+    'leaderboard load': (_load_leaderboard, {'product'}),
+    'leaderboard refresh': (_refresh_leaderboard, set()),
+    # The average response time is taken over every answered ticket
+    'window statistics': (_window_statistics, {'support_ticket'}),
+    # The catalog is loaded whole by design
+    'catalog load': (_load_catalog, {'category', 'product'}),
+}
+
+
+@pytest.mark.parametrize('name', CASES)
+async def test_service_queries_use_indexes(seeded, name):
+    call, allowed = CASES[name]
+    with captured_selects() as statements:
+        await call(seeded)
+
+    assert statements, f"{name} ran no queries"
+    for statement, parameters in statements:
+        scans = full_scans(statement, parameters) - allowed
+        assert not scans, f"{name} scans {sorted(scans)}:\n{statement}"
+
+
+def test_sync_queries_use_indexes(seeded):
+    with captured_selects() as statements:
+        PermissionCache._query(User.telegram_id == TELEGRAM_ID)
+        SupportService().push_replies()
+        list(AdminService().iter_product_export())
+
+    for statement, parameters in statements:
+        # The export lists every product of every category
+        scans = full_scans(statement, parameters) - {'product', 'category'}
+        assert not scans, f"scans {sorted(scans)}:\n{statement}"
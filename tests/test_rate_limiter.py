@@ -1,7 +1,8 @@
 import pytest
 from datetime import datetime, timedelta
 from time import sleep
-from utils.rate_limiter import RateLimiter
+from utils.rate_limiter import RateLimiter, get_rate_limiter
+from utils.rate_limit_backends import MemoryBackend, SQLiteBackend
 
 @pytest.fixture
 def rate_limiter():
@@ -100,3 +101,213 @@ class TestRateLimiter:
         remaining, wait_time = rate_limiter.get_remaining_attempts(None, 'invalid_type')
         assert remaining == 0
         assert wait_time == 0
+
+    def test_check_returns_remaining_and_retry_after(self):
+        now = [1000.0]
+        rate_limiter = RateLimiter(clock=lambda: now[0])
+        user_id = 12345
+        limit = rate_limiter._limits['payment']
+
+        for expected_remaining in range(limit - 1, -1, -1):
+            result = rate_limiter.check(user_id, 'payment')
+            assert result.allowed is True
+            assert result.remaining == expected_remaining
+            assert result.retry_after == 0
+
+        result = rate_limiter.check(user_id, 'payment')
+        assert result.allowed is False
+        assert result.remaining == 0
+        # One slot frees up every window / limit seconds
+        assert result.retry_after >= rate_limiter._windows['payment'] // limit
+
+    def test_budget_refills_over_time(self):
+        now = [1000.0]
+        rate_limiter = RateLimiter(clock=lambda: now[0])
+        user_id = 12345
+
+        for _ in range(rate_limiter._limits['auth']):
+            assert rate_limiter.check_limit(user_id, 'auth') is True
+        assert rate_limiter.check_limit(user_id, 'auth') is False
+
+        # After one emission interval exactly one more attempt is allowed
+        now[0] += rate_limiter._windows['auth'] / rate_limiter._limits['auth']
+        assert rate_limiter.check_limit(user_id, 'auth') is True
+        assert rate_limiter.check_limit(user_id, 'auth') is False
+
+        # After a full window the whole burst is available again
+        now[0] += rate_limiter._windows['auth']
+        remaining, wait_time = rate_limiter.get_remaining_attempts(user_id, 'auth')
+        assert remaining == rate_limiter._limits['auth']
+
+    def test_state_is_constant_size(self, rate_limiter):
+        user_id = 12345
+        for _ in range(1000):
+            rate_limiter.check(user_id, 'message')
+
+        namespace = rate_limiter._namespaces['message']
+        state, violations = rate_limiter.backend.get(namespace, user_id, rate_limiter._clock())
+        assert rate_limiter.get_metrics()['message']['tracked_keys'] == 1
+        # Sliding-window counter: window start, current and previous count
+        assert len(state) == 3
+
+    def test_idle_users_are_evicted(self):
+        now = [1000.0]
+        rate_limiter = RateLimiter(clock=lambda: now[0])
+
+        for user_id in range(1, 101):
+            rate_limiter.check(user_id, 'message')
+        assert rate_limiter.get_metrics()['message']['tracked_keys'] == 100
+
+        # Lookups must not create state
+        rate_limiter.get_remaining_attempts(999, 'message')
+        assert rate_limiter.get_metrics()['message']['tracked_keys'] == 100
+
+        # Once the sliding window has passed both counted windows every user
+        # is back to a full budget
+        now[0] += 2 * rate_limiter._windows['message'] + 1
+        rate_limiter.backend._state[rate_limiter._namespaces['message']].purge()
+        assert rate_limiter.get_metrics()['message']['tracked_keys'] == 0
+
+    def test_violations_expire_after_backoff(self):
+        now = [1000.0]
+        rate_limiter = RateLimiter(clock=lambda: now[0])
+        user_id = 12345
+
+        for _ in range(rate_limiter._limits['payment'] + 1):
+            rate_limiter.check(user_id, 'payment')
+        _, wait_time = rate_limiter.get_remaining_attempts(user_id, 'payment')
+        assert wait_time > 0
+        assert rate_limiter.get_metrics()['payment']['limited_keys'] == 1
+
+        now[0] += rate_limiter._windows['payment'] + 3600
+        assert rate_limiter.get_remaining_attempts(user_id, 'payment') == (rate_limiter._limits['payment'], 0)
+        rate_limiter.backend._violations[rate_limiter._namespaces['payment']].purge()
+        assert rate_limiter.get_metrics()['payment']['limited_keys'] == 0
+
+    def test_tracked_keys_are_capped(self):
+        rate_limiter = RateLimiter(backend=MemoryBackend(max_keys=10))
+
+        for user_id in range(1, 51):
+            rate_limiter.check(user_id, 'message')
+
+        metrics = rate_limiter.get_metrics()['message']
+        assert metrics['tracked_keys'] == 10
+        assert metrics['capacity_evictions'] == 40
+
+    def test_registry_returns_one_limiter_per_name(self):
+        assert get_rate_limiter('test-registry') is get_rate_limiter('test-registry')
+        assert get_rate_limiter('test-registry') is not get_rate_limiter('test-registry-other')
+
+    def test_sqlite_backend_is_shared_between_limiters(self, tmp_path):
+        now = [1000.0]
+        path = str(tmp_path / 'limits.sqlite3')
+        # Two limiters with their own backend objects stand in for two processes
+        first = RateLimiter(clock=lambda: now[0], backend=SQLiteBackend(path, clock=lambda: now[0]))
+        second = RateLimiter(clock=lambda: now[0], backend=SQLiteBackend(path, clock=lambda: now[0]))
+        user_id = 12345
+        limit = first._limits['auth']
+
+        for attempt in range(limit):
+            limiter = first if attempt % 2 else second
+            assert limiter.check_limit(user_id, 'auth') is True
+        assert first.check_limit(user_id, 'auth') is False
+        assert second.check_limit(user_id, 'auth') is False
+        assert first.get_remaining_attempts(user_id, 'auth')[0] == 0
+
+        first.reset_limits(user_id)
+        assert second.check_limit(user_id, 'auth') is True
+
+    def test_local_fast_path_refuses_without_backend(self, tmp_path):
+        now = [1000.0]
+        backend = SQLiteBackend(str(tmp_path / 'limits.sqlite3'), clock=lambda: now[0])
+        rate_limiter = RateLimiter(clock=lambda: now[0], backend=backend)
+        user_id = 12345
+
+        for _ in range(rate_limiter._limits['payment']):
+            assert rate_limiter.check_limit(user_id, 'payment') is True
+
+        backend.apply = None  # any round trip now fails and would be allowed
+        result = rate_limiter.check(user_id, 'payment')
+        assert result.allowed is False
+        assert result.retry_after > 0
+
+    def test_policies_come_from_config(self):
+        rate_limiter = RateLimiter(policies={
+            'message': {'algorithm': 'token_bucket', 'limit': 2, 'window': 10, 'burst': 1},
+        })
+        assert rate_limiter.check_limit(12345, 'message') is True
+        # A burst of one allows a single request per interval
+        assert rate_limiter.check_limit(12345, 'message') is False
+
+        with pytest.raises(ValueError):
+            RateLimiter(policies={'message': {'algorithm': 'unknown', 'limit': 1, 'window': 1}})
+
+    def test_backoff_curve_is_configurable(self):
+        now = [1000.0]
+        rate_limiter = RateLimiter(clock=lambda: now[0], policies={
+            'message': {'algorithm': 'exact', 'limit': 1, 'window': 1,
+                        'backoff_base': 10, 'backoff_factor': 3, 'backoff_max': 50},
+        })
+        user_id = 12345
+        rate_limiter.check(user_id, 'message')
+        assert [rate_limiter.check(user_id, 'message').retry_after for _ in range(3)] == [10, 30, 50]
+
+    def test_sliding_window_weights_previous_window(self):
+        now = [1200.0]  # start of a fixed window
+        rate_limiter = RateLimiter(clock=lambda: now[0], policies={
+            'message': {'algorithm': 'sliding_window', 'limit': 10, 'window': 60},
+        })
+        user_id = 12345
+        for _ in range(10):
+            assert rate_limiter.check_limit(user_id, 'message') is True
+        result = rate_limiter.check(user_id, 'message')
+        assert result.allowed is False
+        # Next window: still blocked until 10% of the previous one has slid out
+        assert result.retry_after == 66
+
+        # Halfway through the next window half of the old count still applies
+        now[0] += 90
+        remaining, wait_time = rate_limiter.get_remaining_attempts(user_id, 'message')
+        assert remaining == 5
+        assert wait_time == 0
+
+    def test_exact_log_frees_slots_as_requests_age(self):
+        now = [1000.0]
+        rate_limiter = RateLimiter(clock=lambda: now[0])
+        user_id = 12345
+        window = rate_limiter._windows['payment']
+
+        for _ in range(rate_limiter._limits['payment']):
+            assert rate_limiter.check_limit(user_id, 'payment') is True
+            now[0] += 10
+        # The first attempt leaves the window 10 seconds before the second
+        now[0] = 1000.0 + window
+        assert rate_limiter.get_remaining_attempts(user_id, 'payment')[0] == 1
+
+    def test_cost_weighs_expensive_requests(self):
+        now = [1000.0]
+        rate_limiter = RateLimiter(clock=lambda: now[0])
+        limit = rate_limiter._limits['admin_user']
+        user_id = 12345
+
+        result = rate_limiter.check(user_id, 'admin_user', cost=limit - 1)
+        assert result.allowed is True
+        assert result.remaining == 1
+
+        result = rate_limiter.check(user_id, 'admin_user', cost=2)
+        assert result.allowed is False
+        assert result.retry_after > 0
+        # A refused expensive request doesn't use up what is left
+        assert rate_limiter.check(user_id, 'admin_user').allowed is True
+
+    def test_unrecorded_check_leaves_the_budget(self):
+        now = [1000.0]
+        rate_limiter = RateLimiter(clock=lambda: now[0])
+        limit = rate_limiter._limits['admin_user']
+        user_id = 12345
+
+        for _ in range(limit + 1):
+            assert rate_limiter.check(user_id, 'admin_user', record=False).allowed is True
+        assert rate_limiter.get_remaining_attempts(user_id, 'admin_user')[0] == limit
+        assert rate_limiter.check(user_id, 'admin_user', cost=limit).allowed is True
+        assert rate_limiter.check(user_id, 'admin_user', record=False).allowed is False
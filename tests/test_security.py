@@ -0,0 +1,109 @@
+import time
+import jwt
+import pytest
+from unittest.mock import patch
+from config import Config
+from utils import security
+from utils.security import (
+    VerifiedTokenCache, generate_jwt_token, revoke_jwt_token, verify_jwt_token
+)
+
+class MemoryRevocationStore:
+    """The revoked_token table, as seen by every process"""
+
+    def __init__(self):
+        self.rows = {}
+        self.loads = 0
+
+    def add(self, jti, exp):
+        self.rows[jti] = exp
+
+    def load(self):
+        self.loads += 1
+        return list(self.rows.items())
+
+@pytest.fixture(autouse=True)
+def token_cache():
+    cache = VerifiedTokenCache(max_size=2)
+    with patch.object(security, 'token_cache', cache):
+        yield cache
+
+class TestJwtTokens:
+    def test_verified_tokens_are_cached(self, token_cache):
+        token = generate_jwt_token(1)
+        with patch('jwt.decode', wraps=jwt.decode) as decode:
+            assert verify_jwt_token(token)['user_id'] == 1
+            assert verify_jwt_token(token)['user_id'] == 1
+            assert decode.call_count == 1
+        assert token_cache.stats()['hits'] == 1
+        assert token_cache.stats()['misses'] == 1
+
+    def test_callers_cannot_change_cached_claims(self, token_cache):
+        token = generate_jwt_token(1)
+        verify_jwt_token(token)['user_id'] = 2  # verified and cached
+        verify_jwt_token(token)['user_id'] = 3  # served from the cache
+        assert verify_jwt_token(token)['user_id'] == 1
+
+    def test_cache_is_lru_bounded(self, token_cache):
+        tokens = [generate_jwt_token(user_id) for user_id in range(3)]
+        for token in tokens:
+            verify_jwt_token(token)
+        assert token_cache.stats()['size'] == 2
+        assert token_cache.stats()['evictions'] == 1
+        assert token_cache.get(tokens[0]) is None
+
+    def test_cached_tokens_expire(self, token_cache):
+        token = generate_jwt_token(1)
+        verify_jwt_token(token)
+        token_cache._clock = lambda: time.time() + 25 * 3600
+        assert token_cache.get(token) is None
+
+    def test_revoked_tokens_are_rejected(self):
+        token = generate_jwt_token(1)
+        verify_jwt_token(token)
+        revoke_jwt_token(token)
+        with pytest.raises(jwt.InvalidTokenError):
+            verify_jwt_token(token)
+
+    def test_key_rotation(self):
+        keys = {'old': 'old-secret', 'new': 'new-secret'}
+        with patch.object(Config, 'JWT_SECRET_KEYS', keys), \
+                patch.object(Config, 'JWT_ACTIVE_KEY_ID', 'old'):
+            old_token = generate_jwt_token(1)
+        with patch.object(Config, 'JWT_SECRET_KEYS', keys), \
+                patch.object(Config, 'JWT_ACTIVE_KEY_ID', 'new'):
+            new_token = generate_jwt_token(2)
+            # Tokens signed with either active key are accepted
+            assert verify_jwt_token(old_token)['user_id'] == 1
+            assert verify_jwt_token(new_token)['user_id'] == 2
+            assert jwt.get_unverified_header(new_token)['kid'] == 'new'
+
+        # Once a key is retired its tokens stop working, cached or not
+        with patch.object(Config, 'JWT_SECRET_KEYS', {'new': 'new-secret'}):
+            with pytest.raises(jwt.InvalidTokenError):
+                verify_jwt_token(old_token)
+            assert verify_jwt_token(new_token)['user_id'] == 2
+
+    def test_revocations_outlive_the_process(self):
+        store = MemoryRevocationStore()
+        token = generate_jwt_token(1)
+        with patch.object(security, 'token_cache', VerifiedTokenCache(store=store)):
+            revoke_jwt_token(token)
+
+        # A process started later never saw the bus message
+        with patch.object(security, 'token_cache', VerifiedTokenCache(store=store)):
+            with pytest.raises(jwt.InvalidTokenError):
+                verify_jwt_token(token)
+
+    def test_revocations_reload_after_a_bus_gap(self):
+        store = MemoryRevocationStore()
+        cache = VerifiedTokenCache(store=store, reload_interval=3600)
+        assert cache.is_revoked('jti-1') is False
+        assert cache.is_revoked('jti-1') is False
+        assert store.loads == 1
+
+        store.add('jti-1', time.time() + 3600)  # revoked while the bus was down
+        assert cache.is_revoked('jti-1') is False
+        cache.resync()
+        assert cache.is_revoked('jti-1') is True
+        assert store.loads == 2
@@ -1,12 +1,33 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import threading
+import time
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from datetime import datetime, timedelta
+from io import StringIO
 from services.product_service import ProductService
 from services.user_service import UserService
 from services.order_service import OrderService
-from services.admin_service import AdminService
-from services.payment_service import PaymentService
-from models import User, Product, Order, Category, SupportTicket
+from services.admin_service import AdminService, StatisticsSnapshot, statistics_snapshot
+from services.payment_service import PaymentService, WebhookEvent, extract_webhook_event
+from services.delivery_service import DeliveryService
+from services.delivery_queue import DeliveryQueue
+from services.notification_queue import NotificationQueue
+from services.support_service import SupportService
+from services.import_service import ImportService, read_rows
+from services.sales_rollup import backfill, record_sale
+from config import Config
+from app import db
+from models import User, Product, Order, Category, SupportTicket, Role, PlatformCounter
+from utils.permission_cache import PermissionCache, UserPermissions, permission_cache
+from utils.catalog_cache import CatalogCache, CatalogProduct
+from utils.catalog_snapshot import write_snapshot
+from utils.platform_counters import reconcile
+from utils.sales_leaderboard import SalesLeaderboard, sales_leaderboard
+from sqlalchemy import update
 from sqlalchemy.exc import SQLAlchemyError
 import stripe
 
@@ -30,6 +51,10 @@ def admin_service():
 def payment_service():
     return PaymentService()
 
+@pytest.fixture
+def delivery_service():
+    return DeliveryService()
+
 class TestProductService:
     async def test_get_categories(self, product_service):
         # Create test category
@@ -61,6 +86,90 @@ class TestProductService:
         assert len(products) == 1
         assert products[0].name == "Test Product"
 
+    async def test_catalog_cache_follows_commits(self, product_service):
+        category = Category(name="Cached Category")
+        db.session.add(category)
+        db.session.commit()
+        product = Product(name="Cached Product", category_id=category.id, price=5.0,
+                          digital_content="content", active=True)
+        db.session.add(product)
+        db.session.commit()
+
+        cached = await product_service.get_product(product.id)
+        assert isinstance(cached, CatalogProduct)
+        assert cached.category_name == "Cached Category"
+
+        # Cached lookups don't query the database
+        with patch.object(CatalogCache, '_query') as query:
+            assert await product_service.get_product(product.id) == cached
+            query.assert_not_called()
+
+        await product_service.update_product(product.id, {'price': 7.5})
+        assert (await product_service.get_product(product.id)).price == 7.5
+
+        await product_service.delete_product(product.id)
+        assert await product_service.get_products_by_category(category.id) == ()
+
+    def test_expired_catalog_snapshot_compiles_in_background(self, tmp_path):
+        path = str(tmp_path / 'catalog.bin')
+        write_snapshot(path, 1, [], [], compiled_at=time.time() - 120)
+        cache = CatalogCache(ttl=60, snapshot_path=path)
+
+        # The expired file is served and handed to the compiler once
+        with patch.object(CatalogCache, 'compile') as compile, \
+                patch.object(CatalogCache, '_compile_in_background') as compile_in_background:
+            assert cache.snapshot().version == 1
+            assert cache.snapshot().version == 1
+            compile.assert_not_called()
+            compile_in_background.assert_called_once()
+
+            # A commit in this process is compiled before the next lookup
+            cache.invalidate()
+            cache.snapshot()
+            compile.assert_called_once()
+
+class TestImportService:
+    async def test_import_products_from_csv(self):
+        db.session.add(Category(name="Игры"))
+        db.session.commit()
+        rows = (
+            "name,category,price,description,digital_content,active\n"
+            "Ключ,Игры,9.99,Описание,key-1,true\n"
+            "Без цены,Игры,,,key-2,\n"
+            "Подписка,Сервисы,4.5,,key-3,false\n"
+        )
+        progress = []
+
+        report = await ImportService(chunk_size=2).import_products(
+            StringIO(rows), 'csv', progress=lambda report: progress.append(report.rows)
+        )
+        assert (report.rows, report.imported, report.failed) == (3, 1, 2)
+        assert [error.line for error in report.errors] == [3, 4]
+        assert progress == [2, 3]
+        assert Product.query.filter_by(name="Ключ").one().category.name == "Игры"
+
+        report = await ImportService().import_products(
+            StringIO(rows), 'csv', create_categories=True
+        )
+        assert report.imported == 2
+        subscription = Product.query.filter_by(name="Подписка").one()
+        assert subscription.category.name == "Сервисы"
+        assert subscription.active is False
+
+    async def test_import_categories_skips_existing(self):
+        db.session.add(Category(name="Игры"))
+        db.session.commit()
+        rows = '{"name": "Игры"}\n{"name": "Софт", "description": "Программы"}\nnot json\n'
+
+        report = await ImportService().import_categories(StringIO(rows), 'jsonl')
+        assert (report.imported, report.skipped, report.failed) == (1, 1, 1)
+        assert Category.query.filter_by(name="Софт").one().description == "Программы"
+
+    def test_read_rows(self):
+        assert list(read_rows(StringIO('{"a": 1}\n\n[1]\n'), 'jsonl')) == [(1, {'a': 1}), (3, None)]
+        with pytest.raises(ValueError):
+            list(read_rows(StringIO(''), 'xlsx'))
+
 class TestUserService:
     async def test_create_user(self, user_service):
         telegram_user = MagicMock()
@@ -81,6 +190,41 @@ class TestUserService:
         assert profile['username'] == "test_user"
         assert profile['active'] is True
 
+    async def test_user_profile_aggregates_and_follows_orders(self, user_service):
+        user = User(telegram_id=223344, username="profile_user", active=True)
+        category = Category(name="Test Category")
+        db.session.add_all([user, category])
+        db.session.commit()
+        product = Product(name="Test Product", category_id=category.id, price=9.99,
+                          digital_content="test_content", active=True)
+        db.session.add(product)
+        db.session.commit()
+
+        profile = await user_service.get_user_profile(223344)
+        assert (profile['orders_count'], profile['total_spent'], profile['last_order_at']) == (0, 0.0, None)
+
+        db.session.add_all([
+            Order(user_id=user.id, product_id=product.id, status='completed'),
+            Order(user_id=user.id, product_id=product.id, status='pending'),
+        ])
+        db.session.commit()
+
+        profile = await user_service.get_user_profile(223344)
+        assert profile['orders_count'] == 2
+        assert profile['total_spent'] == pytest.approx(9.99)
+        assert profile['last_order_at'] is not None
+
+        # Served from the cache until the user's orders change again
+        with patch('services.user_service.db') as mock_db:
+            assert await user_service.get_user_profile(223344) == profile
+            mock_db.session.query.assert_not_called()
+
+        # Total spent is what the orders were charged, not the current price
+        product.price = 19.99
+        db.session.add(Order(user_id=user.id, product_id=product.id, status='completed'))
+        db.session.commit()
+        assert (await user_service.get_user_profile(223344))['total_spent'] == pytest.approx(29.98)
+
 class TestOrderService:
     async def test_create_order(self, order_service):
         # Create test user and product
@@ -110,6 +254,7 @@ class TestOrderService:
             assert order.product_id == product.id
             assert order.status == "pending"
             assert order.payment_id == "test_session_id"
+            assert order.amount == 9.99
 
     async def test_invalid_order_creation(self, order_service):
         # Test creating order with invalid user
@@ -158,6 +303,44 @@ class TestOrderService:
             invalid_order = await order_service.update_order_status(order.id, "pending")
             assert invalid_order is None
 
+    async def test_sales_rollup_follows_status_changes(self, order_service, admin_service):
+        user = User(telegram_id=123456, username="test_user", active=True)
+        category = Category(name="Test Category")
+        db.session.add_all([user, category])
+        db.session.commit()
+        product = Product(name="Test Product", category_id=category.id, price=10.0,
+                          digital_content="test_content", active=True)
+        db.session.add(product)
+        db.session.commit()
+        yesterday = datetime.utcnow() - timedelta(days=1)
+        orders = [Order(user_id=user.id, product_id=product.id, created_at=yesterday) for _ in range(3)]
+        db.session.add_all(orders)
+        db.session.commit()
+
+        for order in orders:
+            await order_service.update_order_status(order.id, 'completed')
+        await order_service.update_order_status(orders[0].id, 'refunded')
+
+        trends = await admin_service.get_sales_trends(7)
+        assert len(trends['dates']) == 8
+        day = trends['dates'].index(yesterday.strftime('%Y-%m-%d'))
+        assert (trends['sales'][day], trends['revenue'][day]) == (2, 20.0)
+        assert sum(trends['sales']) == 2
+
+        # Past days keep what was charged after a price change
+        product.price = 50.0
+        db.session.commit()
+        assert await admin_service.get_sales_trends(7) == trends
+
+        # Rebuilding from the orders table gives the same rollup
+        assert backfill() == 1
+        assert await admin_service.get_sales_trends(7) == trends
+
+    def test_sales_rollup_rejects_unsupported_databases(self):
+        with patch.object(db.engine.dialect, 'name', 'mysql'):
+            with pytest.raises(ValueError, match='mysql'):
+                record_sale(Order(product_id=1), 1)
+
 class TestPaymentService:
     async def test_create_payment_session(self, payment_service):
         # Create test order
@@ -214,6 +397,100 @@ class TestPaymentService:
             result = await payment_service.verify_webhook_signature(b"payload", "invalid_sig")
             assert result is False
 
+    async def test_parse_webhook_verifies_and_extracts_once(self, payment_service):
+        secret = 'whsec_test'
+        payload = json.dumps({
+            'id': 'evt_1',
+            'type': 'payment_intent.payment_failed',
+            'data': {'object': {
+                'object': 'payment_intent',
+                'id': 'pi_1',
+                'payment_method_types': ['card'],
+                'last_payment_error': {'code': 'card_declined', 'message': "Card's declined"},
+                'charges': {'data': [{'id': 'ch_1'}] * 100},
+            }},
+        }).encode()
+        timestamp = int(time.time())
+        digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+        header = f"t={timestamp},v1={digest}"
+
+        with patch.object(Config, 'STRIPE_WEBHOOK_SECRET', secret), \
+                patch('stripe.Webhook.construct_event') as construct_event:
+            event = await payment_service.parse_webhook(payload, header)
+            assert await payment_service.parse_webhook(payload, "t=1,v1=bad") is None
+            construct_event.assert_not_called()
+
+        assert event.payment_id == 'pi_1'
+        assert event.status == 'failed'
+        assert event.fields['failure_reason'] == 'card_declined'
+        # Only whitelisted fields are kept
+        assert 'charges' not in event.fields
+
+    def test_extract_checkout_session_event(self):
+        event = extract_webhook_event({
+            'id': 'evt_2',
+            'type': 'checkout.session.completed',
+            'data': {'object': {'object': 'checkout.session', 'id': 'cs_1', 'payment_intent': 'pi_2'}},
+        })
+        # Orders store the Checkout Session id
+        assert event.payment_id == 'cs_1'
+        assert event.status == 'succeeded'
+
+    async def test_signed_webhook_completes_order(self, payment_service, order_service):
+        secret = 'whsec_test'
+        user = User(telegram_id=123456, username="buyer", active=True)
+        category = Category(name="Test Category")
+        db.session.add_all([user, category])
+        db.session.commit()
+        product = Product(name="Test Product", category_id=category.id, price=9.99,
+                          digital_content="test_content", active=True)
+        db.session.add(product)
+        db.session.commit()
+        checkout_order = Order(user_id=user.id, product_id=product.id, payment_id='cs_test_1')
+        intent_order = Order(user_id=user.id, product_id=product.id, payment_id='cs_test_2')
+        db.session.add_all([checkout_order, intent_order])
+        db.session.commit()
+
+        def signed(event, timestamp=None):
+            payload = json.dumps(event).encode()
+            timestamp = timestamp or int(time.time())
+            digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+            return payload, f"t={timestamp},v1={digest}"
+
+        checkout_completed = signed({
+            'id': 'evt_checkout', 'type': 'checkout.session.completed',
+            'data': {'object': {
+                'object': 'checkout.session', 'id': 'cs_test_1', 'payment_intent': 'pi_test_1',
+                'payment_method_types': ['card'], 'metadata': {'order_id': str(checkout_order.id)},
+            }},
+        })
+        intent_succeeded = signed({
+            'id': 'evt_intent', 'type': 'payment_intent.succeeded',
+            'data': {'object': {
+                'object': 'payment_intent', 'id': 'pi_test_2',
+                'metadata': {'order_id': str(intent_order.id)},
+            }},
+        })
+
+        with patch.object(Config, 'STRIPE_WEBHOOK_SECRET', secret):
+            for payload, header in (checkout_completed, intent_succeeded):
+                event = await payment_service.parse_webhook(payload, header)
+                assert await order_service.process_webhook_event(event) is True
+
+            # Signed too long ago: a replay
+            stale = signed({'id': 'evt_old', 'type': 'checkout.session.completed', 'data': {'object': {}}},
+                           timestamp=int(time.time()) - 3600)
+            assert await payment_service.parse_webhook(*stale) is None
+
+        assert db.session.get(Order, checkout_order.id).status == 'completed'
+        assert db.session.get(Order, intent_order.id).status == 'completed'
+
+    async def test_unhandled_webhook_events_are_acknowledged(self, order_service):
+        event = WebhookEvent('evt_3', 'customer.created', None, None, {})
+        with patch.object(order_service, 'process_payment_webhook') as process:
+            assert await order_service.process_webhook_event(event) is True
+            process.assert_not_called()
+
     async def test_refund_processing(self, payment_service):
         with patch('stripe.Refund.create') as mock_refund:
             # Test successful refund
@@ -257,6 +534,201 @@ class TestAdminService:
         assert 'active_products' in stats
 
 
+    async def test_permission_cache_follows_commits(self, admin_service):
+        user = User(telegram_id=654321, username='cached_user', active=True)
+        db.session.add(user)
+        db.session.commit()
+        assert permission_cache.get(654321).active is True
+
+        user.active = False
+        user.roles.append(Role(name='support'))
+        db.session.commit()
+
+        permissions = permission_cache.get(654321)
+        assert permissions.active is False
+        assert permissions.has_any_role(['support'])
+
+        # Cached lookups don't query the database
+        with patch.object(PermissionCache, '_query') as query:
+            permission_cache.get(654321)
+            query.assert_not_called()
+
+    def test_permission_cache_reload_is_single_flight(self):
+        checked, checking = set(), threading.Condition()
+
+        def clock():
+            with checking:
+                checked.add(threading.get_ident())
+                checking.notify_all()
+            return 0.0
+
+        def query(*criteria):
+            # Hold the reload until every lookup has found the cache empty
+            with checking:
+                checking.wait_for(lambda: len(checked) >= 5, timeout=1)
+            return {1: UserPermissions(1, 'user', True, frozenset())}
+
+        cache = PermissionCache(ttl=60, clock=clock)
+        results = []
+        with patch.object(PermissionCache, '_query', side_effect=query) as load:
+            threads = [threading.Thread(target=lambda: results.append(cache.get(1))) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        assert (load.call_count, cache.reloads) == (1, 1)
+        assert [permissions.user_id for permissions in results] == [1] * 5
+
+    async def test_product_export_counts_completed_orders(self, admin_service):
+        user = User(telegram_id=123456, username="buyer", active=True)
+        category = Category(name="Test Category")
+        db.session.add_all([user, category])
+        db.session.commit()
+        sold = Product(name="Sold", category_id=category.id, price=5.0, digital_content="a", active=True)
+        unsold = Product(name="Unsold", category_id=category.id, price=7.0, digital_content="b", active=False)
+        db.session.add_all([sold, unsold])
+        db.session.commit()
+        db.session.add_all([
+            Order(user_id=user.id, product_id=sold.id, status='completed'),
+            Order(user_id=user.id, product_id=sold.id, status='completed'),
+            Order(user_id=user.id, product_id=sold.id, status='pending'),
+        ])
+        db.session.commit()
+
+        rows = list(admin_service.iter_product_export(batch_size=1))
+        assert [row[:6] for row in rows] == [
+            (sold.id, "Sold", "Test Category", 5.0, True, 2),
+            (unsold.id, "Unsold", "Test Category", 7.0, False, 0),
+        ]
+        assert rows[0][7] is not None
+
+    async def test_statistics_counters_follow_writes(self, admin_service):
+        user = User(telegram_id=123456, username="buyer", active=True)
+        category = Category(name="Test Category")
+        db.session.add_all([user, category])
+        db.session.commit()
+        product = Product(name="Counted", category_id=category.id, price=10.0, digital_content="a")
+        db.session.add(product)
+        db.session.commit()
+
+        # Seeded the way migrate.py does
+        reconcile()
+        stats = await admin_service.get_statistics()
+        assert (stats['total_users'], stats['active_products'], stats['total_revenue']) == (1, 1, 0)
+
+        order = Order(user_id=user.id, product_id=product.id)
+        db.session.add_all([order, SupportTicket(user_id=user.id, subject="Help", message="Counted ticket")])
+        db.session.commit()
+        order.status = 'completed'
+        user.active = False
+        db.session.commit()
+        product.price = 12.0
+        db.session.commit()
+
+        stats = await admin_service.get_statistics()
+        assert stats['total_orders'] == 1
+        assert stats['completed_orders'] == 1
+        assert stats['active_users'] == 0
+        assert stats['pending_tickets'] == 1
+        # Charged at the price when the order was placed
+        assert stats['total_revenue'] == 10.0
+
+        db.session.execute(update(PlatformCounter).where(PlatformCounter.name == 'users').values(value=99))
+        db.session.commit()
+        assert reconcile() == {'users': (99, 1)}
+        assert (await admin_service.get_statistics())['total_users'] == 1
+
+    async def test_top_products_and_leaderboard(self, admin_service, order_service):
+        user = User(telegram_id=123456, username="buyer", active=True)
+        category = Category(name="Test Category")
+        db.session.add_all([user, category])
+        db.session.commit()
+        cheap = Product(name="Cheap", category_id=category.id, price=1.0, digital_content="a", active=True)
+        pricey = Product(name="Pricey", category_id=category.id, price=10.0, digital_content="b", active=True)
+        db.session.add_all([cheap, pricey])
+        db.session.commit()
+        pending = Order(user_id=user.id, product_id=pricey.id, status='pending')
+        db.session.add_all([
+            *(Order(user_id=user.id, product_id=cheap.id, status='completed') for _ in range(3)),
+            Order(user_id=user.id, product_id=pricey.id, status='completed'),
+            pending,
+        ])
+        db.session.commit()
+
+        by_revenue = await admin_service.get_top_products(2)
+        assert [(p['name'], p['sales'], p['revenue']) for p in by_revenue] == [("Pricey", 1, 10.0), ("Cheap", 3, 3.0)]
+        assert [p['name'] for p in await admin_service.get_top_products(1, by='sales')] == ["Cheap"]
+
+        sales_leaderboard.invalidate()
+        assert await admin_service.get_leaderboard(2) == by_revenue
+
+        # A completion moves the product in place, without querying
+        await order_service.update_order_status(pending.id, 'completed')
+        with patch.object(SalesLeaderboard, '_query') as query:
+            assert (await admin_service.get_leaderboard(1, by='sales'))[0]['sales'] == 3
+            assert (await admin_service.get_leaderboard(1))[0] == {
+                'id': pricey.id, 'name': "Pricey", 'sales': 2, 'revenue': 20.0
+            }
+            query.assert_not_called()
+        assert await admin_service.get_top_products(2) == await admin_service.get_leaderboard(2)
+
+        # Repricing doesn't change what past orders were charged
+        pricey.price = 20.0
+        db.session.commit()
+        assert (await admin_service.get_top_products(1))[0]['revenue'] == 20.0
+        sales_leaderboard.invalidate()
+        assert (await admin_service.get_leaderboard(1))[0]['revenue'] == 20.0
+
+    async def test_window_statistics(self, admin_service):
+        reconcile()
+        now = datetime.utcnow()
+        user = User(telegram_id=123456, username="recent_user", active=True, created_at=now)
+        db.session.add_all([user, User(telegram_id=654321, username="old_user", created_at=now - timedelta(days=10))])
+        db.session.commit()
+        db.session.add_all([
+            SupportTicket(user_id=user.id, subject="A", message="Answered", status='answered',
+                          created_at=now - timedelta(days=2), last_response_at=now - timedelta(days=2, hours=-2)),
+            SupportTicket(user_id=user.id, subject="B", message="Open", created_at=now),
+        ])
+        db.session.commit()
+
+        statistics_snapshot.invalidate()
+        stats = await admin_service.get_statistics()
+        assert stats['time_stats']['new_users_24h'] == 1
+        assert stats['time_stats']['new_users_30d'] == 2
+        assert stats['support_stats']['tickets_24h'] == 1
+        assert stats['support_stats']['open_tickets'] == 1
+        assert stats['support_stats']['average_response_time'] == pytest.approx(2.0)
+
+    def test_statistics_snapshot_is_single_flight(self):
+        clock = [0.0]
+        checked, checking = set(), threading.Condition()
+        loads, results = [], []
+
+        def now():
+            with checking:
+                checked.add(threading.get_ident())
+                checking.notify_all()
+            return clock[0]
+
+        def load():
+            loads.append(1)
+            # Hold the query until every caller has found the snapshot stale
+            with checking:
+                checking.wait_for(lambda: len(checked) >= 5, timeout=1)
+            return len(loads)
+
+        snapshot = StatisticsSnapshot(ttl=30, clock=now)
+        threads = [threading.Thread(target=lambda: results.append(snapshot.get(load))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert (len(loads), results) == (1, [1] * 5)
+
+        clock[0] = 31
+        assert snapshot.get(load) == 2
+
 class TestAdminServiceExtended:
     async def test_user_filtering(self, admin_service):
         # Create test users
@@ -344,6 +816,7 @@ class TestAdminServiceExtended:
         assert updated_ticket.last_response_at is not None
 
     async def test_detailed_statistics(self, admin_service):
+        reconcile()
         # Create test data
         user = User(telegram_id=123456, username="test_user", active=True)
         db.session.add(user)
@@ -419,4 +892,161 @@ class TestAdminServiceExtended:
         updated_product = Product.query.get(product.id)
         assert updated_product.name == "Updated Product"
         assert updated_product.price == 19.99
-        assert updated_product.active is False
\ No newline at end of file
+        assert updated_product.active is False
+
+class TestDeliveryService:
+    async def test_classify_content(self, tmp_path):
+        asset = tmp_path / "asset.zip"
+        asset.write_bytes(b"data")
+
+        assert DeliveryService.classify_content("https://example.com/file.zip") == 'url'
+        assert DeliveryService.classify_content(str(asset)) == 'file'
+        assert DeliveryService.classify_content(f"file://{asset}") == 'file'
+        assert DeliveryService.classify_content("LICENSE-KEY-1234") == 'text'
+
+    async def test_sends_cached_file_id(self, delivery_service):
+        bot = MagicMock()
+        bot.send_document = AsyncMock()
+        product = MagicMock(digital_content="https://example.com/file.zip")
+        product.name = "Test Product"
+
+        delivery_service._file_ids[product.digital_content] = "cached_file_id"
+        await delivery_service.deliver(bot, 42, product)
+
+        bot.send_document.assert_awaited_once()
+        assert bot.send_document.call_args[1]['document'] == "cached_file_id"
+
+    async def test_uploads_once(self, delivery_service):
+        bot = MagicMock()
+        document = MagicMock(file_id="new_file_id", file_unique_id="unique")
+        bot.send_document = AsyncMock(return_value=MagicMock(document=document))
+        product = MagicMock(digital_content="https://example.com/file.zip")
+        product.name = "Test Product"
+
+        with patch.object(delivery_service, 'get_file_id', AsyncMock(return_value=None)), \
+             patch.object(delivery_service, '_remember', AsyncMock()) as mock_remember:
+            await delivery_service.deliver(bot, 42, product)
+
+        assert bot.send_document.call_args[1]['document'] == product.digital_content
+        mock_remember.assert_awaited_once_with(product.digital_content, document)
+        # The upload lock goes away with the last delivery that used it
+        assert len(delivery_service._upload_locks) == 0
+
+
+class TestDeliveryQueue:
+    async def test_enqueue_requires_running_queue(self, delivery_service):
+        queue = DeliveryQueue(delivery_service)
+        assert queue.enqueue(1) is False
+
+    async def test_enqueue_deduplicates(self, delivery_service):
+        queue = DeliveryQueue(delivery_service, concurrency=1, sweep_interval=3600)
+        with patch.object(queue, '_deliver', AsyncMock()):
+            await queue.start(MagicMock())
+            try:
+                assert queue.enqueue(1) is True
+                assert queue.enqueue(1) is False
+            finally:
+                await queue.stop()
+
+    async def test_retry_delay_grows(self, delivery_service):
+        queue = DeliveryQueue(delivery_service)
+        with patch('random.uniform', return_value=1.0):
+            assert queue._retry_delay(1) < queue._retry_delay(2) < queue._retry_delay(3)
+            assert queue._retry_delay(50) == Config.DELIVERY_RETRY_MAX_DELAY
+
+    async def test_unexpected_errors_are_retried_then_failed(self, delivery_service):
+        user = User(telegram_id=123456, username="buyer", active=True)
+        category = Category(name="Test Category")
+        db.session.add_all([user, category])
+        db.session.commit()
+        product = Product(name="Test Product", category_id=category.id, price=5.0,
+                          digital_content="content", active=True)
+        db.session.add(product)
+        db.session.commit()
+        order = Order(user_id=user.id, product_id=product.id, status='completed', delivery_status='queued')
+        db.session.add(order)
+        db.session.commit()
+
+        queue = DeliveryQueue(delivery_service, max_attempts=2)
+        queue._bot = MagicMock()
+        with patch.object(delivery_service, 'deliver', AsyncMock(side_effect=ValueError("bad content"))), \
+             patch.object(queue, 'enqueue') as enqueue:
+            await queue._deliver(order.id)
+            enqueue.assert_called_once()
+            db.session.refresh(order)
+            assert (order.delivery_status, order.delivery_attempts) == ('queued', 1)
+            assert order.delivery_error == "bad content"
+
+            await queue._deliver(order.id)
+            enqueue.assert_called_once()
+            db.session.refresh(order)
+            assert (order.delivery_status, order.delivery_attempts) == ('failed', 2)
+
+    async def test_completed_order_is_enqueued(self):
+        delivery_queue = MagicMock()
+        order_service = OrderService(delivery_queue=delivery_queue)
+        order = MagicMock(id=7, status='pending')
+
+        with patch.object(order_service, 'get_order', AsyncMock(return_value=order)), \
+             patch('services.order_service.db'), \
+             patch('services.order_service.record_sale') as record_sale, \
+             patch('services.order_service.sales_leaderboard'):
+            await order_service.update_order_status(7, 'completed')
+
+        assert order.delivery_status == 'queued'
+        record_sale.assert_called_once_with(order, 1)
+        delivery_queue.enqueue.assert_called_once_with(7)
+
+
+class TestSupportService:
+    async def test_create_ticket_commits_in_batches(self):
+        user = User(telegram_id=123456, username="test_user", active=True)
+        db.session.add(user)
+        db.session.commit()
+
+        support_service = SupportService(batch_size=2, flush_interval=60)
+        with patch.object(support_service, 'flush', wraps=support_service.flush) as mock_flush:
+            ticket_ids = await asyncio.gather(
+                support_service.create_ticket(123456, "First problem description"),
+                support_service.create_ticket(123456, "Second problem description"),
+            )
+
+        assert mock_flush.call_count == 1
+        assert len(set(ticket_ids)) == 2
+        assert SupportTicket.query.filter(SupportTicket.id.in_(ticket_ids)).count() == 2
+
+    async def test_create_ticket_unknown_user(self):
+        support_service = SupportService()
+        assert await support_service.create_ticket(999999, "Problem description") is None
+
+    async def test_new_ticket_notifies_admins(self):
+        user = User(telegram_id=123456, username="test_user", active=True)
+        db.session.add(user)
+        db.session.commit()
+
+        notifier = MagicMock()
+        support_service = SupportService(notifier, batch_size=1)
+        with patch.object(support_service, '_get_admin_chat_ids', return_value=[1, 2]):
+            ticket_id = await support_service.create_ticket(123456, "Problem description")
+
+        notifier.send_many.assert_called_once()
+        chat_ids, text = notifier.send_many.call_args[0]
+        assert chat_ids == [1, 2]
+        assert f"#{ticket_id}" in text
+
+    async def test_notification_queue_not_running(self):
+        assert NotificationQueue().send(1, "text") is False
+
+
+class TestFraudTracking:
+    async def test_activity_expires(self, payment_service):
+        with patch('services.payment_service.monotonic', return_value=1000.0):
+            for _ in range(payment_service._fraud_check_threshold):
+                assert not await payment_service._check_suspicious_activity(123456)
+            assert await payment_service._check_suspicious_activity(123456)
+
+        later = 1000.0 + payment_service._fraud_check_window + 1
+        with patch('services.payment_service.monotonic', return_value=later):
+            assert not await payment_service._check_suspicious_activity(123456)
+
+        assert payment_service.get_tracking_stats()['tracked_keys'] == 1
@@ -0,0 +1,69 @@
+import pytest
+from utils.validators import (
+    BOT_MESSAGE, PRODUCT_FORM, PRODUCT_IDS_FORM, SUPPORT_MESSAGE, Field, InputValidator, Schema,
+    format_errors
+)
+
+class TestSanitize:
+    def test_strips_tags_and_injection_characters(self):
+        text = "<b>hi</b> it's a-b; rm|x `y` & \\z"
+        assert InputValidator.sanitize_input(text) == "hi its ab rmx y  z"
+
+    def test_clean_text_is_unchanged(self):
+        assert InputValidator.sanitize_input("Привет, заказ #12") == "Привет, заказ #12"
+
+    def test_length_is_limited(self):
+        assert len(InputValidator.sanitize_input("a" * 5000)) == 1000
+
+class TestSchemas:
+    def test_product_form_parses_values(self):
+        data, errors = PRODUCT_FORM.validate({'name': ' Игра ', 'price': '9.99', 'active': 'true'})
+        assert errors == []
+        assert data == {'name': 'Игра', 'price': 9.99, 'description': None, 'active': True}
+
+    def test_product_form_reports_every_bad_field(self):
+        data, errors = PRODUCT_FORM.validate({'name': '', 'price': 'abc'})
+        assert [(error.field, error.code) for error in errors] == [('name', 'required'), ('price', 'type')]
+        assert 'price' in format_errors(errors)
+
+    @pytest.mark.parametrize('price', ['0', '-1', '1000000', 'nan', 'inf'])
+    def test_product_price_bounds(self, price):
+        _, errors = PRODUCT_FORM.validate({'name': 'x', 'price': price})
+        assert errors
+
+    def test_product_name_fits_the_column(self):
+        _, errors = PRODUCT_FORM.validate({'name': 'x' * 100, 'price': '1'})
+        assert errors == []
+        _, errors = PRODUCT_FORM.validate({'name': 'x' * 101, 'price': '1'})
+        assert [(error.field, error.code) for error in errors] == [('name', 'max_length')]
+
+    def test_many_field_collects_values(self):
+        data, errors = PRODUCT_IDS_FORM.validate({'ids[]': ['1', '2']})
+        assert errors == []
+        assert data['ids[]'] == [1, 2]
+
+        _, errors = PRODUCT_IDS_FORM.validate({'ids[]': ['1', 'x']})
+        assert errors[0].field == 'ids[1]'
+
+        _, errors = PRODUCT_IDS_FORM.validate({})
+        assert errors[0].code == 'required'
+
+    def test_bot_messages_are_sanitized(self):
+        data, errors = BOT_MESSAGE.validate({'text': '<i>привет</i>'})
+        assert errors == []
+        assert data['text'] == 'привет'
+
+        _, errors = SUPPORT_MESSAGE.validate({'text': 'коротко'})
+        assert errors[0].code == 'min_length'
+
+    def test_pattern_and_choices(self):
+        schema = Schema({
+            'code': Field(pattern=r'^[A-Z]{3}$'),
+            'kind': Field(choices=('a', 'b')),
+        })
+        _, errors = schema.validate({'code': 'abc', 'kind': 'c'})
+        assert [error.code for error in errors] == ['pattern', 'choice']
+
+    def test_unknown_field_kind(self):
+        with pytest.raises(ValueError):
+            Field('decimal')
@@ -0,0 +1,248 @@
+import fcntl
+import threading
+import time
+from itertools import chain
+from typing import Callable, Dict, NamedTuple, Optional, Tuple, Union
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from config import Config
+from extensions import db
+from models import Category, Product
+from utils.catalog_snapshot import CatalogCategory, CatalogProduct, MappedCatalog, SnapshotFile, write_snapshot
+from utils.invalidation_bus import invalidation_bus
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogSnapshot(NamedTuple):
+    version: int
+    loaded_at: float
+    categories: Tuple[CatalogCategory, ...]
+    products: Dict[int, CatalogProduct]
+    # category id -> active products, in id order
+    by_category: Dict[int, Tuple[CatalogProduct, ...]]
+
+    def get_categories(self) -> Tuple[CatalogCategory, ...]:
+        return self.categories
+
+    def get_products_by_category(self, category_id: int) -> Tuple[CatalogProduct, ...]:
+        return self.by_category.get(category_id, ())
+
+    def get_product(self, product_id: int) -> Optional[CatalogProduct]:
+        return self.products.get(product_id)
+
+
+class CatalogCache:
+    """Categories and products as immutable records, so they can be handed to
+    any caller without a session.
+
+    By default the whole catalog is read in two queries into an in-memory
+    snapshot that is replaced, never modified. It is reloaded on the first
+    lookup after Config.CATALOG_CACHE_TTL seconds, which picks up changes made
+    by other processes, or after the version moves on: every commit in this
+    process that touches a Product or Category bumps it (see the session hooks
+    below).
+
+    With Config.CATALOG_SNAPSHOT_PATH set, the catalog is instead compiled to a
+    binary snapshot file that every worker maps (see utils.catalog_snapshot).
+    A commit here recompiles it in the background, other processes swap to the
+    new file within Config.CATALOG_SNAPSHOT_CHECK_INTERVAL seconds, and lookups
+    in this process compile first if they would otherwise miss the commit.
+    A file older than the TTL keeps being served while the background
+    compiler replaces it.
+    """
+
+    def __init__(self, ttl: float = None, clock: Callable[[], float] = time.monotonic,
+                 snapshot_path: str = None):
+        self._ttl = ttl or Config.CATALOG_CACHE_TTL
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._version = 0
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self.hits = 0
+        self.reloads = 0
+
+        snapshot_path = snapshot_path or Config.CATALOG_SNAPSHOT_PATH
+        self._file = SnapshotFile(snapshot_path, Config.CATALOG_SNAPSHOT_CHECK_INTERVAL) if snapshot_path else None
+        self._compiled_version = 0
+        self._compile_lock = threading.Lock()
+        self._compile_requested = threading.Event()
+        self._compiler: Optional[threading.Thread] = None
+        self._expired_version: Optional[int] = None  # snapshot file already sent to the compiler
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def snapshot(self) -> Union[CatalogSnapshot, MappedCatalog]:
+        if self._file is not None:
+            return self._mapped()
+        snapshot = self._snapshot
+        if (snapshot is None or snapshot.version != self._version
+                or self._clock() - snapshot.loaded_at > self._ttl):
+            return self.reload()
+        self.hits += 1
+        return snapshot
+
+    def get_categories(self) -> Tuple[CatalogCategory, ...]:
+        return self.snapshot().get_categories()
+
+    def get_products_by_category(self, category_id: int) -> Tuple[CatalogProduct, ...]:
+        return self.snapshot().get_products_by_category(category_id)
+
+    def get_product(self, product_id: int) -> Optional[CatalogProduct]:
+        return self.snapshot().get_product(product_id)
+
+    def reload(self) -> CatalogSnapshot:
+        # A commit during the load leaves the snapshot one version behind,
+        # so the next lookup loads again rather than keeping stale rows
+        version = self._version
+        categories, products = self._query()
+        by_category: Dict[int, list] = {}
+        for product in products.values():
+            if product.active:
+                by_category.setdefault(product.category_id, []).append(product)
+
+        snapshot = CatalogSnapshot(
+            version, self._clock(), categories, products,
+            {category_id: tuple(items) for category_id, items in by_category.items()}
+        )
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version <= version:
+                self._snapshot = snapshot
+            self.reloads += 1
+        logger.debug(f"Loaded catalog version {version}: {len(categories)} categories, {len(products)} products")
+        return snapshot
+
+    def _mapped(self) -> MappedCatalog:
+        mapped = self._file.current()
+        if mapped is None or self._compiled_version != self._version:
+            # Nothing to serve yet, or a commit here that lookups must see
+            return self.compile()
+        if time.time() - mapped.compiled_at > self._ttl and self._expired_version != mapped.version:
+            self._expired_version = mapped.version
+            self._compile_in_background()
+        self.hits += 1
+        return mapped
+
+    def compile(self) -> MappedCatalog:
+        """Write a fresh snapshot file from the database and map it.
+
+        Compilers in all processes take an exclusive lock on the file first,
+        so the last one to write has also read last and no commit is lost.
+        """
+        version = self._version
+        with self._compile_lock, open(f"{self._file.path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._file.refresh()
+            previous = self._file.current()
+            categories, products = self._query()
+            write_snapshot(self._file.path, previous.version + 1 if previous else 1, categories, products.values())
+            self._file.refresh()
+            mapped = self._file.current()
+
+        with self._lock:
+            self._compiled_version = max(self._compiled_version, version)
+            self.reloads += 1
+        logger.info(f"Compiled catalog snapshot {mapped.version}: {len(categories)} categories, {len(products)} products")
+        invalidation_bus.publish('catalog')
+        return mapped
+
+    def _compile_in_background(self) -> None:
+        # Commits in a burst coalesce into one compile
+        self._compile_requested.set()
+        with self._lock:
+            if self._compiler is None:
+                self._compiler = threading.Thread(target=self._compile_loop, name='catalog-compiler', daemon=True)
+                self._compiler.start()
+
+    def _compile_loop(self) -> None:
+        while True:
+            self._compile_requested.wait()
+            self._compile_requested.clear()
+            try:
+                self.compile()
+            except Exception as e:
+                logger.error(f"Error compiling catalog snapshot: {str(e)}")
+                # Let the next lookup of an expired file ask again
+                self._expired_version = None
+
+    def invalidate(self) -> None:
+        """Drop the catalog after a commit in this process and tell the others"""
+        with self._lock:
+            self._version += 1
+        if self._file is not None:
+            # SQL can't run inside the commit hook that calls this; the
+            # compiler publishes once the new file is in place
+            self._compile_in_background()
+        else:
+            invalidation_bus.publish('catalog')
+
+    def apply_remote_change(self, keys: Optional[list] = None) -> None:
+        """Another process changed the catalog (the snapshot is all or nothing)"""
+        if self._file is not None:
+            self._file.refresh()
+            return
+        with self._lock:
+            self._version += 1
+
+    def stats(self) -> Dict[str, int]:
+        if self._file is not None:
+            mapped = self._file.current()
+            return {
+                'version': self._version,
+                'snapshot_version': mapped.version if mapped else 0,
+                'hits': self.hits,
+                'reloads': self.reloads,
+                'swaps': self._file.swaps,
+            }
+        snapshot = self._snapshot
+        return {
+            'version': self._version,
+            'products': len(snapshot.products) if snapshot else 0,
+            'hits': self.hits,
+            'reloads': self.reloads,
+        }
+
+    @staticmethod
+    def _query() -> Tuple[Tuple[CatalogCategory, ...], Dict[int, CatalogProduct]]:
+        from app import app
+
+        with app.app_context():
+            categories = tuple(
+                CatalogCategory(*row) for row in db.session.query(
+                    Category.id, Category.name, Category.description
+                ).order_by(Category.id)
+            )
+            rows = db.session.query(
+                Product.id, Product.name, Product.description, Product.price,
+                Product.category_id, Category.name, Product.active
+            ).join(Category, Category.id == Product.category_id).order_by(Product.id)
+
+            products = {
+                row[0]: CatalogProduct(*row[:6], bool(row[6]))
+                for row in rows
+            }
+        return categories, products
+
+
+catalog_cache = CatalogCache()
+invalidation_bus.subscribe('catalog', catalog_cache.apply_remote_change)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_catalog_changes(session, flush_context):
+    if any(isinstance(obj, (Product, Category)) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['catalog_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_catalog_changes(session):
+    if session.info.pop('catalog_changed', False):
+        catalog_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_catalog_changes(session):
+    session.info.pop('catalog_changed', None)
@@ -0,0 +1,231 @@
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+# Catalog records handed out by ProductService. Both the in-memory catalog and
+# the mapped snapshot file produce them; they carry no session state.
+
+
+class CatalogCategory(NamedTuple):
+    id: int
+    name: str
+    description: Optional[str]
+
+
+class CatalogProduct(NamedTuple):
+    id: int
+    name: str
+    description: Optional[str]
+    price: float
+    category_id: int
+    category_name: str
+    active: bool
+
+
+# File layout, little-endian:
+#   header
+#   categories   sorted by id, each with the range of its products below
+#   products     sorted by (category_id, id)
+#   product ids  (id, position in products) sorted by id
+#   strings      UTF-8, referenced by (offset, length) from the strings start
+# Lookups binary-search the mapped tables and only decode the rows they return.
+MAGIC = b'PECS'
+FORMAT = 1
+HEADER = struct.Struct('<4sHxxQdIIQ')  # magic, format, version, compiled_at, categories, products, strings offset
+CATEGORY = struct.Struct('<iIIIIII')  # id, first product, product count, name, description
+PRODUCT = struct.Struct('<iidIIIIB')  # id, category_id, price, name, description, active
+PRODUCT_ID = struct.Struct('<iI')
+NO_STRING = 0xFFFFFFFF  # length of a NULL description
+
+
+class _Strings:
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.size = 0
+
+    def add(self, value: Optional[str]) -> Tuple[int, int]:
+        if value is None:
+            return 0, NO_STRING
+        data = value.encode('utf-8')
+        offset = self.size
+        self.chunks.append(data)
+        self.size += len(data)
+        return offset, len(data)
+
+
+def write_snapshot(path: str, version: int, categories: Iterable[CatalogCategory],
+                   products: Iterable[CatalogProduct], compiled_at: float = None) -> None:
+    """Write a snapshot to a temporary file and move it over `path` atomically.
+
+    Readers that still map the previous file keep a consistent view of it until
+    they notice the swap.
+    """
+    categories = sorted(categories, key=lambda category: category.id)
+    known = {category.id for category in categories}
+    products = sorted(
+        (product for product in products if product.category_id in known),
+        key=lambda product: (product.category_id, product.id)
+    )
+    strings = _Strings()
+
+    ranges = {}
+    for position, product in enumerate(products):
+        first, count = ranges.get(product.category_id, (position, 0))
+        ranges[product.category_id] = (first, count + 1)
+
+    category_rows = b''.join(
+        CATEGORY.pack(category.id, *ranges.get(category.id, (0, 0)),
+                      *strings.add(category.name), *strings.add(category.description))
+        for category in categories
+    )
+    product_rows = b''.join(
+        PRODUCT.pack(product.id, product.category_id, product.price,
+                     *strings.add(product.name), *strings.add(product.description), bool(product.active))
+        for product in products
+    )
+    id_rows = b''.join(
+        PRODUCT_ID.pack(product_id, position)
+        for product_id, position in sorted((product.id, position) for position, product in enumerate(products))
+    )
+
+    strings_offset = HEADER.size + len(category_rows) + len(product_rows) + len(id_rows)
+    header = HEADER.pack(MAGIC, FORMAT, version, time.time() if compiled_at is None else compiled_at,
+                         len(categories), len(products), strings_offset)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.catalog-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(category_rows)
+            f.write(product_rows)
+            f.write(id_rows)
+            f.writelines(strings.chunks)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class MappedCatalog:
+    """Read-only view of one snapshot file, mapped into memory.
+
+    Every worker mapping the same file shares its pages through the OS page
+    cache, so the catalog costs each process almost nothing.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, file_format, self.version, self.compiled_at, self._categories, self._products, self._strings = \
+            HEADER.unpack_from(self._map)
+        if magic != MAGIC or file_format != FORMAT:
+            raise ValueError(f"{path} is not a catalog snapshot of format {FORMAT}")
+        self._category_offset = HEADER.size
+        self._product_offset = self._category_offset + self._categories * CATEGORY.size
+        self._id_offset = self._product_offset + self._products * PRODUCT.size
+
+    def _string(self, offset: int, length: int) -> Optional[str]:
+        if length == NO_STRING:
+            return None
+        start = self._strings + offset
+        return self._map[start:start + length].decode('utf-8')
+
+    def _search(self, table_offset: int, row: struct.Struct, count: int, key: int) -> int:
+        """Position of `key` in a table sorted by its first int column, or -1"""
+        position = bisect_left(
+            range(count), key,
+            key=lambda i: row.unpack_from(self._map, table_offset + i * row.size)[0]
+        )
+        if position < count and row.unpack_from(self._map, table_offset + position * row.size)[0] == key:
+            return position
+        return -1
+
+    def _category_row(self, position: int) -> tuple:
+        return CATEGORY.unpack_from(self._map, self._category_offset + position * CATEGORY.size)
+
+    def _product(self, position: int, category_name: str = None) -> CatalogProduct:
+        product_id, category_id, price, name_offset, name_length, description_offset, description_length, active = \
+            PRODUCT.unpack_from(self._map, self._product_offset + position * PRODUCT.size)
+        if category_name is None:
+            row = self._category_row(self._search(self._category_offset, CATEGORY, self._categories, category_id))
+            category_name = self._string(row[3], row[4])
+        return CatalogProduct(
+            product_id, self._string(name_offset, name_length), self._string(description_offset, description_length),
+            price, category_id, category_name, bool(active)
+        )
+
+    def get_categories(self) -> Tuple[CatalogCategory, ...]:
+        return tuple(
+            CatalogCategory(row[0], self._string(row[3], row[4]), self._string(row[5], row[6]))
+            for row in map(self._category_row, range(self._categories))
+        )
+
+    def get_products_by_category(self, category_id: int) -> Tuple[CatalogProduct, ...]:
+        position = self._search(self._category_offset, CATEGORY, self._categories, category_id)
+        if position < 0:
+            return ()
+        _, first, count, name_offset, name_length, _, _ = self._category_row(position)
+        category_name = self._string(name_offset, name_length)
+        products = (self._product(i, category_name) for i in range(first, first + count))
+        return tuple(product for product in products if product.active)
+
+    def get_product(self, product_id: int) -> Optional[CatalogProduct]:
+        position = self._search(self._id_offset, PRODUCT_ID, self._products, product_id)
+        if position < 0:
+            return None
+        _, product_position = PRODUCT_ID.unpack_from(self._map, self._id_offset + position * PRODUCT_ID.size)
+        return self._product(product_position)
+
+
+class SnapshotFile:
+    """The current MappedCatalog for a path.
+
+    The path is checked at most every `check_interval` seconds; when a compiler
+    has replaced the file, the new one is mapped and swapped in. Callers that
+    still hold the previous catalog keep using it safely, its mapping is
+    released once the last reference goes.
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        self.path = path
+        self._check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._catalog: Optional[MappedCatalog] = None
+        self._checked_at: Optional[float] = None
+        self.swaps = 0
+
+    def current(self) -> Optional[MappedCatalog]:
+        """The mapped catalog, or None while no snapshot has been written"""
+        now = self._clock()
+        if self._checked_at is None or now - self._checked_at >= self._check_interval:
+            self.refresh(now)
+        return self._catalog
+
+    def refresh(self, now: float = None) -> None:
+        with self._lock:
+            self._checked_at = self._clock() if now is None else now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            catalog = self._catalog
+            if catalog is not None and catalog.identity == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+                return
+            try:
+                self._catalog = MappedCatalog(self.path)
+            except FileNotFoundError:
+                # Replaced again between stat and open; the next check maps it
+                return
+            self.swaps += 1
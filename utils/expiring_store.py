@@ -0,0 +1,154 @@
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+class ExpiringStore:
+    """Dict whose entries expire, with a hard cap on the number of keys.
+
+    Expiry is tracked with a timing wheel: every key sits in exactly one bucket
+    of `resolution` seconds. Pushing an expiry back doesn't move the key;
+    when its old bucket comes due the key is re-filed under its current
+    expiry instead, so updates cost O(1) and the wheel never holds more than
+    one slot per key. Expired keys are purged in small batches every
+    `purge_every` writes, and at the cap the keys closest to expiring are
+    evicted first.
+    """
+
+    def __init__(self, max_keys: int = 100000, clock: Callable[[], float] = monotonic,
+                 resolution: float = 1.0, purge_every: int = 16, purge_batch: int = 64):
+        self.max_keys = max_keys
+        self._clock = clock
+        self._resolution = resolution
+        self._purge_every = purge_every
+        self._purge_batch = purge_batch
+        self._writes = 0
+        # key -> [value, expires_at, bucket the key is filed under]
+        self._data: Dict[Hashable, List[Any]] = {}
+        self._wheel: Dict[int, List[Hashable]] = {}
+        self._cursor: Optional[int] = None  # first bucket not yet purged
+        self.expired_evictions = 0
+        self.capacity_evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: Hashable, default: Any = None, now: float = None) -> Any:
+        """Return the live value for key without creating an entry"""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        if entry[1] <= (self._clock() if now is None else now):
+            return default
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, expires_at: float, now: float = None) -> None:
+        now = self._clock() if now is None else now
+        if self._cursor is None:
+            self._cursor = int(now // self._resolution)
+
+        entry = self._data.get(key)
+        if entry is not None:
+            entry[0] = value
+            if expires_at < entry[1]:
+                bucket = self._bucket(expires_at)
+                if bucket < entry[2]:
+                    # Expiry moved before the key's bucket, file it earlier
+                    entry[2] = bucket
+                    self._wheel.setdefault(bucket, []).append(key)
+            entry[1] = expires_at
+        else:
+            bucket = self._bucket(expires_at)
+            self._data[key] = [value, expires_at, bucket]
+            self._wheel.setdefault(bucket, []).append(key)
+            if len(self._data) > self.max_keys:
+                self._evict_for_capacity()
+
+        self._writes += 1
+        if self._writes >= self._purge_every:
+            self._writes = 0
+            self.purge(now, self._purge_batch)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        # The key's wheel slot is left behind and skipped when it comes due
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._wheel.clear()
+        self._cursor = None
+
+    def purge(self, now: float = None, limit: Optional[int] = None) -> int:
+        """Drop expired keys, looking at no more than `limit` slots"""
+        if self._cursor is None:
+            return 0
+        now = self._clock() if now is None else now
+        # Buckets before `due` only hold expiry times earlier than now
+        due = int(now // self._resolution)
+        processed = 0
+        evicted = 0
+        while self._cursor < due and (limit is None or processed < limit):
+            keys = self._wheel.get(self._cursor)
+            if not keys:
+                self._wheel.pop(self._cursor, None)
+                self._advance_cursor(due)
+                continue
+
+            key = keys.pop()
+            processed += 1
+            entry = self._data.get(key)
+            if entry is None or entry[2] != self._cursor:
+                continue  # slot of a key that was removed or re-filed
+            if entry[1] <= now:
+                del self._data[key]
+                evicted += 1
+            else:
+                entry[2] = self._bucket(entry[1])
+                self._wheel.setdefault(entry[2], []).append(key)
+        self.expired_evictions += evicted
+        return evicted
+
+    def _bucket(self, expires_at: float) -> int:
+        bucket = int(expires_at // self._resolution)
+        # Already-expired keys go in the next bucket to purge
+        return bucket if bucket > self._cursor else self._cursor
+
+    def _advance_cursor(self, due: int) -> None:
+        self._cursor += 1
+        if self._cursor not in self._wheel:
+            # Jump over empty stretches instead of stepping through them
+            pending = [bucket for bucket in self._wheel if bucket < due]
+            self._cursor = min(pending) if pending else due
+
+    def _evict_for_capacity(self) -> None:
+        bucket = self._cursor
+        last = max(self._wheel) if self._wheel else bucket
+        while len(self._data) > self.max_keys and bucket <= last:
+            keys = self._wheel.get(bucket)
+            if not keys:
+                bucket += 1
+                continue
+            key = keys.pop()
+            entry = self._data.get(key)
+            if entry is None or entry[2] != bucket:
+                continue
+            if self._bucket(entry[1]) > bucket:
+                # Expiry was pushed back since the key was filed here
+                entry[2] = self._bucket(entry[1])
+                self._wheel.setdefault(entry[2], []).append(key)
+                last = max(last, entry[2])
+                continue
+            del self._data[key]
+            self.capacity_evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Gauges and counters for monitoring"""
+        return {
+            'tracked_keys': len(self._data),
+            'wheel_buckets': len(self._wheel),
+            'max_keys': self.max_keys,
+            'expired_evictions': self.expired_evictions,
+            'capacity_evictions': self.capacity_evictions,
+        }
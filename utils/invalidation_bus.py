@@ -0,0 +1,226 @@
+import json
+import os
+import select
+import socket
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from uuid import uuid4
+import logging
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# callback(keys) where keys is None when the whole entity changed
+Subscriber = Callable[[Optional[list]], None]
+
+CHANNEL = 'cache_invalidation'
+# Postgres NOTIFY payloads are limited to 8000 bytes; past this many keys the
+# whole entity is invalidated instead
+MAX_KEYS = 200
+
+
+class PostgresTransport:
+    """LISTEN/NOTIFY on the application database; delivery is immediate"""
+
+    def __init__(self, dsn: str):
+        # SQLAlchemy URLs name the driver, libpq doesn't know about it
+        self.dsn = dsn.replace('+psycopg2', '', 1)
+        self._local = threading.local()
+
+    def _connect(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    def send(self, payload: str) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or conn.closed:
+            conn = self._local.conn = self._connect()
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', (CHANNEL, payload))
+
+    def listen(self, handle: Callable[[str], None], stopped: threading.Event,
+               ready: Callable[[], None] = None) -> None:
+        conn = self._connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            if ready:
+                ready()
+            while not stopped.is_set():
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    handle(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+
+class SQLiteTransport:
+    """Invalidations appended to a table in a SQLite file every process polls.
+
+    A poll is one indexed range read of the rows after the last one seen, so
+    it stays cheap at short intervals. Rows older than an hour are deleted.
+    """
+
+    def __init__(self, path: str, poll_interval: float = None, retention: float = 3600):
+        self.path = path
+        self.poll_interval = poll_interval or Config.INVALIDATION_POLL_INTERVAL
+        self.retention = retention
+        self._local = threading.local()
+        self._sent = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS invalidation ('
+                ' seq INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' created REAL NOT NULL,'
+                ' payload TEXT NOT NULL'
+                ')'
+            )
+            self._local.conn = conn
+        return conn
+
+    def send(self, payload: str) -> None:
+        conn = self._connection()
+        now = time.time()
+        conn.execute('INSERT INTO invalidation (created, payload) VALUES (?, ?)', (now, payload))
+        self._sent += 1
+        if self._sent % 1000 == 0:
+            conn.execute('DELETE FROM invalidation WHERE created < ?', (now - self.retention,))
+
+    def listen(self, handle: Callable[[str], None], stopped: threading.Event,
+               ready: Callable[[], None] = None) -> None:
+        conn = self._connection()
+        # Only what is published from now on is delivered, ready() covers the rest
+        last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM invalidation').fetchone()[0]
+        if ready:
+            ready()
+        while not stopped.wait(self.poll_interval):
+            for seq, payload in conn.execute(
+                'SELECT seq, payload FROM invalidation WHERE seq > ? ORDER BY seq', (last_seq,)
+            ).fetchall():
+                last_seq = seq
+                handle(payload)
+
+
+class InvalidationBus:
+    """Tells the other processes which cached entities changed.
+
+    Caches publish (entity, keys) after a commit changes their data and
+    subscribe to the same entity to drop those keys when another process
+    publishes. A process ignores its own messages, its caches were already
+    invalidated locally. Each received message bumps the entity's version.
+    Delivery isn't guaranteed: messages sent before the listener starts or
+    while it reconnects are lost, and on_resync() callbacks run each time it
+    starts listening so that caches can catch up from their source.
+    """
+
+    def __init__(self, transport=None):
+        self.transport = transport
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.versions: Dict[str, int] = {}
+        self._subscribers: Dict[str, List[Subscriber]] = {}
+        self._resync_callbacks: List[Callable[[], None]] = []
+        self._stopped = threading.Event()
+        self._listener: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, entity: str, callback: Subscriber) -> None:
+        self._subscribers.setdefault(entity, []).append(callback)
+
+    def on_resync(self, callback: Callable[[], None]) -> None:
+        self._resync_callbacks.append(callback)
+
+    def resync(self) -> None:
+        for callback in self._resync_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error resyncing after an invalidation bus gap: {str(e)}")
+
+    def publish(self, entity: str, keys: list = None) -> None:
+        """Send the change to other processes; failures are logged, not raised"""
+        if self.transport is None:
+            return
+        if keys is not None and len(keys) > MAX_KEYS:
+            keys = None
+        payload = json.dumps({'origin': self.origin, 'entity': entity, 'keys': keys}, separators=(',', ':'))
+        try:
+            self.transport.send(payload)
+        except Exception as e:
+            logger.error(f"Error publishing invalidation of {entity}: {str(e)}")
+
+    def dispatch(self, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed invalidation message")
+            return
+        if message.get('origin') == self.origin:
+            return
+
+        entity, keys = message.get('entity'), message.get('keys')
+        self.versions[entity] = self.versions.get(entity, 0) + 1
+        for callback in self._subscribers.get(entity, ()):
+            try:
+                callback(keys)
+            except Exception as e:
+                logger.error(f"Error applying invalidation of {entity}: {str(e)}")
+
+    def start(self) -> None:
+        """Listen for other processes' messages on a daemon thread"""
+        with self._lock:
+            if self.transport is None or self._listener is not None:
+                return
+            self._stopped.clear()
+            self._listener = threading.Thread(target=self._listen, name='invalidation-bus', daemon=True)
+            self._listener.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.join(timeout=5)
+
+    def _listen(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.transport.listen(self.dispatch, self._stopped, self.resync)
+            except Exception as e:
+                # Messages sent while disconnected are lost; caches fall back on their TTLs
+                logger.error(f"Invalidation bus connection lost: {str(e)}")
+                self._stopped.wait(5)
+
+
+def create_transport():
+    """Transport selected by Config.INVALIDATION_BUS.
+
+    'auto' uses Postgres LISTEN/NOTIFY when the database is Postgres and the
+    SQLite file otherwise; 'none' keeps invalidation local to each process.
+    """
+    mode = Config.INVALIDATION_BUS
+    database_url = Config.SQLALCHEMY_DATABASE_URI or ''
+    if mode == 'auto':
+        mode = 'postgres' if database_url.startswith('postgres') else 'sqlite'
+    if mode == 'postgres':
+        return PostgresTransport(database_url)
+    if mode == 'sqlite':
+        return SQLiteTransport(Config.INVALIDATION_SQLITE_PATH)
+    if mode != 'none':
+        logger.warning(f"Unknown invalidation bus {mode}, invalidating locally only")
+    return None
+
+
+invalidation_bus = InvalidationBus(create_transport())
@@ -1,19 +1,150 @@
+import atexit
+import json
 import logging
+import queue
+import random
 import sys
-from logging.handlers import RotatingFileHandler
-from typing import Optional
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional, Tuple
+from config import Config
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record.
+
+    Structured data passed as extra={'event': ..., 'fields': {...}} becomes
+    top-level keys instead of being rendered into the message.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'location': f"{record.filename}:{record.lineno}",
+            'message': record.getMessage(),
+        }
+        event = getattr(record, 'event', None)
+        if event:
+            data['event'] = event
+        data.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RepeatFilter(logging.Filter):
+    """Rate-limit repeated warnings.
+
+    Records at WARNING and above that share a logger and message template
+    (e.g. the limiter's "Rate limit exceeded" line) pass at most `limit`
+    times per `interval` seconds; the next one to pass reports how many were
+    suppressed in between.
+    """
+
+    def __init__(self, limit: int = None, interval: float = None):
+        super().__init__()
+        self.limit = limit or Config.LOG_REPEAT_LIMIT
+        self.interval = interval or Config.LOG_REPEAT_INTERVAL
+        self._lock = threading.Lock()
+        # (logger, template) -> [window start, passed, suppressed]
+        self._seen: Dict[Tuple[str, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is None or now - entry[0] >= self.interval:
+                if len(self._seen) > 10000:
+                    self._seen.clear()
+                suppressed = entry[2] if entry else 0
+                entry = self._seen[key] = [now, 0, 0]
+            else:
+                suppressed = 0
+            if entry[1] >= self.limit:
+                entry[2] += 1
+                return False
+            entry[1] += 1
+        if suppressed:
+            record.msg = f"{record.msg} (suppressed {suppressed} similar)"
+        return True
+
+
+def sampled(event: str) -> bool:
+    """Whether to log this occurrence of `event`, per Config.LOG_SAMPLE_RATES"""
+    rate = Config.LOG_SAMPLE_RATES.get(event, 1.0)
+    return rate >= 1.0 or random.random() < rate
+
+
+def configure_logging() -> None:
+    """Root logging: level from Config.LOG_LEVEL, repeated warnings rate-limited"""
+    logging.basicConfig(format=TEXT_FORMAT, level=Config.LOG_LEVEL, force=True)
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(RepeatFilter())
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full.
+
+    Records are queued as they are, so message formatting happens on the
+    writer thread. Dropped records are counted, and the next record that fits
+    is preceded by a warning saying how many were lost.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self._unreported:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': record.name,
+                    'levelno': logging.WARNING,
+                    'levelname': 'WARNING',
+                    'msg': f"Log queue full, dropped {self._unreported} records",
+                }))
+                self._unreported = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener lives in this process, no need to pre-render for pickling
+        return record
+
+class _LogListener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # The queue may be full at shutdown, wait for the writer to make room
+        self.queue.put(self._sentinel)
+
 
 class BotLogger:
+    """Bot logger whose handlers run on a background thread.
+
+    Records go through a bounded queue (Config.LOG_QUEUE_SIZE) to a
+    QueueListener that owns the console and file handlers, so writes and
+    rotation never block the event loop; when the queue is full records are
+    dropped rather than waited on.
+    """
+
     _instance: Optional['BotLogger'] = None
-    
+
     def __init__(self):
         self.logger = logging.getLogger('telegram_bot')
-        self.logger.setLevel(logging.DEBUG)
+        self.logger.setLevel(Config.LOG_LEVEL)
         
         # Форматтер для логов
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s'
-        )
+        formatter = logging.Formatter(TEXT_FORMAT)
         
         # Хендлер для консоли
         console_handler = logging.StreamHandler(sys.stdout)
@@ -27,22 +158,42 @@ class BotLogger:
             backupCount=5,
             encoding='utf-8'
         )
-        file_handler.setFormatter(formatter)
+        file_handler.setFormatter(JsonFormatter() if Config.LOG_FORMAT == 'json' else formatter)
         file_handler.setLevel(logging.DEBUG)
         
-        # Добавляем хендлеры
-        self.logger.addHandler(console_handler)
-        self.logger.addHandler(file_handler)
-    
+        # Хендлеры работают в фоновом потоке, в логгер пишем только через очередь
+        log_queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+        self.queue_handler = DroppingQueueHandler(log_queue)
+        # Filtered before queueing, so suppressed repeats cost no queue space
+        self.queue_handler.addFilter(RepeatFilter())
+        self.listener = _LogListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+        self.logger.addHandler(self.queue_handler)
+        # Root handlers are synchronous, don't hand records to them as well
+        self.logger.propagate = False
+
     @classmethod
     def get_logger(cls) -> logging.Logger:
         if cls._instance is None:
             cls._instance = BotLogger()
         return cls._instance.logger
 
+    @classmethod
+    def get_stats(cls) -> Dict[str, int]:
+        """Queue depth and dropped-record count for monitoring"""
+        if cls._instance is None:
+            return {'queued': 0, 'dropped': 0}
+        handler = cls._instance.queue_handler
+        return {'queued': handler.queue.qsize(), 'dropped': handler.dropped}
+
     @staticmethod
     def log_request(update, context, level=logging.INFO):
         logger = BotLogger.get_logger()
+        # Skip building the record entirely when it would be filtered
+        if not logger.isEnabledFor(level) or not sampled('request'):
+            return
         user = update.effective_user
         message = update.message or update.callback_query.message
         
@@ -55,4 +206,4 @@ class BotLogger:
             'callback_data': update.callback_query.data if update.callback_query else None
         }
         
-        logger.log(level, f"Incoming request: {log_data}")
+        logger.log(level, "Incoming request: %s", log_data, extra={'event': 'request', 'fields': log_data})
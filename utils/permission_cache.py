@@ -0,0 +1,163 @@
+import threading
+import time
+from itertools import chain
+from typing import Callable, Dict, FrozenSet, Iterable, NamedTuple, Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from config import Config
+from extensions import db
+from models import Role, User, roles_users
+from utils.expiring_store import ExpiringStore
+from utils.invalidation_bus import invalidation_bus
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Marker in a session's pending changes meaning "reload everything"
+_ALL = object()
+
+
+class UserPermissions(NamedTuple):
+    user_id: int
+    username: Optional[str]
+    active: bool
+    roles: FrozenSet[str]
+
+    def has_any_role(self, roles: Iterable[str]) -> bool:
+        return not roles or not self.roles.isdisjoint(roles)
+
+
+class PermissionCache:
+    """telegram_id -> UserPermissions, held in memory.
+
+    The whole table is loaded in two queries (users, then role links) on first
+    use and again every Config.PERMISSION_CACHE_TTL seconds, which also picks
+    up changes made by other processes. Reloads are single-flight: lookups
+    that find the cache expired queue behind one reload and use its result.
+    Commits in this process that touch a User or Role drop the affected
+    entries right away (see the session hooks below), and those users are
+    re-read individually on their next lookup. Telegram ids without a user
+    are remembered for a minute so unknown users don't cause a query per
+    message either.
+    """
+
+    def __init__(self, ttl: float = None, clock: Callable[[], float] = time.monotonic):
+        self._ttl = ttl or Config.PERMISSION_CACHE_TTL
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._entries: Dict[int, UserPermissions] = {}
+        self._unknown = ExpiringStore(100000, clock)
+        self._loaded_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def get(self, telegram_id: int) -> Optional[UserPermissions]:
+        now = self._clock()
+        if self._expired(now):
+            with self._reload_lock:
+                # Someone may have reloaded it while we waited
+                if self._expired(self._clock()):
+                    self.reload()
+
+        entry = self._entries.get(telegram_id)
+        if entry is not None or self._unknown.get(telegram_id, now=now):
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = self._query(User.telegram_id == telegram_id).get(telegram_id)
+        with self._lock:
+            if entry is None:
+                self._unknown.set(telegram_id, True, now + 60, now)
+            else:
+                self._entries[telegram_id] = entry
+        return entry
+
+    def _expired(self, now: float) -> bool:
+        return self._loaded_at is None or now - self._loaded_at > self._ttl
+
+    def reload(self) -> None:
+        entries = self._query()
+        with self._lock:
+            self._entries = entries
+            self._unknown.clear()
+            self._loaded_at = self._clock()
+            self.reloads += 1
+        logger.debug(f"Loaded permissions for {len(entries)} users")
+
+    def invalidate(self, telegram_ids: Iterable[int] = None) -> None:
+        """Forget the given users, or everything when no ids are given"""
+        with self._lock:
+            if telegram_ids is None:
+                self._loaded_at = None
+                return
+            for telegram_id in telegram_ids:
+                self._entries.pop(telegram_id, None)
+                self._unknown.pop(telegram_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads,
+        }
+
+    @staticmethod
+    def _query(*criteria) -> Dict[int, UserPermissions]:
+        from app import app
+
+        with app.app_context():
+            users = db.session.query(User.id, User.telegram_id, User.username, User.active).filter(
+                User.telegram_id.isnot(None), *criteria
+            ).all()
+            links = db.session.query(roles_users.c.user_id, Role.name).join(
+                Role, Role.id == roles_users.c.role_id
+            )
+            if criteria:
+                links = links.filter(roles_users.c.user_id.in_([user.id for user in users]))
+
+            roles: Dict[int, set] = {}
+            for user_id, name in links:
+                roles.setdefault(user_id, set()).add(name)
+
+        return {
+            user.telegram_id: UserPermissions(
+                user.id, user.username, bool(user.active), frozenset(roles.get(user.id, ()))
+            )
+            for user in users
+        }
+
+
+permission_cache = PermissionCache()
+invalidation_bus.subscribe('user', permission_cache.invalidate)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_permission_changes(session, flush_context):
+    pending = session.info.setdefault('permission_changes', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Role):
+            pending.add(_ALL)
+        elif isinstance(obj, User):
+            # Both the current and a replaced telegram id are affected
+            history = inspect(obj).attrs.telegram_id.history
+            pending.update(telegram_id for telegram_id in chain(
+                history.added, history.unchanged, history.deleted
+            ) if telegram_id is not None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_permission_changes(session):
+    pending = session.info.pop('permission_changes', None)
+    if pending:
+        telegram_ids = None if _ALL in pending else sorted(pending)
+        permission_cache.invalidate(telegram_ids)
+        invalidation_bus.publish('user', telegram_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_permission_changes(session):
+    session.info.pop('permission_changes', None)
@@ -0,0 +1,212 @@
+from collections import Counter
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Dict, Mapping, Tuple
+from sqlalchemy import case, event, func, inspect, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from extensions import db
+from models import Order, PlatformCounter, Product, SupportTicket, User
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Platform totals for the admin statistics, kept in the platform_counter
+# table. Every flush adds the change it makes to the counters in the same
+# transaction (see the session hook below), so reading them is one small
+# primary-key lookup instead of a COUNT over each table. Writes that bypass
+# the session, such as bulk inserts, call adjust_counters() themselves.
+# Rows only exist once reconcile() has run: app.py seeds them right after
+# creating the tables (see seed_counters()) and migrate.py after migrating.
+# reconcile() also recounts everything from the tables and repairs any
+# drift, see reconcile_counters.py.
+USERS = 'users'
+ACTIVE_USERS = 'active_users'
+ORDERS = 'orders'
+OPEN_TICKETS = 'open_tickets'
+ACTIVE_PRODUCTS = 'active_products'
+REVENUE = 'revenue'  # amount charged for every completed order
+ORDER_STATUSES = ('pending', 'completed', 'failed', 'refunded', 'cancelled')
+
+def order_counter(status: str) -> str:
+    return f'orders.{status}'
+
+COUNTERS = (USERS, ACTIVE_USERS, ORDERS, *map(order_counter, ORDER_STATUSES),
+            OPEN_TICKETS, ACTIVE_PRODUCTS, REVENUE)
+
+def adjust_counters(connection, deltas: Mapping[str, float]) -> None:
+    """Add deltas to the stored counters inside the caller's transaction.
+
+    Rows are updated in name order so that concurrent writers lock them in
+    the same order and can't deadlock each other.
+    """
+    table = PlatformCounter.__table__
+    now = datetime.utcnow()
+    for name in sorted(deltas):
+        if deltas[name]:
+            connection.execute(
+                update(table).where(table.c.name == name)
+                .values(value=table.c.value + deltas[name], updated_at=now)
+            )
+
+
+def read_counters() -> Dict[str, float]:
+    """All counters by name; ones that were never seeded read as 0"""
+    counters = dict(db.session.execute(select(PlatformCounter.name, PlatformCounter.value)).all())
+    missing = set(COUNTERS) - counters.keys()
+    if missing:
+        logger.warning(f"Platform counters {sorted(missing)} are not seeded, run reconcile_counters.py")
+        counters.update(dict.fromkeys(missing, 0))
+    return counters
+
+
+def seed_counters() -> None:
+    """Count everything once if some counter has no row yet, otherwise do nothing"""
+    stored = set(db.session.scalars(select(PlatformCounter.name)))
+    if not stored >= set(COUNTERS):
+        reconcile()
+
+
+def _recount() -> Dict[str, float]:
+    users, active_users = db.session.execute(select(
+        func.count(User.id),
+        func.coalesce(func.sum(case((User.active.is_(True), 1), else_=0)), 0)
+    )).one()
+    by_status = dict(db.session.execute(
+        select(Order.status, func.count(Order.id)).group_by(Order.status)
+    ).all())
+    revenue = db.session.scalar(
+        select(func.coalesce(func.sum(Order.amount), 0)).where(Order.status == 'completed')
+    )
+    counters = {
+        USERS: users,
+        ACTIVE_USERS: active_users,
+        ORDERS: sum(by_status.values()),
+        OPEN_TICKETS: db.session.scalar(
+            select(func.count(SupportTicket.id)).where(SupportTicket.status == 'open')
+        ),
+        ACTIVE_PRODUCTS: db.session.scalar(
+            select(func.count(Product.id)).where(Product.active.is_(True))
+        ),
+        REVENUE: float(revenue),
+    }
+    counters.update((order_counter(status), by_status.get(status, 0)) for status in ORDER_STATUSES)
+    return counters
+
+
+def reconcile() -> Dict[str, Tuple[float, float]]:
+    """Recount every counter from the tables and store the result.
+
+    The counter rows are locked before counting, so writes that land while
+    recounting wait for this commit instead of being overwritten by it.
+    Returns the counters that had drifted as name -> (stored, actual).
+    """
+    table = PlatformCounter.__table__
+    drift = {}
+    try:
+        stored = dict(db.session.execute(
+            select(PlatformCounter.name, PlatformCounter.value).with_for_update()
+        ).all())
+        now = datetime.utcnow()
+        for name, value in _recount().items():
+            if name not in stored:
+                db.session.add(PlatformCounter(name=name, value=value))
+            elif abs(stored[name] - value) > 0.005:  # revenue is a sum of floats
+                drift[name] = (stored[name], value)
+                db.session.execute(
+                    update(table).where(table.c.name == name).values(value=value, updated_at=now)
+                )
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Database error when reconciling platform counters: {str(e)}")
+        raise
+
+    if drift:
+        logger.warning(f"Repaired drifted platform counters: {drift}")
+    return drift
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    pass
+
+# Load the previous value when these are assigned on an expired object,
+# otherwise the flush hook couldn't tell what to take off the old counter
+for _attribute in (User.active, Order.status, Order.amount, SupportTicket.status, Product.active):
+    event.listen(_attribute, 'set', _keep_old_value, active_history=True)
+
+
+def _new_value(obj, key: str) -> Any:
+    value = getattr(obj, key)
+    if value is None and inspect(obj).pending:
+        # Column defaults are only filled in by the INSERT
+        default = obj.__table__.c[key].default
+        if default is not None and default.is_scalar:
+            return default.arg
+    return value
+
+
+def _old_value(obj, key: str) -> Any:
+    history = inspect(obj).attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.added:
+        return None
+    return getattr(obj, key)
+
+
+def _counts(obj, value: Callable[[str], Any]) -> Dict[str, int]:
+    """What one row adds to the counters, reading its columns through value"""
+    if isinstance(obj, User):
+        return {USERS: 1, ACTIVE_USERS: int(bool(value('active')))}
+    if isinstance(obj, Order):
+        return {ORDERS: 1, order_counter(value('status')): 1}
+    if isinstance(obj, SupportTicket):
+        return {OPEN_TICKETS: int(value('status') == 'open')}
+    if isinstance(obj, Product):
+        return {ACTIVE_PRODUCTS: int(bool(value('active')))}
+    return {}
+
+
+def _revenue(session, obj, value: Callable[[str], Any]) -> float:
+    """What one order adds to the revenue, reading its columns through value"""
+    if value('status') != 'completed':
+        return 0.0
+    amount = value('amount')
+    if amount is None and inspect(obj).pending and value('product_id') is not None:
+        # The INSERT fills it in from the product's price
+        product = session.get(Product, value('product_id'))
+        amount = product.price if product is not None else None
+    return amount or 0.0
+
+
+@event.listens_for(Session, 'before_flush')
+def _count_changes(session, flush_context, instances):
+    # Before the flush, so that the database still holds the old rows
+    deltas = Counter()
+    revenue = 0.0
+
+    for obj in session.new:
+        value = partial(_new_value, obj)
+        deltas.update(_counts(obj, value))
+        if isinstance(obj, Order):
+            revenue += _revenue(session, obj, value)
+
+    for obj in session.deleted:
+        value = partial(_old_value, obj)
+        deltas.subtract(_counts(obj, value))
+        if isinstance(obj, Order):
+            revenue -= _revenue(session, obj, value)
+
+    for obj in session.dirty:
+        if not isinstance(obj, (User, Order, SupportTicket, Product)) or not session.is_modified(obj):
+            continue
+        old, new = partial(_old_value, obj), partial(_new_value, obj)
+        deltas.subtract(_counts(obj, old))
+        deltas.update(_counts(obj, new))
+        if isinstance(obj, Order):
+            revenue += _revenue(session, obj, new) - _revenue(session, obj, old)
+    deltas[REVENUE] += revenue
+
+    if any(deltas.values()):
+        adjust_counters(session.connection(), deltas)
@@ -0,0 +1,156 @@
+from math import floor
+from typing import Any, List, Optional, Tuple
+
+# Slack for float rounding when comparing accumulated times and estimates
+_EPSILON = 1e-6
+
+# Every algorithm keeps its per-key state as numbers or sequences of them, so any
+# backend can store it, and exposes
+#   step(state, now, cost) -> (allowed, remaining, wait, new_state, expires_at)
+#   peek(state, now) -> (remaining, wait)
+# `wait` is how long until one more request would be allowed; `new_state` is
+# None when a refused request leaves the state unchanged; after `expires_at`
+# the state is equivalent to no state at all.
+
+
+class ExactLog:
+    """Timestamps of the requests in the last window.
+
+    Exact accounting at O(limit) memory per key; meant for low limits such
+    as payments.
+    """
+
+    name = 'exact'
+
+    def __init__(self, limit: int, window: float, burst: int = None):
+        self.limit = limit
+        self.window = window
+
+    def _live(self, state: Optional[List[float]], now: float) -> List[float]:
+        cutoff = now - self.window
+        return [t for t in state or () if t > cutoff]
+
+    def _wait(self, log: List[float], now: float, cost: int) -> float:
+        excess = len(log) + cost - self.limit
+        if excess <= 0:
+            return 0.0
+        if cost > self.limit:
+            return self.window
+        # The oldest `excess` requests have to leave the window first
+        return max(0.0, log[excess - 1] + self.window - now)
+
+    def step(self, state: Any, now: float, cost: int = 1) -> Tuple[bool, int, float, Any, float]:
+        log = self._live(state, now)
+        if len(log) + cost > self.limit:
+            return False, max(0, self.limit - len(log)), self._wait(log, now, cost), None, 0.0
+        log.extend([now] * cost)
+        return True, self.limit - len(log), 0.0, log, now + self.window
+
+    def peek(self, state: Any, now: float) -> Tuple[int, float]:
+        log = self._live(state, now)
+        return max(0, self.limit - len(log)), self._wait(log, now, 1)
+
+
+class SlidingWindowCounter:
+    """Approximate sliding window from the counts of two fixed windows.
+
+    The previous window's count is weighted by how much of it still overlaps
+    the sliding window, so state is (window_start, current, previous)
+    regardless of traffic. Meant for high-volume limits such as messages.
+    """
+
+    name = 'sliding_window'
+
+    def __init__(self, limit: int, window: float, burst: int = None):
+        self.limit = limit
+        self.window = window
+
+    def _roll(self, state: Any, now: float) -> Tuple[float, int, int]:
+        start = floor(now / self.window) * self.window
+        if state is None:
+            return start, 0, 0
+        state_start, current, previous = state
+        if state_start == start:
+            return start, current, previous
+        if state_start == start - self.window:
+            return start, 0, current
+        return start, 0, 0
+
+    def _estimate(self, start: float, current: int, previous: int, now: float) -> float:
+        return previous * (start + self.window - now) / self.window + current
+
+    def _wait(self, start: float, current: int, previous: int, now: float, cost: int) -> float:
+        if cost > self.limit:
+            return self.window
+        if current + cost <= self.limit:
+            # Wait for the previous window's weight to drop far enough
+            if not previous:
+                return 0.0
+            allowance = (self.limit - current - cost) / previous
+            return max(0.0, start + self.window * (1 - allowance) - now)
+        # Only possible in the next window, where this one becomes `previous`
+        allowance = (self.limit - cost) / current
+        return max(0.0, start + self.window * (2 - allowance) - now)
+
+    def step(self, state: Any, now: float, cost: int = 1) -> Tuple[bool, int, float, Any, float]:
+        start, current, previous = self._roll(state, now)
+        estimate = self._estimate(start, current, previous, now)
+        if estimate + cost > self.limit + _EPSILON:
+            remaining = max(0, int(self.limit - estimate + _EPSILON))
+            return False, remaining, self._wait(start, current, previous, now, cost), None, 0.0
+        remaining = max(0, int(self.limit - estimate - cost + _EPSILON))
+        # Two windows after this one starts, neither count matters any more
+        return True, remaining, 0.0, (start, current + cost, previous), start + 2 * self.window
+
+    def peek(self, state: Any, now: float) -> Tuple[int, float]:
+        start, current, previous = self._roll(state, now)
+        estimate = self._estimate(start, current, previous, now)
+        remaining = max(0, int(self.limit - estimate + _EPSILON))
+        wait = 0.0 if remaining else self._wait(start, current, previous, now, 1)
+        return remaining, wait
+
+
+class TokenBucket:
+    """Token bucket as GCRA (generic cell rate algorithm).
+
+    The state is one float, the theoretical arrival time (TAT) of the next
+    request. Tokens refill at limit / window per second and up to `burst`
+    (default `limit`) requests can be made back to back.
+    """
+
+    name = 'token_bucket'
+
+    def __init__(self, limit: int, window: float, burst: int = None):
+        self.limit = limit
+        self.window = window
+        self.burst = burst or limit
+        # Seconds of budget one request consumes, and the budget of a full bucket
+        self.interval = window / limit
+        self.tolerance = self.burst * self.interval
+
+    def step(self, state: Any, now: float, cost: int = 1) -> Tuple[bool, int, float, Any, float]:
+        tat = now if state is None else max(state, now)
+        new_tat = tat + self.interval * cost
+        if new_tat - now > self.tolerance + _EPSILON:
+            remaining = max(0, int((now + self.tolerance - tat) / self.interval + _EPSILON))
+            return False, remaining, new_tat - self.tolerance - now, None, 0.0
+        remaining = int((now + self.tolerance - new_tat) / self.interval + _EPSILON)
+        # The TAT never runs more than `tolerance` ahead, so a key idle that
+        # long has a full bucket again and can be dropped
+        return True, remaining, 0.0, new_tat, now + self.tolerance
+
+    def peek(self, state: Any, now: float) -> Tuple[int, float]:
+        if state is None:
+            return self.burst, 0.0
+        tat = max(state, now)
+        remaining = min(self.burst, int((now + self.tolerance - tat) / self.interval + _EPSILON))
+        return remaining, max(0.0, tat + self.interval - self.tolerance - now)
+
+
+ALGORITHMS = {algorithm.name: algorithm for algorithm in (ExactLog, SlidingWindowCounter, TokenBucket)}
+
+
+def create_algorithm(name: str, limit: int, window: float, burst: int = None):
+    if name not in ALGORITHMS:
+        raise ValueError(f"Unknown rate limit algorithm: {name}")
+    return ALGORITHMS[name](limit, window, burst)
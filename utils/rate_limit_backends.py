@@ -0,0 +1,197 @@
+import json
+import sqlite3
+import threading
+from time import monotonic, time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+import logging
+from config import Config
+from utils.expiring_store import ExpiringStore
+
+logger = logging.getLogger(__name__)
+
+# step(state, violations) -> (result, new_state, state_expires_at,
+#                             new_violations, violations_expire_at)
+# new_state is None when the state is unchanged (e.g. a refused request).
+Step = Callable[[Any, int], Tuple[Any, Any, float, int, float]]
+
+
+class MemoryBackend:
+    """Limiter state in this process only; the default backend"""
+
+    shared = False
+
+    def __init__(self, max_keys: int = None, clock: Callable[[], float] = monotonic):
+        self.clock = clock
+        self._max_keys = max_keys or Config.RATE_LIMIT_MAX_KEYS
+        self._state: Dict[str, ExpiringStore] = {}
+        self._violations: Dict[str, ExpiringStore] = {}
+
+    def _stores(self, namespace: str) -> Tuple[ExpiringStore, ExpiringStore]:
+        state = self._state.get(namespace)
+        if state is None:
+            state = self._state[namespace] = ExpiringStore(self._max_keys, self.clock)
+            self._violations[namespace] = ExpiringStore(self._max_keys, self.clock)
+        return state, self._violations[namespace]
+
+    def get(self, namespace: str, key: Hashable, now: float) -> Tuple[Any, int]:
+        """Current (state, violations) without creating an entry"""
+        state = self._state.get(namespace)
+        if state is None:
+            return None, 0
+        return state.get(key, None, now), self._violations[namespace].get(key, 0, now)
+
+    def apply(self, namespace: str, key: Hashable, now: float, step: Step) -> Any:
+        state_store, violation_store = self._stores(namespace)
+        state = state_store.get(key, None, now)
+        violations = violation_store.get(key, 0, now)
+        result, new_state, state_expires_at, new_violations, violations_expire_at = step(state, violations)
+        if new_state is not None:
+            state_store.set(key, new_state, state_expires_at, now)
+        if new_violations != violations:
+            violation_store.set(key, new_violations, violations_expire_at, now)
+        return result
+
+    def reset(self, namespace: str, key: Hashable) -> None:
+        if namespace in self._state:
+            self._state[namespace].pop(key)
+            self._violations[namespace].pop(key)
+
+    def metrics(self, namespace: str) -> Dict[str, int]:
+        if namespace not in self._state:
+            return {'tracked_keys': 0, 'limited_keys': 0, 'expired_evictions': 0, 'capacity_evictions': 0}
+        state, violations = self._state[namespace], self._violations[namespace]
+        return {
+            'tracked_keys': len(state),
+            'limited_keys': len(violations),
+            'expired_evictions': state.expired_evictions,
+            'capacity_evictions': state.capacity_evictions + violations.capacity_evictions,
+        }
+
+
+class SQLiteBackend:
+    """Limiter state shared by every process on the host through one SQLite file.
+
+    Each check is a single BEGIN IMMEDIATE transaction (read, compute, upsert),
+    so concurrent bot and web workers never lose updates. Timestamps are wall
+    clock, the only clock processes share. Expired rows are deleted every
+    `cleanup_every` writes.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, clock: Callable[[], float] = time, cleanup_every: int = 1000):
+        self.path = path
+        self.clock = clock
+        self._cleanup_every = cleanup_every
+        self._writes = 0
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode, transactions are opened explicitly
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_limit ('
+                ' namespace TEXT NOT NULL,'
+                ' key TEXT NOT NULL,'
+                ' state TEXT,'
+                ' state_expires REAL NOT NULL DEFAULT 0,'
+                ' violations INTEGER NOT NULL DEFAULT 0,'
+                ' violations_expire REAL NOT NULL DEFAULT 0,'
+                ' PRIMARY KEY (namespace, key)'
+                ') WITHOUT ROWID'
+            )
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _decode(row: Optional[tuple], now: float) -> Tuple[Any, int]:
+        if row is None:
+            return None, 0
+        state, state_expires, violations, violations_expire = row
+        return (
+            json.loads(state) if state is not None and state_expires > now else None,
+            violations if violations_expire > now else 0,
+        )
+
+    def get(self, namespace: str, key: Hashable, now: float) -> Tuple[Any, int]:
+        row = self._connection().execute(
+            'SELECT state, state_expires, violations, violations_expire FROM rate_limit'
+            ' WHERE namespace = ? AND key = ?',
+            (namespace, str(key))
+        ).fetchone()
+        return self._decode(row, now)
+
+    def apply(self, namespace: str, key: Hashable, now: float, step: Step) -> Any:
+        conn = self._connection()
+        key = str(key)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT state, state_expires, violations, violations_expire FROM rate_limit'
+                ' WHERE namespace = ? AND key = ?',
+                (namespace, key)
+            ).fetchone()
+            state, violations = self._decode(row, now)
+            result, new_state, state_expires_at, new_violations, violations_expire_at = step(state, violations)
+
+            if new_state is None:
+                # Keep the stored state, only the violation count changes
+                new_state = state
+                state_expires_at = row[1] if row and state is not None else 0
+            if new_violations == violations:
+                violations_expire_at = row[3] if row and violations else 0
+
+            conn.execute(
+                'INSERT INTO rate_limit (namespace, key, state, state_expires, violations, violations_expire)'
+                ' VALUES (?, ?, ?, ?, ?, ?)'
+                ' ON CONFLICT (namespace, key) DO UPDATE SET'
+                ' state = excluded.state, state_expires = excluded.state_expires,'
+                ' violations = excluded.violations, violations_expire = excluded.violations_expire',
+                (namespace, key, None if new_state is None else json.dumps(new_state),
+                 state_expires_at, new_violations, violations_expire_at)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        self._writes += 1
+        if self._writes >= self._cleanup_every:
+            self._writes = 0
+            self.purge(now)
+        return result
+
+    def purge(self, now: float = None) -> int:
+        now = self.clock() if now is None else now
+        cursor = self._connection().execute(
+            'DELETE FROM rate_limit WHERE state_expires <= ? AND violations_expire <= ?',
+            (now, now)
+        )
+        return cursor.rowcount
+
+    def reset(self, namespace: str, key: Hashable) -> None:
+        self._connection().execute(
+            'DELETE FROM rate_limit WHERE namespace = ? AND key = ?', (namespace, str(key))
+        )
+
+    def metrics(self, namespace: str) -> Dict[str, int]:
+        now = self.clock()
+        tracked, limited = self._connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(violations_expire > ?), 0) FROM rate_limit'
+            ' WHERE namespace = ? AND (state_expires > ? OR violations_expire > ?)',
+            (now, namespace, now, now)
+        ).fetchone()
+        return {'tracked_keys': tracked, 'limited_keys': limited}
+
+
+def create_backend():
+    """Backend selected by Config.RATE_LIMIT_BACKEND ('memory' or 'sqlite')"""
+    if Config.RATE_LIMIT_BACKEND == 'sqlite':
+        return SQLiteBackend(Config.RATE_LIMIT_SQLITE_PATH)
+    if Config.RATE_LIMIT_BACKEND != 'memory':
+        logger.warning(f"Unknown rate limit backend {Config.RATE_LIMIT_BACKEND}, using memory")
+    return MemoryBackend()
@@ -1,155 +1,186 @@
-from datetime import datetime, timedelta
-from typing import Dict, Tuple
+from math import ceil
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
 import logging
 from config import Config
-from collections import defaultdict
+from utils.rate_limit_algorithms import create_algorithm
+from utils.rate_limit_backends import MemoryBackend, create_backend
 
 logger = logging.getLogger(__name__)
 
-class RateLimiter:
-    def __init__(self):
-        # Store attempts as {user_id: {limit_type: [(timestamp, count)]}}
-        self._attempts = defaultdict(lambda: defaultdict(list))
-
-        # Define limits for different actions
-        self._limits = {
-            'message': Config.RATE_LIMIT_MESSAGES,  # messages per minute
-            'command': Config.RATE_LIMIT_COMMANDS,  # commands per minute
-            'auth': 5,  # auth attempts per minute
-            'payment': 3,  # payment attempts per minute
-        }
+# Slack for float rounding when turning waits into whole seconds
+_EPSILON = 1e-6
 
-        # Define windows for different actions (in seconds)
-        self._windows = {
-            'message': 60,
-            'command': 60,
-            'auth': 300,  # 5 minutes for auth
-            'payment': 600,  # 10 minutes for payments
-        }
 
-        # Define backoff factors for different actions
-        self._backoff_factors = {
-            'message': 2,
-            'command': 2,
-            'auth': 4,  # More aggressive backoff for auth attempts
-            'payment': 5,  # Most aggressive backoff for payment attempts
-        }
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    remaining: int  # requests still allowed right now
+    retry_after: int  # seconds to wait before the next attempt, 0 if allowed
 
-        # Store backoff history
-        self._backoff_history = defaultdict(lambda: defaultdict(int))
 
-    def _clean_old_attempts(self, user_id: int, limit_type: str):
-        """Remove attempts older than the window"""
-        if not user_id or limit_type not in self._windows:
-            return
+class RateLimitPolicy(NamedTuple):
+    algorithm: str  # 'exact', 'sliding_window' or 'token_bucket'
+    limit: int  # requests per window
+    window: float  # seconds
+    burst: Optional[int] = None  # token_bucket only, defaults to limit
+    backoff_base: float = 5  # seconds of backoff after the first violation
+    backoff_factor: float = 2  # growth per further violation
+    backoff_max: float = 3600
 
-        now = datetime.utcnow()
-        window = timedelta(seconds=self._windows.get(limit_type, 60))
 
-        self._attempts[user_id][limit_type] = [
-            attempt for attempt in self._attempts[user_id][limit_type]
-            if now - attempt[0] < window
-        ]
+class RateLimiter:
+    """Per-user rate limiting with per-action policies.
+
+    Each limit type has a RateLimitPolicy (Config.RATE_LIMIT_POLICIES) naming
+    its algorithm from utils.rate_limit_algorithms: an exact request log, an
+    O(1) sliding-window counter or a token bucket (GCRA). Refused attempts
+    count as violations and add exponential backoff.
+
+    State lives in a backend: MemoryBackend (per process, monotonic clock)
+    or a shared one such as SQLiteBackend. With a shared backend every check
+    first runs against a local in-memory copy that only records requests the
+    shared store allowed; it can never be more permissive than the shared
+    state, so a user it already refuses is turned away without a round trip.
+
+    A user's state is dropped once it is indistinguishable from a fresh one,
+    and the violation count once the backoff it implies has run out.
+    """
+
+    def __init__(self, clock: Callable[[], float] = None, backend=None, name: str = 'default',
+                 policies: Dict[str, Dict[str, Any]] = None):
+        self.name = name
+        self.backend = backend or MemoryBackend(clock=clock or monotonic)
+        self._clock = clock or self.backend.clock
+        self._local = MemoryBackend(clock=clock or monotonic) if self.backend.shared else None
+        self._local_clock = clock or monotonic
+
+        self._policies: Dict[str, RateLimitPolicy] = {
+            limit_type: RateLimitPolicy(**policy)
+            for limit_type, policy in (policies or Config.RATE_LIMIT_POLICIES).items()
+        }
+        self._algorithms = {
+            limit_type: create_algorithm(policy.algorithm, policy.limit, policy.window, policy.burst)
+            for limit_type, policy in self._policies.items()
+        }
+        self._limits = {limit_type: policy.limit for limit_type, policy in self._policies.items()}
+        self._windows = {limit_type: policy.window for limit_type, policy in self._policies.items()}
+
+        # Backend namespace per limit type, so named limiters can share a
+        # store; the algorithm is part of it as each one has its own state
+        self._namespaces = {
+            limit_type: f"{name}:{limit_type}:{policy.algorithm}"
+            for limit_type, policy in self._policies.items()
+        }
 
-    def _get_attempts_count(self, user_id: int, limit_type: str) -> int:
-        """Get number of attempts within the current window"""
-        if not user_id or limit_type not in self._windows:
+    def _calculate_backoff_time(self, user_id: int, limit_type: str, violations: int = None) -> int:
+        """Calculate exponential backoff time in seconds"""
+        if violations is None:
+            _, violations = self.backend.get(self._namespaces[limit_type], user_id, self._clock())
+        if violations == 0:
             return 0
 
-        self._clean_old_attempts(user_id, limit_type)
-        return sum(attempt[1] for attempt in self._attempts[user_id][limit_type])
+        policy = self._policies[limit_type]
+        # Cap the exponent so repeated violations can't build huge integers
+        wait_time = min(
+            policy.backoff_base * (policy.backoff_factor ** min(violations - 1, 32)),
+            policy.backoff_max
+        )
+        return int(wait_time)
+
+    def _step(self, user_id: int, limit_type: str, now: float, cost: int = 1, record: bool = True):
+        """One attempt against the policy's algorithm, applied atomically by the backend"""
+        algorithm = self._algorithms[limit_type]
 
-    def _calculate_backoff_time(self, user_id: int, limit_type: str) -> int:
-        """Calculate exponential backoff time in seconds"""
-        if not user_id or limit_type not in self._backoff_factors:
-            return 0
+        def step(state, violations):
+            allowed, remaining, wait, new_state, expires_at = algorithm.step(state, now, cost)
 
-        violations = self._backoff_history[user_id][limit_type]
-        if violations == 0:
-            return 0
+            if not allowed:
+                # Increment violation count and calculate backoff; the count
+                # is forgotten once the backoff it implies has passed
+                violations += 1
+                backoff_time = self._calculate_backoff_time(user_id, limit_type, violations)
+                wait_time = max(ceil(wait - _EPSILON), backoff_time)
+                result = RateLimitResult(False, remaining, wait_time)
+                return result, None, 0, violations, now + backoff_time
 
-        base_wait = 5  # Base wait time in seconds
-        factor = self._backoff_factors.get(limit_type, 2)
-        max_wait = 3600  # Maximum wait time (1 hour)
+            result = RateLimitResult(True, remaining, 0)
+            if not record:
+                return result, None, 0, violations, 0
+            return result, new_state, expires_at, violations, 0
 
-        wait_time = min(base_wait * (factor ** (violations - 1)), max_wait)
-        return int(wait_time)
+        return step
 
-    def check_limit(self, user_id: int, limit_type: str = 'message') -> bool:
+    def check(self, user_id: int, limit_type: str = 'message', cost: int = 1,
+              record: bool = True) -> RateLimitResult:
         """
-        Check if user has exceeded rate limit with exponential backoff
-        Returns True if within limits, False if exceeded
+        Count an attempt weighing `cost` requests against the user's limit.
+        Returns whether it is allowed, how many attempts remain and, when
+        refused, how many seconds to wait (including exponential backoff).
+        With record=False an allowed attempt isn't counted, so a caller can
+        consult several limits before charging any of them.
         """
         try:
             # Handle invalid inputs gracefully
             if not user_id:
                 logger.warning("Invalid user_id provided to rate limiter")
-                return True  # Allow request but log warning
+                return RateLimitResult(True, 0, 0)  # Allow request but log warning
 
             if limit_type not in self._limits:
                 logger.warning(f"Unknown limit type: {limit_type}")
                 limit_type = 'message'  # Default to message limit
 
-            now = datetime.utcnow()
-
-            # Clean old attempts first
-            self._clean_old_attempts(user_id, limit_type)
-
-            # Get current count
-            current_count = self._get_attempts_count(user_id, limit_type)
-
-            # Check if limit exceeded
-            limit = self._limits.get(limit_type, self._limits['message'])
-            if current_count >= limit:
-                # Increment violation count and calculate backoff
-                self._backoff_history[user_id][limit_type] += 1
-                wait_time = self._calculate_backoff_time(user_id, limit_type)
-
-                logger.warning(
-                    f"Rate limit exceeded for user {user_id} on {limit_type}. "
-                    f"Violations: {self._backoff_history[user_id][limit_type]}, "
-                    f"Wait time: {wait_time}s"
+            namespace = self._namespaces[limit_type]
+            if self._local is not None:
+                local_now = self._local_clock()
+                result = self._local.apply(
+                    namespace, user_id, local_now, self._step(user_id, limit_type, local_now, cost, record=False)
                 )
-                return False
-
-            # Add new attempt
-            self._attempts[user_id][limit_type].append((now, 1))
-            return True
+                if not result.allowed:
+                    self._log_refusal(user_id, limit_type, result)
+                    return result
+
+            now = self._clock()
+            result = self.backend.apply(namespace, user_id, now, self._step(user_id, limit_type, now, cost, record))
+            if not result.allowed:
+                self._log_refusal(user_id, limit_type, result)
+            elif self._local is not None and record:
+                local_now = self._local_clock()
+                self._local.apply(namespace, user_id, local_now, self._step(user_id, limit_type, local_now, cost))
+            return result
 
         except Exception as e:
             logger.error(f"Error in rate limiter: {str(e)}")
             # In case of error, allow the request
-            return True
+            return RateLimitResult(True, 0, 0)
+
+    @staticmethod
+    def _log_refusal(user_id: int, limit_type: str, result: RateLimitResult) -> None:
+        # Constant template so RepeatFilter can collapse floods of these
+        logger.warning(
+            "Rate limit exceeded for user %s on %s. Wait time: %ss",
+            user_id, limit_type, result.retry_after
+        )
+
+    def check_limit(self, user_id: int, limit_type: str = 'message') -> bool:
+        """
+        Check if user has exceeded rate limit with exponential backoff
+        Returns True if within limits, False if exceeded
+        """
+        return self.check(user_id, limit_type).allowed
 
     def get_remaining_attempts(self, user_id: int, limit_type: str = 'message') -> Tuple[int, int]:
-        """Get remaining attempts and wait time"""
+        """Get remaining attempts and wait time without counting an attempt"""
         try:
             # Handle invalid inputs
             if not user_id or limit_type not in self._limits:
                 return 0, 0
 
-            current_count = self._get_attempts_count(user_id, limit_type)
-            limit = self._limits.get(limit_type, self._limits['message'])
-
-            if not self._attempts[user_id][limit_type]:
-                return limit, 0
-
-            oldest_attempt = min(
-                attempt[0] for attempt in self._attempts[user_id][limit_type]
-            )
-            window = timedelta(seconds=self._windows.get(limit_type, 60))
-
-            # Calculate base window wait time
-            base_wait = max(
-                0,
-                int((oldest_attempt + window - datetime.utcnow()).total_seconds())
-            )
-
-            # Add exponential backoff if applicable
-            backoff_wait = self._calculate_backoff_time(user_id, limit_type)
-            total_wait = max(base_wait, backoff_wait)
-
-            return limit - current_count, total_wait
+            now = self._clock()
+            state, violations = self.backend.get(self._namespaces[limit_type], user_id, now)
+            remaining, wait = self._algorithms[limit_type].peek(state, now)
+            backoff_wait = self._calculate_backoff_time(user_id, limit_type, violations)
+            return remaining, max(ceil(wait - _EPSILON), backoff_wait)
 
         except Exception as e:
             logger.error(f"Error getting rate limit info: {str(e)}")
@@ -158,9 +189,35 @@ class RateLimiter:
     def reset_limits(self, user_id: int):
         """Reset all limits for a user"""
         try:
-            if user_id in self._attempts:
-                del self._attempts[user_id]
-            if user_id in self._backoff_history:
-                del self._backoff_history[user_id]
+            for namespace in self._namespaces.values():
+                self.backend.reset(namespace, user_id)
+                if self._local is not None:
+                    self._local.reset(namespace, user_id)
         except Exception as e:
-            logger.error(f"Error resetting rate limits: {str(e)}")
\ No newline at end of file
+            logger.error(f"Error resetting rate limits: {str(e)}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Tracked-key gauges and eviction counters per limit type"""
+        metrics = {
+            limit_type: self.backend.metrics(namespace)
+            for limit_type, namespace in self._namespaces.items()
+        }
+        metrics['tracked_keys'] = sum(m['tracked_keys'] for m in metrics.values())
+        return metrics
+
+
+_registry: Dict[str, RateLimiter] = {}
+_registry_lock = Lock()
+
+
+def get_rate_limiter(name: str = 'default') -> RateLimiter:
+    """Process-wide limiter with the given name, created on first use.
+
+    Limiters use the backend chosen by Config.RATE_LIMIT_BACKEND; with a
+    shared backend the same name enforces one limit across processes.
+    """
+    with _registry_lock:
+        limiter = _registry.get(name)
+        if limiter is None:
+            limiter = _registry[name] = RateLimiter(backend=create_backend(), name=name)
+        return limiter
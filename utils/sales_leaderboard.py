@@ -0,0 +1,183 @@
+import threading
+from bisect import bisect_left, insort
+from itertools import chain
+from time import monotonic
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from config import Config
+from extensions import db
+from models import Order, Product
+from utils.invalidation_bus import invalidation_bus
+import logging
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_ORDERS = ('sales', 'revenue')
+
+
+class LeaderboardEntry(NamedTuple):
+    id: int
+    name: str
+    sales: int  # completed orders
+    revenue: float  # what those orders were charged
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'id': self.id, 'name': self.name, 'sales': self.sales, 'revenue': self.revenue}
+
+
+class SalesLeaderboard:
+    """Products ranked by completed orders and by revenue, kept in memory.
+
+    Both rankings are sorted lists, so top() is a slice and costs the same
+    whatever the catalog size. OrderService reports completions and refunds
+    through record(), which moves the one product in place. Other processes
+    hear about it through the invalidation bus and re-read just that product
+    on their next top(). Everything is reloaded every
+    Config.LEADERBOARD_TTL seconds and after catalog changes in other
+    processes.
+    """
+
+    def __init__(self, ttl: float = None, clock: Callable[[], float] = monotonic):
+        self._ttl = ttl or Config.LEADERBOARD_TTL
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._entries: Dict[int, LeaderboardEntry] = {}
+        self._by_sales: List[Tuple[int, int]] = []  # (-sales, product id), ascending
+        self._by_revenue: List[Tuple[float, int]] = []  # (-revenue, product id), ascending
+        self._stale = set()  # product ids to re-read before serving
+        self._loaded_at: Optional[float] = None
+        self._loading = 0  # queries in flight whose results may miss a record()
+        self.reloads = 0
+
+    def _place(self, entry: LeaderboardEntry) -> None:
+        if entry.sales > 0:
+            self._entries[entry.id] = entry
+            insort(self._by_sales, (-entry.sales, entry.id))
+            insort(self._by_revenue, (-entry.revenue, entry.id))
+
+    def _discard(self, product_id: int) -> None:
+        entry = self._entries.pop(product_id, None)
+        if entry is not None:
+            del self._by_sales[bisect_left(self._by_sales, (-entry.sales, entry.id))]
+            del self._by_revenue[bisect_left(self._by_revenue, (-entry.revenue, entry.id))]
+
+    def record(self, product_id: int, sales: int, amount: Optional[float]) -> None:
+        """An order for the product, charged `amount`, was completed (1) or
+        refunded (-1) and committed"""
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if self._loading or entry is None or amount is None:
+                # A query in flight may or may not see this order, and an
+                # unknown product has no name yet: re-read it
+                self._stale.add(product_id)
+            else:
+                self._discard(product_id)
+                self._place(entry._replace(sales=entry.sales + sales, revenue=entry.revenue + sales * amount))
+        invalidation_bus.publish('sales', [product_id])
+
+    def invalidate(self, product_ids: Iterable[int] = None) -> None:
+        """Re-read the given products, or everything, on the next top()"""
+        with self._lock:
+            if product_ids is None:
+                self._loaded_at = None
+            else:
+                self._stale.update(product_ids)
+
+    def top(self, limit: int = 5, by: str = 'revenue') -> List[Dict[str, Any]]:
+        if by not in LEADERBOARD_ORDERS:
+            raise ValueError(f"Unknown leaderboard order: {by}")
+        loaded_at = self._loaded_at
+        if loaded_at is None or self._clock() - loaded_at >= self._ttl:
+            self.reload()
+        if self._stale:
+            self._refresh()
+
+        with self._lock:
+            ranking = self._by_sales if by == 'sales' else self._by_revenue
+            return [self._entries[product_id].to_dict() for _, product_id in ranking[:limit]]
+
+    def reload(self) -> None:
+        # Single-flight: whoever waited on the lock finds it freshly loaded
+        with self._reload_lock:
+            loaded_at = self._loaded_at
+            if loaded_at is not None and self._clock() - loaded_at < self._ttl:
+                return
+            with self._lock:
+                self._loading += 1
+                stale = set(self._stale)
+            try:
+                entries = self._query()
+            finally:
+                with self._lock:
+                    self._loading -= 1
+            with self._lock:
+                self._entries = {}
+                self._by_sales = []
+                self._by_revenue = []
+                for entry in entries:
+                    self._place(entry)
+                self._stale -= stale
+                self._loaded_at = self._clock()
+                self.reloads += 1
+
+    def _refresh(self) -> None:
+        with self._lock:
+            product_ids, self._stale = self._stale, set()
+            self._loading += 1
+        try:
+            entries = {entry.id: entry for entry in self._query(product_ids)}
+        except Exception:
+            with self._lock:
+                self._stale |= product_ids
+            raise
+        finally:
+            with self._lock:
+                self._loading -= 1
+        with self._lock:
+            for product_id in product_ids:
+                self._discard(product_id)
+                if product_id in entries:
+                    self._place(entries[product_id])
+
+    def stats(self) -> Dict[str, int]:
+        return {'products': len(self._entries), 'stale': len(self._stale), 'reloads': self.reloads}
+
+    @staticmethod
+    def _query(product_ids: Iterable[int] = None) -> List[LeaderboardEntry]:
+        """Products with completed orders, counted through ix_order_product_status"""
+        query = db.session.query(
+            Product.id, Product.name, func.count(Order.id), func.coalesce(func.sum(Order.amount), 0)
+        ).join(Order, Order.product_id == Product.id).filter(Order.status == 'completed')
+        if product_ids is not None:
+            query = query.filter(Product.id.in_(list(product_ids)))
+        rows = query.group_by(Product.id, Product.name).all()
+        return [LeaderboardEntry(product_id, name, sales, float(revenue)) for product_id, name, sales, revenue in rows]
+
+
+sales_leaderboard = SalesLeaderboard()
+invalidation_bus.subscribe('sales', sales_leaderboard.invalidate)
+# Renamed products, announced without keys
+invalidation_bus.subscribe('catalog', lambda keys: sales_leaderboard.invalidate())
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_leaderboard_changes(session, flush_context):
+    changed = session.info.setdefault('leaderboard_changes', set())
+    changed.update(
+        obj.id for obj in chain(session.dirty, session.deleted)
+        if isinstance(obj, Product) and obj.id is not None
+    )
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_leaderboard_changes(session):
+    changed = session.info.pop('leaderboard_changes', None)
+    if changed:
+        sales_leaderboard.invalidate(changed)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_leaderboard_changes(session):
+    session.info.pop('leaderboard_changes', None)
@@ -1,30 +1,220 @@
+from collections import OrderedDict
 from functools import wraps
-from typing import Callable, Any
+from hashlib import sha256
+from threading import Lock
+from typing import Callable, Any, Dict, Iterable, Optional, Tuple
+from uuid import uuid4
+import time
 import jwt
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.exc import SQLAlchemyError
 from config import Config
+from extensions import db
+from models import RevokedToken
 import logging
-from models import User
+from utils.expiring_store import ExpiringStore
+from utils.invalidation_bus import invalidation_bus
+from utils.permission_cache import permission_cache
 
 logger = logging.getLogger(__name__)
 
+class RevocationStore:
+    """Revoked JWT ids in the revoked_token table, shared by every process"""
+
+    def add(self, jti: str, exp: float) -> None:
+        from app import app
+
+        with app.app_context():
+            try:
+                db.session.merge(RevokedToken(jti=jti, expires_at=datetime.utcfromtimestamp(exp)))
+                # Expired tokens are rejected by their signature check anyway
+                RevokedToken.query.filter(RevokedToken.expires_at < datetime.utcnow()).delete()
+                db.session.commit()
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                logger.error(f"Database error when revoking token: {str(e)}")
+                raise
+
+    def load(self) -> Iterable[Tuple[str, float]]:
+        """(jti, exp) of every revoked token that hasn't expired yet"""
+        from app import app
+
+        with app.app_context():
+            rows = db.session.query(RevokedToken.jti, RevokedToken.expires_at).filter(
+                RevokedToken.expires_at > datetime.utcnow()
+            ).all()
+        return [(jti, expires_at.replace(tzinfo=timezone.utc).timestamp()) for jti, expires_at in rows]
+
+
+class VerifiedTokenCache:
+    """LRU cache of verified JWT payloads.
+
+    Entries are keyed by the SHA-256 digest of the token (raw tokens are
+    never held) and are only served until the token's `exp`, while its `jti`
+    is not revoked and the key id that signed it is still configured.
+    Revoked ids are remembered until the token would have expired anyway.
+
+    With a store, revocations are persisted there and re-read on first use,
+    every Config.JWT_REVOCATION_RELOAD_INTERVAL seconds and whenever the
+    invalidation bus may have missed messages; the bus only makes them
+    reach other processes sooner.
+    """
+
+    def __init__(self, max_size: int = None, clock: Callable[[], float] = time.time,
+                 store: RevocationStore = None, reload_interval: float = None):
+        self.max_size = max_size or Config.JWT_CACHE_SIZE
+        self._clock = clock
+        self._lock = Lock()
+        self._store = store
+        self._reload_interval = reload_interval or Config.JWT_REVOCATION_RELOAD_INTERVAL
+        self._reload_lock = Lock()
+        self._revocations_loaded_at: Optional[float] = None
+        # digest -> (payload, exp, kid)
+        self._entries: 'OrderedDict[bytes, Tuple[dict, float, Optional[str]]]' = OrderedDict()
+        self._revoked = ExpiringStore(Config.JWT_REVOCATION_MAX_KEYS, clock, resolution=60)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        """Cached payload, or None if the token has to be verified"""
+        digest = self._digest(token)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                payload, exp, kid = entry
+                if exp > now and (kid is None or kid in Config.JWT_SECRET_KEYS):
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    # Callers may modify the payload, the cached one stays intact
+                    return dict(payload)
+                del self._entries[digest]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, payload: dict, kid: Optional[str]) -> None:
+        exp = payload.get('exp')
+        if exp is None:
+            return  # tokens without expiry are never cached
+        with self._lock:
+            # A copy: the caller goes on using its payload
+            self._entries[self._digest(token)] = (dict(payload), float(exp), kid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def revoke(self, jti: str, exp: float, persist: bool = False) -> None:
+        """Reject the id from now on; persist=True also records it in the store"""
+        if persist and self._store is not None:
+            self._store.add(jti, exp)
+        with self._lock:
+            self._revoked.set(jti, True, exp)
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti:
+            return False
+        self._sync_revocations()
+        with self._lock:
+            return self._revoked.get(jti) is not None
+
+    def resync(self) -> None:
+        """Re-read the store before the next check, e.g. after missed bus messages"""
+        self._revocations_loaded_at = None
+
+    def _sync_revocations(self) -> None:
+        if self._store is None:
+            return
+        loaded_at = self._revocations_loaded_at
+        if loaded_at is not None and self._clock() - loaded_at < self._reload_interval:
+            return
+        with self._reload_lock:
+            # Someone may have loaded them while we waited
+            loaded_at = self._revocations_loaded_at
+            if loaded_at is not None and self._clock() - loaded_at < self._reload_interval:
+                return
+            started = self._clock()
+            # Errors propagate: without the list no token can be trusted
+            revocations = self._store.load()
+            with self._lock:
+                for jti, exp in revocations:
+                    self._revoked.set(jti, True, exp)
+            self._revocations_loaded_at = started
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'revoked': len(self._revoked),
+            }
+
+
+token_cache = VerifiedTokenCache(store=RevocationStore())
+
+def _apply_remote_revocations(keys: Optional[list]) -> None:
+    if keys is None:
+        token_cache.resync()
+        return
+    for jti, exp in keys:
+        token_cache.revoke(jti, exp)
+
+invalidation_bus.subscribe('jwt_revocation', _apply_remote_revocations)
+# The listener (re)connected; anything sent before that was missed
+invalidation_bus.on_resync(lambda: token_cache.resync())
+
 def generate_jwt_token(user_id: int) -> str:
     """Generate JWT token for user authentication"""
     try:
         payload = {
             'user_id': user_id,
             'exp': datetime.utcnow() + timedelta(hours=24),
-            'iat': datetime.utcnow()
+            'iat': datetime.utcnow(),
+            'jti': uuid4().hex
         }
-        return jwt.encode(payload, Config.JWT_SECRET_KEY, algorithm='HS256')
+        # Signed with the active key; `kid` tells verifiers which one
+        kid = Config.JWT_ACTIVE_KEY_ID
+        return jwt.encode(payload, Config.JWT_SECRET_KEYS[kid], algorithm='HS256', headers={'kid': kid})
     except Exception as e:
         logger.error(f"Error generating JWT token: {str(e)}")
         raise
 
+def _decode_jwt_token(token: str) -> Tuple[dict, Optional[str]]:
+    """Verify the signature with the key named by `kid`, or any configured key for tokens without one"""
+    kid = jwt.get_unverified_header(token).get('kid')
+    if kid is not None:
+        if kid not in Config.JWT_SECRET_KEYS:
+            raise jwt.InvalidTokenError(f"Unknown signing key: {kid}")
+        return jwt.decode(token, Config.JWT_SECRET_KEYS[kid], algorithms=['HS256']), kid
+
+    error: Exception = jwt.InvalidSignatureError("No signing key configured")
+    for secret in Config.JWT_SECRET_KEYS.values():
+        try:
+            return jwt.decode(token, secret, algorithms=['HS256']), None
+        except jwt.InvalidSignatureError as e:
+            error = e
+    raise error
+
 def verify_jwt_token(token: str) -> dict:
     """Verify JWT token and return payload"""
     try:
-        return jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=['HS256'])
+        payload = token_cache.get(token)
+        if payload is None:
+            payload, kid = _decode_jwt_token(token)
+            token_cache.put(token, payload, kid)
+        if token_cache.is_revoked(payload.get('jti')):
+            raise jwt.InvalidTokenError("Token has been revoked")
+        return payload
     except jwt.ExpiredSignatureError:
         logger.warning("Expired JWT token")
         raise
@@ -32,6 +222,15 @@ def verify_jwt_token(token: str) -> dict:
         logger.error(f"Invalid JWT token: {str(e)}")
         raise
 
+def revoke_jwt_token(token: str) -> None:
+    """Reject the token from now on, even though its signature is valid"""
+    payload = verify_jwt_token(token)
+    if not payload.get('jti'):
+        raise jwt.InvalidTokenError("Token has no jti and cannot be revoked")
+    token_cache.revoke(payload['jti'], float(payload['exp']), persist=True)
+    invalidation_bus.publish('jwt_revocation', [[payload['jti'], float(payload['exp'])]])
+    logger.info(f"Revoked JWT token {payload['jti']} of user {payload.get('user_id')}")
+
 def check_user_access(required_roles: list = None) -> Callable:
     """Decorator to check user access and roles"""
     def decorator(func: Callable) -> Callable:
@@ -39,21 +238,19 @@ def check_user_access(required_roles: list = None) -> Callable:
         async def wrapper(*args, **kwargs):
             try:
                 update = args[1]  # Get telegram update object
-                user = User.query.filter_by(telegram_id=update.effective_user.id).first()
+                permissions = permission_cache.get(update.effective_user.id)
                 
-                if not user:
+                if not permissions:
                     await update.message.reply_text("Unauthorized access.")
                     return
                 
-                if not user.active:
+                if not permissions.active:
                     await update.message.reply_text("Your account is deactivated.")
                     return
                 
-                if required_roles:
-                    user_roles = [role.name for role in user.roles]
-                    if not any(role in user_roles for role in required_roles):
-                        await update.message.reply_text("Insufficient permissions.")
-                        return
+                if required_roles and not permissions.has_any_role(required_roles):
+                    await update.message.reply_text("Insufficient permissions.")
+                    return
                 
                 return await func(*args, **kwargs)
             except Exception as e:
@@ -84,12 +281,11 @@ def check_brute_force(func: Callable) -> Callable:
         try:
             update = args[1]
             user_id = update.effective_user.id
-            
-            # Implementation would track failed attempts and implement exponential backoff
-            # This is a simplified version
-            from utils.rate_limiter import RateLimiter
-            rate_limiter = RateLimiter()
-            
+
+            # Shared limiter, so attempts are counted across calls
+            from utils.rate_limiter import get_rate_limiter
+            rate_limiter = get_rate_limiter('bot')
+
             if not rate_limiter.check_limit(user_id, limit_type='auth'):
                 await update.message.reply_text(
                     "Too many authentication attempts. Please try again later."
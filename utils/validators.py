@@ -1,5 +1,16 @@
 import re
-from typing import Tuple, Any
+from math import isfinite
+from functools import wraps
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+# HTML tags, then quote, SQL and shell metacharacters, removed in one pass
+_SANITIZE_PATTERN = re.compile(r'<[^>]+>|[\'";\-\\&|`]')
+# Any character the pattern above can start at; a plain character class is
+# scanned much faster, so clean text skips the substitution entirely
+_SANITIZE_TRIGGER = re.compile(r'[<\'";\-\\&|`]')
+_EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+_PHONE_PATTERN = re.compile(r'^\+?1?\d{9,15}$')
+_USERNAME_PATTERN = re.compile(r'^[a-zA-Z0-9_]+$')
 
 class InputValidator:
     @staticmethod
@@ -16,8 +27,7 @@ class InputValidator:
     @staticmethod
     def validate_email(email: str) -> Tuple[bool, str]:
         """Validates email format"""
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if not re.match(pattern, email):
+        if not _EMAIL_PATTERN.match(email):
             return False, "Invalid email format"
         return True, ""
 
@@ -37,8 +47,7 @@ class InputValidator:
     @staticmethod
     def validate_phone(phone: str) -> Tuple[bool, str]:
         """Validates phone number format"""
-        pattern = r'^\+?1?\d{9,15}$'
-        if not re.match(pattern, phone):
+        if not _PHONE_PATTERN.match(phone):
             return False, "Invalid phone number format"
         return True, ""
 
@@ -51,38 +60,213 @@ class InputValidator:
             return False, "Username must be at least 3 characters long"
         if len(username) > 32:
             return False, "Username cannot exceed 32 characters"
-        if not re.match(r'^[a-zA-Z0-9_]+$', username):
+        if not _USERNAME_PATTERN.match(username):
             return False, "Username can only contain letters, numbers, and underscores"
         return True, ""
 
     @staticmethod
-    def sanitize_input(text: str) -> str:
+    def sanitize_input(text: str, max_length: int = 1000) -> str:
         """Sanitizes input text"""
-        # Remove any HTML tags
-        text = re.sub(r'<[^>]+>', '', text)
-        # Remove any SQL injection attempts
-        text = re.sub(r'[\'";\-\\]', '', text)
-        # Remove any potential command injection characters
-        text = re.sub(r'[&|;`]', '', text)
-        # Limit to reasonable length
-        return text[:1000]
+        # Strip HTML tags and injection characters, then limit to reasonable length
+        return _sanitize(text)[:max_length]
+
+def _sanitize(text: str) -> str:
+    return _SANITIZE_PATTERN.sub('', text) if _SANITIZE_TRIGGER.search(text) else text
+
+
+class ValidationError(NamedTuple):
+    field: str
+    code: str  # machine-readable reason: 'required', 'type', 'min_length', ...
+    message: str
+
+
+def _to_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('true', '1', 'on', 'yes')
+
+
+def _to_float(value: Any) -> float:
+    number = float(value)
+    if not isfinite(number):
+        raise ValueError(f"Not a finite number: {value}")
+    return number
+
+
+_CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    'str': str,
+    'int': int,
+    'float': _to_float,
+    'bool': _to_bool,
+}
+
+
+class Field:
+    """Declarative rules for one input field.
+
+    Everything that can be prepared up front (converter, compiled pattern)
+    is, so validating a value is a handful of comparisons.
+    """
+
+    def __init__(self, kind: str = 'str', required: bool = True, default: Any = None,
+                 min_length: int = None, max_length: int = None,
+                 min_value: float = None, max_value: float = None,
+                 pattern: str = None, choices: Tuple = None,
+                 sanitize: bool = False, many: bool = False):
+        if kind not in _CONVERTERS:
+            raise ValueError(f"Unknown field kind: {kind}")
+        self.kind = kind
+        self.convert = _CONVERTERS[kind]
+        # A missing boolean form field is an unchecked checkbox
+        self.required = required and kind != 'bool'
+        self.default = False if kind == 'bool' and default is None else default
+        self.min_length = min_length
+        self.max_length = max_length
+        self.min_value = min_value
+        self.max_value = max_value
+        self.pattern = re.compile(pattern) if pattern else None
+        self.choices = frozenset(choices) if choices else None
+        self.sanitize = sanitize
+        self.many = many
+
+    def clean(self, name: str, raw: Any) -> Tuple[Any, Optional[ValidationError]]:
+        if isinstance(raw, str):
+            raw = raw.strip()
+        if raw is None or raw == '':
+            if self.required:
+                return None, ValidationError(name, 'required', "Обязательное поле")
+            return self.default, None
+
+        try:
+            value = self.convert(raw)
+        except (ValueError, TypeError):
+            return None, ValidationError(name, 'type', f"Неверный формат значения ({self.kind})")
+
+        if self.kind == 'str':
+            if self.sanitize:
+                value = _sanitize(value)
+            if self.min_length is not None and len(value) < self.min_length:
+                return None, ValidationError(name, 'min_length', f"Минимальная длина: {self.min_length}")
+            if self.max_length is not None and len(value) > self.max_length:
+                return None, ValidationError(name, 'max_length', f"Максимальная длина: {self.max_length}")
+            if self.pattern is not None and not self.pattern.match(value):
+                return None, ValidationError(name, 'pattern', "Недопустимое значение")
+        elif self.kind in ('int', 'float'):
+            if self.min_value is not None and value < self.min_value:
+                return None, ValidationError(name, 'min_value', f"Значение должно быть не меньше {self.min_value}")
+            if self.max_value is not None and value > self.max_value:
+                return None, ValidationError(name, 'max_value', f"Значение должно быть не больше {self.max_value}")
+
+        if self.choices is not None and value not in self.choices:
+            return None, ValidationError(name, 'choice', "Недопустимое значение")
+        return value, None
+
+
+class Schema:
+    """A set of named fields validated together.
+
+    validate() accepts a plain dict or a werkzeug MultiDict (fields with
+    many=True read every value via getlist) and returns the cleaned data
+    plus a list of ValidationError, empty when everything is valid.
+    """
+
+    def __init__(self, fields: Dict[str, Field]):
+        self.fields = list(fields.items())
+
+    def validate(self, data: Any) -> Tuple[Dict[str, Any], List[ValidationError]]:
+        cleaned: Dict[str, Any] = {}
+        errors: List[ValidationError] = []
+        getlist = getattr(data, 'getlist', None)
+
+        for name, field in self.fields:
+            if field.many:
+                raw_values = getlist(name) if getlist else (data.get(name) or [])
+                if not raw_values and field.required:
+                    errors.append(ValidationError(name, 'required', "Обязательное поле"))
+                    continue
+                values = []
+                for index, raw in enumerate(raw_values):
+                    value, error = field.clean(f"{name.rstrip('[]')}[{index}]", raw)
+                    if error:
+                        errors.append(error)
+                    else:
+                        values.append(value)
+                cleaned[name] = values
+                continue
+
+            value, error = field.clean(name, data.get(name))
+            if error:
+                errors.append(error)
+            else:
+                cleaned[name] = value
+        return cleaned, errors
+
+
+def format_errors(errors: List[ValidationError]) -> str:
+    """Human-readable summary of validation errors"""
+    return '; '.join(f"{error.field}: {error.message}" for error in errors)
+
+
+# Admin forms
+PRODUCT_FORM = Schema({
+    'name': Field(min_length=1, max_length=100),
+    'price': Field('float', min_value=0.01, max_value=999999.99),
+    'description': Field(required=False, max_length=5000),
+    'active': Field('bool'),
+})
+CATEGORY_FORM = Schema({
+    'name': Field(min_length=1, max_length=100),
+    'description': Field(required=False, max_length=2000),
+})
+TICKET_RESPONSE_FORM = Schema({
+    'message': Field(min_length=1, max_length=4000),
+})
+PRODUCT_IDS_FORM = Schema({
+    'ids[]': Field('int', min_value=1, many=True),
+    'active': Field('bool'),
+})
+# One row of a bulk product import; the category is given by name
+PRODUCT_IMPORT_ROW = Schema({
+    'name': Field(min_length=1, max_length=100),
+    'category': Field(min_length=1, max_length=100),
+    'price': Field('float', min_value=0.01, max_value=999999.99),
+    'description': Field(required=False, max_length=5000),
+    'digital_content': Field(min_length=1),
+    'active': Field('bool', default=True),
+})
+ORDER_FILTERS = Schema({
+    'status': Field(required=False, choices=('pending', 'completed', 'failed', 'refunded', 'cancelled')),
+    'user_id': Field('int', required=False, min_value=1),
+})
+
+# Bot input
+BOT_MESSAGE = Schema({
+    'text': Field(min_length=1, max_length=1000, sanitize=True),
+})
+SUPPORT_MESSAGE = Schema({
+    'text': Field(min_length=10, max_length=4000, sanitize=True),
+})
+
 
 def validate_input(func):
-    """Decorator for validating input in bot handlers"""
+    """Decorator for validating input in bot handlers.
+
+    The sanitized text is stored on the context as `clean_text`; Telegram
+    objects are immutable, so the update itself is left as received.
+    """
+    @wraps(func)
     async def wrapper(*args, **kwargs):
         # Get the first argument after self/cls (usually the update object)
-        if len(args) > 1:
-            update = args[1]
+        if len(args) > 2:
+            update, context = args[1], args[2]
             if hasattr(update, 'message') and update.message:
                 text = update.message.text
                 if text:
                     # Validate and sanitize input
-                    validator = InputValidator()
-                    is_valid, error_message = validator.validate_text(text)
-                    if not is_valid:
-                        await update.message.reply_text(error_message)
+                    cleaned, errors = BOT_MESSAGE.validate({'text': text})
+                    if errors:
+                        await update.message.reply_text(f"❌ {errors[0].message}")
                         return
-                    # Replace the original text with sanitized version
-                    update.message.text = validator.sanitize_input(text)
+                    context.clean_text = cleaned['text']
         return await func(*args, **kwargs)
-    return wrapper
\ No newline at end of file
+    return wrapper